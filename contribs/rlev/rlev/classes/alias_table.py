@@ -0,0 +1,94 @@
+import numpy as np
+
+
+class AliasTable:
+    """
+    Walker alias table over a discrete distribution. Building the table takes
+    O(n) time once, after which every draw costs one uniform integer, one
+    uniform float and one comparison, whatever the number of outcomes.
+    """
+
+    def __init__(self, weights):
+        """
+        Builds the table with Vose's method. Instead of pairing one small and
+        one large column at a time, every round lets each large column absorb
+        a run of small columns by matching cumulative deficits against
+        cumulative excesses, so the table is built in a handful of vectorized
+        rounds even for heavily skewed weights.
+
+        Args:
+            weights (array_like): Non-negative weight of every outcome, they
+                need not sum to one.
+        """
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.ndim != 1 or len(weights) == 0:
+            raise ValueError("Weights must be a non-empty 1-D array")
+        if not np.all(np.isfinite(weights)) or np.any(weights < 0):
+            raise ValueError("Weights must be finite and non-negative")
+        total = weights.sum()
+        if total <= 0:
+            raise ValueError("Weights must not all be zero")
+
+        n = len(weights)
+        prob = weights * (n / total)
+        alias = np.arange(n, dtype=np.int64)
+
+        small = np.flatnonzero(prob < 1.0)
+        large = np.flatnonzero(prob >= 1.0)
+        while len(small) and len(large):
+            deficit = 1.0 - prob[small]
+            excess_end = np.cumsum(prob[large] - 1.0)
+            deficit_start = np.cumsum(deficit) - deficit
+
+            # A small column is covered by the large column whose excess is
+            # still left where its deficit starts. The last column a large
+            # one covers may push it below one, it then turns small itself.
+            owner = np.searchsorted(excess_end, deficit_start, side="right")
+            covered = owner < len(large)
+            if not covered.any():
+                break
+
+            alias[small[covered]] = large[owner[covered]]
+            np.subtract.at(prob, large[owner[covered]], deficit[covered])
+
+            drained = prob[large] < 1.0
+            small = np.concatenate([small[~covered], large[drained]])
+            large = large[~drained]
+
+        # Columns left over only differ from one by rounding errors
+        prob[small] = 1.0
+        prob[large] = 1.0
+
+        self.prob = prob
+        self.alias = alias
+
+    def __len__(self):
+        return len(self.prob)
+
+    @property
+    def probabilities(self) -> np.ndarray:
+        """
+        Recovers the normalized distribution the table samples from.
+
+        Returns:
+            np.ndarray: Probability of every outcome.
+        """
+        n = len(self.prob)
+        probabilities = self.prob.copy()
+        np.add.at(probabilities, self.alias, 1.0 - self.prob)
+        return probabilities / n
+
+    def sample(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        """
+        Draws outcomes from the table.
+
+        Args:
+            rng (np.random.Generator): Random generator to draw from.
+            size (int): Number of draws.
+
+        Returns:
+            np.ndarray: Drawn outcome indices.
+        """
+        columns = rng.integers(0, len(self.prob), size)
+        keep = rng.random(size) < self.prob[columns]
+        return np.where(keep, columns, self.alias[columns])
@@ -0,0 +1,345 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from scipy.interpolate import RegularGridInterpolator
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from rlev.classes.chargers import Charger, DynamicCharger
+from rlev.scripts.link_snapping import nearest_links
+from rlev.scripts.network_parser import NetworkArrays, parse_link_attribute
+from rlev.scripts.population_parser import PlanArrays, parse_plans, parse_vehicles
+
+
+SECONDS_PER_DAY = 86400.0
+ROUTING_CHUNK_SIZE = 64
+
+
+def read_consumption_map(consumption_map_path: Path) -> RegularGridInterpolator:
+    """
+    Reads an LTH consumption map like MidCarMap.csv, whose first row holds
+    speeds in m/s, whose first column holds slopes in percent and whose
+    values are the consumption in kWh per km. Missing values take the last
+    value given at a lower speed, like the simulator reads them.
+
+    Args:
+        consumption_map_path (Path): Path to the CSV file.
+
+    Returns:
+        RegularGridInterpolator: Consumption in kWh per km as a function of
+            slope, as a fraction, and speed in m/s. Points outside the map
+            are clamped to its edges by the caller.
+    """
+    table = pd.read_csv(consumption_map_path, header=None).to_numpy(np.float64)
+    speeds = table[0, 1:]
+    slopes = table[1:, 0] / 100
+    consumption = pd.DataFrame(table[1:, 1:]).ffill(axis=1).to_numpy()
+    return RegularGridInterpolator((slopes, speeds), consumption)
+
+
+def shortest_paths(
+    network: NetworkArrays,
+    link_cost: np.ndarray,
+    origins: np.ndarray,
+    destinations: np.ndarray,
+) -> list[np.ndarray]:
+    """
+    Routes from the end of every origin link to the end of the matching
+    destination link along the cheapest links, like MATSim routes a leg
+    between the links of two activities. The departure link is not part of
+    the route, the arrival link is.
+
+    Args:
+        network (NetworkArrays): The parsed network.
+        link_cost (np.ndarray): Positive cost of traversing every link, such
+            as its free speed travel time.
+        origins (np.ndarray): Index of the origin link of every route.
+        destinations (np.ndarray): Index of the destination link of every
+            route.
+
+    Returns:
+        list[np.ndarray]: Link indices of every route in driving order, None
+            for destinations that cannot be reached.
+    """
+    # Keep the cheapest of parallel links, which a sparse matrix would sum
+    order = np.lexsort((link_cost, network.to_idx, network.from_idx))
+    pairs = np.stack([network.from_idx[order], network.to_idx[order]])
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = np.any(pairs[:, 1:] != pairs[:, :-1], axis=0)
+    links = order[first]
+    graph = csr_matrix(
+        (link_cost[links], (network.from_idx[links], network.to_idx[links])),
+        shape=(network.num_nodes, network.num_nodes),
+    )
+    link_of_pair = dict(
+        zip(
+            zip(network.from_idx[links].tolist(), network.to_idx[links].tolist()),
+            links.tolist(),
+        )
+    )
+
+    sources = network.to_idx[origins]
+    targets = network.from_idx[destinations]
+    unique_sources, source_rows = np.unique(sources, return_inverse=True)
+    paths = [None] * len(origins)
+    for chunk_start in range(0, len(unique_sources), ROUTING_CHUNK_SIZE):
+        chunk = unique_sources[chunk_start : chunk_start + ROUTING_CHUNK_SIZE]
+        _, predecessors = dijkstra(graph, indices=chunk, return_predecessors=True)
+        for route in np.flatnonzero(
+            (source_rows >= chunk_start) & (source_rows < chunk_start + len(chunk))
+        ):
+            if origins[route] == destinations[route]:
+                paths[route] = np.zeros(0, dtype=np.int64)
+                continue
+            row = predecessors[source_rows[route] - chunk_start]
+            node = targets[route]
+            path = [destinations[route]]
+            while node != sources[route]:
+                previous = row[node]
+                if previous < 0:
+                    path = None
+                    break
+                path.append(link_of_pair[previous, node])
+                node = previous
+            if path is not None:
+                paths[route] = np.array(path[::-1], dtype=np.int64)
+    return paths
+
+
+class AnalyticRewardModel:
+    """
+    Estimates the rewards of a charger placement in milliseconds instead of
+    simulating it. Every leg of the plans is routed once along the free
+    speed shortest path, and the energy it consumes is read from the
+    consumption map by the speed and slope of every link. A placement then
+    only changes the energy recharged, by dynamic chargers on the links a
+    vehicle drives over and by static chargers on the links of the
+    activities it parks at. The state of charge of every vehicle is followed
+    through its day, and like on the reward server the charge reward is the
+    average state of charge over the day and the time reward the average leg
+    duration as a fraction of a day. Congestion and charger queues are not
+    modeled, so the time reward does not depend on the placement.
+    """
+
+    def __init__(
+        self,
+        network: NetworkArrays,
+        slopes: np.ndarray,
+        plans: PlanArrays,
+        vehicles: dict[str, tuple[float, float]],
+        consumption_map_path: Path,
+        charger_list: list[Charger],
+        day_length: float = SECONDS_PER_DAY,
+    ):
+        """
+        Initializes the AnalyticRewardModel.
+
+        Args:
+            network (NetworkArrays): The network, with links in action space
+                order.
+            slopes (np.ndarray): Slope of every link as a fraction.
+            plans (PlanArrays): Selected plans of the population.
+            vehicles (dict[str, tuple[float, float]]): Battery capacity and
+                initial state of charge of every vehicle, which are matched
+                to persons by ID. Persons without a vehicle get the average.
+            consumption_map_path (Path): Path to the consumption map.
+            charger_list (list[Charger]): Charger types indexed like the
+                actions.
+            day_length (float): Seconds the state of charge is averaged over.
+                Default is one day.
+        """
+        self.num_links = network.num_links
+        self.day_length = day_length
+        self.dynamic_power = np.array(
+            [
+                charger.plug_power if charger.type == DynamicCharger.type else 0.0
+                for charger in charger_list
+            ]
+        )
+        self.static_power = np.array(
+            [
+                0.0 if charger.type == DynamicCharger.type else charger.plug_power
+                for charger in charger_list
+            ]
+        )
+
+        freespeed = np.maximum(network.freespeed, 1e-3)
+        link_time = np.maximum(network.length / freespeed, 1e-3)
+        consumption = read_consumption_map(consumption_map_path)
+        slope_grid, speed_grid = consumption.grid
+        link_energy = consumption(
+            np.stack(
+                [
+                    np.clip(slopes, slope_grid[0], slope_grid[-1]),
+                    np.clip(freespeed, speed_grid[0], speed_grid[-1]),
+                ],
+                axis=1,
+            )
+        ) * (network.length / 1000)
+
+        act_link = self._activity_links(network, plans)
+        origins = plans.leg_origins()
+        pairs, pair_of_leg = np.unique(
+            np.stack([act_link[origins], act_link[origins + 1]], axis=1),
+            axis=0,
+            return_inverse=True,
+        )
+        paths = shortest_paths(network, link_time, pairs[:, 0], pairs[:, 1])
+        routed = np.array([path is not None for path in paths])
+        paths = [path if path is not None else np.zeros(0, np.int64) for path in paths]
+        pair_links = csr_matrix(
+            (
+                np.ones(sum(len(path) for path in paths)),
+                np.concatenate(paths),
+                np.cumsum([0] + [len(path) for path in paths]),
+            ),
+            shape=(len(paths), self.num_links),
+        )
+        pair_of_leg = pair_of_leg.reshape(-1)
+        #: Number of times every leg traverses every link
+        self.leg_links = pair_links[pair_of_leg]
+        self.link_time_hours = link_time / 3600
+        # A trailing zero is selected by the index -1 of missing legs
+        self.leg_energy = np.append(self.leg_links @ link_energy, 0.0)
+        leg_time = self.leg_links @ link_time
+        self.num_unrouted_legs = int(np.count_nonzero(~routed[pair_of_leg]))
+        leg_routed = routed[pair_of_leg]
+        self.mean_leg_time = (
+            float(leg_time[leg_routed].mean()) if leg_routed.any() else 0.0
+        )
+
+        self._schedule(plans, act_link, origins, np.append(leg_time, 0.0))
+        capacity = np.full(plans.num_persons, np.nan)
+        initial_soc = np.full(plans.num_persons, np.nan)
+        for person, person_id in enumerate(plans.person_ids.tolist()):
+            capacity[person], initial_soc[person] = vehicles.get(
+                person_id, (np.nan, np.nan)
+            )
+        if np.all(np.isnan(capacity)):
+            raise ValueError("No person of the plans has an electric vehicle")
+        self.capacity = np.where(np.isnan(capacity), np.nanmean(capacity), capacity)
+        self.initial_energy = self.capacity * np.where(
+            np.isnan(initial_soc), np.nanmean(initial_soc), initial_soc
+        )
+
+    @classmethod
+    def from_dataset(cls, dataset) -> "AnalyticRewardModel":
+        """
+        Builds the model of the scenario of a dataset.
+
+        Args:
+            dataset (MatsimXMLDataset): Dataset of the scenario.
+
+        Returns:
+            AnalyticRewardModel: The model.
+        """
+        return cls(
+            dataset.network_arrays(),
+            parse_link_attribute(dataset.network_xml_path, "slopes"),
+            parse_plans(dataset.plan_xml_path),
+            parse_vehicles(dataset.vehicle_xml_path),
+            dataset.consumption_map_path,
+            dataset.charger_list,
+        )
+
+    @staticmethod
+    def _activity_links(network: NetworkArrays, plans: PlanArrays) -> np.ndarray:
+        """
+        Finds the link of every activity, snapping the activities given by
+        coordinates to the nearest link.
+        """
+        act_link = np.zeros(plans.num_activities, dtype=np.int64)
+        has_link = plans.act_link != ""
+        if has_link.any():
+            link_index = {id: i for i, id in enumerate(network.link_ids.tolist())}
+            act_link[has_link] = [
+                link_index[id] for id in plans.act_link[has_link].tolist()
+            ]
+        if not has_link.all():
+            act_link[~has_link] = nearest_links(
+                network, plans.act_x[~has_link], plans.act_y[~has_link]
+            )
+        return act_link
+
+    def _schedule(self, plans, act_link, origins, leg_time):
+        """
+        Lays out the day of every person as alternating activities and legs.
+        Routes do not depend on the chargers, so the times are fixed and
+        only the energy changes between placements. Column j of the
+        schedule holds the j-th activity of every person and the leg after
+        it, index -1 where a person has fewer.
+        """
+        num_persons = plans.num_persons
+        first_act = np.searchsorted(plans.act_person, np.arange(num_persons))
+        position = np.arange(plans.num_activities) - first_act[plans.act_person]
+        max_acts = int(position.max()) + 1 if plans.num_activities else 0
+
+        self.act_index = np.full((num_persons, max_acts), -1, dtype=np.int64)
+        self.act_index[plans.act_person, position] = np.arange(plans.num_activities)
+        self.leg_index = np.full((num_persons, max_acts), -1, dtype=np.int64)
+        self.leg_index[plans.act_person[origins], position[origins]] = np.arange(
+            len(origins)
+        )
+        self.act_link = np.append(act_link, 0)
+
+        # Activities last until they end or the day does, legs as long as
+        # the day leaves them
+        self.act_duration = np.zeros((num_persons, max_acts))
+        self.leg_duration = np.zeros((num_persons, max_acts))
+        clock = np.zeros(num_persons)
+        act_end = np.append(plans.act_end, np.nan)
+        for j in range(max_acts):
+            act = self.act_index[:, j]
+            end = act_end[act]
+            is_last = self.leg_index[:, j] < 0
+            end = np.where(is_last | np.isnan(end), self.day_length, end)
+            end = np.clip(end, clock, self.day_length)
+            self.act_duration[:, j] = np.where(act >= 0, end - clock, 0.0)
+            clock = end
+
+            leg = self.leg_index[:, j]
+            arrival = np.minimum(clock + leg_time[leg], self.day_length)
+            self.leg_duration[:, j] = np.where(leg >= 0, arrival - clock, 0.0)
+            clock = np.where(leg >= 0, arrival, clock)
+
+    def evaluate(self, actions: np.ndarray) -> dict:
+        """
+        Estimates the rewards of a charger placement.
+
+        Args:
+            actions (np.ndarray): Charger type index per link, indexed like
+                the action space. Links beyond the actions get no charger.
+
+        Returns:
+            dict: Charge reward and time reward, like parse_rewards returns
+                them for a simulated placement.
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        if len(actions) < self.num_links:
+            actions = np.pad(actions, (0, self.num_links - len(actions)))
+        leg_gain = np.append(
+            self.leg_links @ (self.dynamic_power[actions] * self.link_time_hours), 0.0
+        )
+        static_power = self.static_power[actions][self.act_link]
+        static_power[-1] = 0.0
+
+        energy = self.initial_energy
+        integral = np.zeros_like(energy)
+        for j in range(self.act_index.shape[1]):
+            duration = self.act_duration[:, j]
+            act = self.act_index[:, j]
+            charged = static_power[act] * duration / 3600
+            after = np.minimum(energy + charged, self.capacity)
+            integral += duration * (energy + after) / 2
+            energy = after
+
+            leg = self.leg_index[:, j]
+            duration = self.leg_duration[:, j]
+            after = np.clip(
+                energy + leg_gain[leg] - self.leg_energy[leg], 0.0, self.capacity
+            )
+            integral += duration * (energy + after) / 2
+            energy = after
+
+        charge_reward = integral.mean() / self.day_length / self.capacity.mean()
+        time_reward = self.mean_leg_time / SECONDS_PER_DAY
+        return dict(charge_reward=float(charge_reward), time_reward=time_reward)
@@ -0,0 +1,212 @@
+import asyncio
+import aiohttp
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+from rlev.classes.reward_client import (
+    DEFAULT_REWARD_SERVER_URL,
+    BaseRewardClient,
+    UnknownScenarioError,
+)
+
+
+class RewardResponse:
+    """
+    Open response of the reward server whose body is only downloaded on
+    demand, so that the outputs of the responses in flight that are
+    discarded are never held in memory. Offers the attributes of
+    requests.Response the envs use, and streams the body with iter_chunked,
+    for instance into stream_to_file_async. The connection is released once
+    the body is read completely or the response is closed.
+    """
+
+    def __init__(self, response: aiohttp.ClientResponse):
+        """
+        Initializes the RewardResponse.
+
+        Args:
+            response (aiohttp.ClientResponse): Response whose body is not
+                read yet.
+        """
+        self._response = response
+        self.status_code = response.status
+        self.headers = response.headers
+
+    def iter_chunked(self, chunk_size: int):
+        """
+        Iterates asynchronously over the body in chunks as it arrives.
+
+        Args:
+            chunk_size (int): Number of bytes per chunk at most.
+
+        Returns:
+            AsyncIterator[bytes]: Chunks of the body.
+        """
+        return self._response.content.iter_chunked(chunk_size)
+
+    async def read(self) -> bytes:
+        """
+        Reads the whole body and releases the connection, meant for small
+        bodies only.
+
+        Returns:
+            bytes: Response body.
+        """
+        try:
+            return await self._response.read()
+        finally:
+            self._response.release()
+
+    def close(self):
+        """
+        Closes the connection without downloading the rest of the body.
+        """
+        self._response.close()
+
+
+class AsyncRewardClient(BaseRewardClient):
+    """
+    Client of the reward server for asyncio, so that one process can keep
+    many simulations in flight at once. Requests share one aiohttp session
+    whose connection pool bounds the number of concurrent requests. Like
+    RewardClient, the static files of a scenario are uploaded once, and
+    concurrent requests that find the scenario missing upload it only once
+    between them.
+
+    The session is opened on first use and bound to the event loop it was
+    opened in.
+    """
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_REWARD_SERVER_URL,
+        max_connections: int = 64,
+        timeout: float = None,
+    ):
+        """
+        Initializes the AsyncRewardClient.
+
+        Args:
+            base_url (str): URL of the reward server. Defaults to
+                $RLEV_REWARD_SERVER_URL or http://localhost:8000.
+            max_connections (int): Number of requests sent to the server at
+                once, further requests wait for a free connection. Default
+                is 64.
+            timeout (float): Seconds to wait for a response, None waits as
+                long as the simulation takes. Default is None.
+        """
+        super().__init__(base_url, timeout)
+        self.max_connections = max_connections
+        self._session: aiohttp.ClientSession = None
+        self._upload_locks: dict[str, asyncio.Lock] = {}
+        self._uploads = Counter()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """
+        Session holding the connection pool, opened on first use.
+        """
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def _post(
+        self, endpoint: str, files: dict[str, Path], params: dict
+    ) -> RewardResponse:
+        with ExitStack() as stack:
+            form = aiohttp.FormData()
+            for field, path in files.items():
+                form.add_field(
+                    field,
+                    stack.enter_context(open(path, "rb")),
+                    filename=Path(path).name,
+                )
+            # The request body is sent once the response headers arrive
+            response = await self.session.post(
+                f"{self.base_url}/{endpoint}", params=params, data=form
+            )
+        if not self.is_unknown_scenario(response.status, response.headers):
+            response.raise_for_status()
+        return RewardResponse(response)
+
+    async def upload_scenario(self, scenario_hash: str, uploads_seen: int = None):
+        """
+        Uploads the static files of a registered scenario.
+
+        Args:
+            scenario_hash (str): Hash returned by register_scenario.
+            uploads_seen (int): Number of uploads of the scenario completed
+                when the request that found it missing was sent. If another
+                upload completed since, nothing is uploaded. Default is None,
+                which always uploads.
+        """
+        lock = self._upload_locks.setdefault(scenario_hash, asyncio.Lock())
+        async with lock:
+            uploads = self._uploads[scenario_hash]
+            if uploads_seen is not None and uploads_seen != uploads:
+                return
+            response = await self._post(
+                "uploadScenario",
+                self.scenarios[scenario_hash],
+                {"scenario_hash": scenario_hash},
+            )
+            await response.read()
+            self._uploads[scenario_hash] += 1
+
+    async def get_reward(
+        self,
+        files: dict[str, Path],
+        params: dict = None,
+        scenario_hash: str = None,
+    ) -> RewardResponse:
+        """
+        Requests the reward of a scenario. With a scenario hash only the
+        given files are sent. If the server does not know the scenario yet,
+        for instance because it restarted, the static files are uploaded and
+        the request is sent again.
+
+        Args:
+            files (dict[str, Path]): Form field name mapped to the path of
+                every file to send, such as the config and chargers.
+            params (dict): Query parameters of the request.
+            scenario_hash (str): Hash returned by register_scenario. Default
+                is None, which sends the files as a complete scenario.
+
+        Returns:
+            RewardResponse: The server response, which the caller has to
+                read or close.
+        """
+        params = dict(params or {})
+        if scenario_hash is not None:
+            params["scenario_hash"] = scenario_hash
+
+        uploads_seen = self._uploads[scenario_hash]
+        response = await self._post("getReward", files, params)
+        if scenario_hash is not None and self._is_unknown_scenario(response):
+            await response.read()
+            await self.upload_scenario(scenario_hash, uploads_seen)
+            response = await self._post("getReward", files, params)
+            if self._is_unknown_scenario(response):
+                await response.read()
+                raise UnknownScenarioError(scenario_hash)
+        return response
+
+    def _is_unknown_scenario(self, response: RewardResponse) -> bool:
+        return self.is_unknown_scenario(response.status_code, response.headers)
+
+    async def close(self):
+        """
+        Closes the pooled connections.
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
@@ -0,0 +1,73 @@
+import torch
+from torch_geometric.data import Data
+from torch_geometric.transforms import BaseTransform, LineGraph
+from torch_geometric.utils import coalesce
+
+
+class CsrLineGraph(BaseTransform):
+    """
+    Drop-in replacement for torch_geometric.transforms.LineGraph that builds
+    the line graph of a directed graph without a Python loop over edges.
+
+    The edges are coalesced exactly like LineGraph does, which sorts them by
+    source node and therefore lays them out as a CSR adjacency. The
+    successors of edge (u, v) are then the contiguous slice of edges leaving
+    v, and all slices are expanded at once with repeat_interleave. The output
+    is identical to LineGraph, including its node order and features.
+    Undirected graphs are delegated to LineGraph.
+    """
+
+    def __init__(self, force_directed: bool = False) -> None:
+        """
+        Initializes the CsrLineGraph.
+
+        Args:
+            force_directed (bool): If set to True, the graph is always treated
+                as a directed graph. Default is False.
+        """
+        self.force_directed = force_directed
+
+    def forward(self, data: Data) -> Data:
+        """
+        Converts a graph to its line graph.
+
+        Args:
+            data (Data): Graph with an edge_index and optional edge_attr.
+
+        Returns:
+            Data: The line graph, whose node features are the edge
+                attributes of the input graph.
+        """
+        assert data.edge_index is not None
+        if not (self.force_directed or data.is_directed()):
+            return LineGraph(self.force_directed).forward(data)
+
+        num_nodes = data.num_nodes
+        edge_index = coalesce(data.edge_index, num_nodes=num_nodes)
+        row, col = edge_index
+        num_edges = row.size(0)
+
+        out_degree = torch.bincount(row, minlength=num_nodes)
+        ptr = torch.zeros(num_nodes + 1, dtype=torch.long, device=row.device)
+        torch.cumsum(out_degree, dim=0, out=ptr[1:])
+
+        # Edge j = (u, v) is followed by the edges ptr[v] .. ptr[v + 1] - 1
+        num_successors = out_degree[col]
+        line_row = torch.repeat_interleave(
+            torch.arange(num_edges, device=row.device), num_successors
+        )
+        first_successor = torch.repeat_interleave(ptr[col], num_successors)
+        slice_start = torch.repeat_interleave(
+            torch.cumsum(num_successors, dim=0) - num_successors, num_successors
+        )
+        line_col = (
+            first_successor
+            + torch.arange(line_row.size(0), device=row.device)
+            - slice_start
+        )
+
+        data.edge_index = torch.stack([line_row, line_col], dim=0)
+        data.x = data.edge_attr
+        data.num_nodes = num_edges
+        data.edge_attr = None
+        return data
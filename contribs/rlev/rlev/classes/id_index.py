@@ -0,0 +1,173 @@
+import numpy as np
+
+
+class _InverseIdIndex:
+    """
+    Position to ID view of an IdIndex, so that index.inverse[idx] reads like
+    the bidict it replaces.
+    """
+
+    def __init__(self, index: "IdIndex"):
+        self._index = index
+
+    def __getitem__(self, positions):
+        return self._index.ids_of(positions)
+
+    def __len__(self):
+        return len(self._index)
+
+
+class IdIndex:
+    """
+    Compact bidirectional mapping between MATSim IDs and their position in the
+    graph. The IDs are kept in one NumPy array indexed by position, as int64
+    when every ID is a canonical integer and as fixed-width bytes otherwise,
+    next to the permutation that sorts them, about 12 bytes per numeric ID.
+    Position to ID is plain array indexing, ID to position is a binary search
+    with searchsorted, and both translate whole arrays of IDs at once. Scalar
+    lookups return and accept str, like the bidict[str, int] this replaces.
+    """
+
+    def __init__(self, ids: np.ndarray, order: np.ndarray = None):
+        """
+        Initializes the IdIndex.
+
+        Args:
+            ids (np.ndarray): ID of every position, as str, bytes or integer
+                array. The IDs must be unique.
+            order (np.ndarray): Permutation that sorts ids, as stored by a
+                previous IdIndex. Computed when not given.
+        """
+        self.ids = self._compact(np.asarray(ids))
+        if order is None:
+            order = np.argsort(self.ids, kind="stable")
+            if len(order) > 1 and np.any(
+                self.ids[order[1:]] == self.ids[order[:-1]]
+            ):
+                raise ValueError("IDs must be unique")
+            if len(order) < np.iinfo(np.int32).max:
+                order = order.astype(np.int32)
+        self.order = np.asarray(order)
+        self.inverse = _InverseIdIndex(self)
+        self.inv = self.inverse
+
+    @staticmethod
+    def _compact(ids: np.ndarray) -> np.ndarray:
+        if ids.dtype.kind in "iu":
+            return ids.astype(np.int64, copy=False)
+        if ids.dtype.kind == "S":
+            return ids
+        ids = ids.astype(str)
+        if (
+            len(ids) > 0
+            and np.char.isdigit(ids).all()
+            and np.char.str_len(ids).max() < 19
+        ):
+            numeric = ids.astype(np.int64)
+            # Keep the string form of IDs that would not survive a round trip
+            # through int, such as zero-padded ones.
+            if np.array_equal(numeric.astype(str), ids):
+                return numeric
+        return np.char.encode(ids, "utf-8")
+
+    def _encode(self, ids) -> np.ndarray:
+        ids = np.asarray(ids)
+        if self.ids.dtype.kind == "i":
+            if ids.dtype.kind in "iu":
+                return ids.astype(np.int64, copy=False)
+            ids = ids.astype(str)
+            numeric = np.char.isdigit(ids) & (np.char.str_len(ids) < 19)
+            encoded = np.full(ids.shape, -1, dtype=np.int64)
+            encoded[numeric] = ids[numeric].astype(np.int64)
+            # Non-canonical spellings like "007" are not in the index.
+            encoded[encoded.astype(str) != ids] = -1
+            return encoded
+        if ids.dtype.kind == "S":
+            return ids
+        return np.char.encode(ids.astype(str), "utf-8")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def indices_of(self, ids) -> np.ndarray:
+        """
+        Translates IDs to positions.
+
+        Args:
+            ids (array_like): IDs to look up.
+
+        Returns:
+            np.ndarray: Position of every ID, as int64.
+
+        Raises:
+            KeyError: If an ID is not in the index.
+        """
+        encoded = self._encode(ids)
+        if len(self) == 0:
+            if encoded.size:
+                raise KeyError(str(np.asarray(ids).flat[0]))
+            return np.zeros(encoded.shape, dtype=np.int64)
+        found = np.searchsorted(self.ids, encoded, sorter=self.order)
+        positions = self.order[np.minimum(found, len(self) - 1)].astype(np.int64)
+        missing = self.ids[positions] != encoded
+        if np.any(missing):
+            raise KeyError(str(np.asarray(ids)[missing].flat[0]))
+        return positions
+
+    def ids_of(self, positions):
+        """
+        Translates positions to IDs.
+
+        Args:
+            positions (int | array_like): Positions to look up.
+
+        Returns:
+            str | np.ndarray: The ID, or an array of IDs as str.
+        """
+        ids = self.ids[positions]
+        if np.ndim(ids) == 0:
+            return ids.decode() if isinstance(ids, bytes) else str(ids)
+        if ids.dtype.kind == "S":
+            return np.char.decode(ids, "utf-8")
+        return ids.astype(str)
+
+    def __getitem__(self, id) -> int:
+        return int(self.indices_of([id])[0])
+
+    def __contains__(self, id):
+        try:
+            self[id]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, id, default=None):
+        try:
+            return self[id]
+        except KeyError:
+            return default
+
+    def tolist(self) -> list[str]:
+        """
+        Returns every ID as str, in position order.
+        """
+        return self.ids_of(slice(None)).tolist()
+
+    def keys(self):
+        return self.tolist()
+
+    def values(self):
+        return range(len(self))
+
+    def items(self):
+        return zip(self.tolist(), range(len(self)))
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    @property
+    def nbytes(self):
+        """
+        Memory used by the index in bytes.
+        """
+        return self.ids.nbytes + self.order.nbytes
@@ -1,14 +1,29 @@
+import shutil
 import xml.etree.ElementTree as ET
+import numpy as np
 import torch
-import shutil
 from torch_geometric.data import Dataset
-from torch_geometric.transforms import LineGraph
+from rlev.classes.csr_line_graph import CsrLineGraph
 from torch_geometric.data import Data
 from pathlib import Path
-from rlev.scripts.util import setup_config
-from bidict import bidict
+from rlev.scripts.util import (
+    get_config_params,
+    set_config_params,
+    set_module_params,
+    setup_config,
+)
+from rlev.scripts import xml_writer
+from rlev.scripts.network_parser import NetworkArrays, parse_network_arrays
+from rlev.classes.graph_cache import GraphCache
+from rlev.classes.population_cache import PopulationCache
+from rlev.classes.shared_graph import SharedGraph
+from rlev.classes.scenario_workspace import ScenarioWorkspace
+from rlev.classes.id_index import IdIndex
+from rlev.classes.multi_fidelity import ScenarioSample
 from rlev.classes.chargers import Charger, StaticCharger, DynamicCharger
 from rlev.scripts.create_population_ev import create_population_and_plans_xml_counts
+from rlev.scripts.create_chargers import ChargersXmlBuilder
+from rlev.scripts.subsample_population import subsample_population
 
 
 class MatsimXMLDataset(Dataset):
@@ -24,6 +39,14 @@ class MatsimXMLDataset(Dataset):
         charger_list: list[Charger],
         num_agents: int = 10000,
         initial_soc: float = 0.5,
+        use_graph_cache: bool = True,
+        graph_cache_dir: Path = None,
+        shared_graph: SharedGraph = None,
+        gzip_inputs: bool = False,
+        population_seed: int = None,
+        use_population_cache: bool = True,
+        population_cache_dir: Path = None,
+        snap_to_links: bool = False,
     ):
         """
         Initializes the MatsimXMLDataset.
@@ -35,15 +58,38 @@ class MatsimXMLDataset(Dataset):
             num_agents (int): Number of agents to create. Default is 10000.
             initial_soc (float): Initial state of charge for agents. Default
                 is 0.5.
+            use_graph_cache (bool): Whether to load the compiled network graph
+                from the on-disk graph cache, and store it there on a miss.
+                Default is True.
+            graph_cache_dir (Path): Directory of the graph cache. Default is
+                the GraphCache default directory.
+            shared_graph (SharedGraph): Compiled graph published in shared
+                memory by a parent process. When given, the network is neither
+                parsed nor loaded from the graph cache.
+            gzip_inputs (bool): Whether to write the generated plans, vehicles
+                and chargers as .xml.gz, which shrinks the files uploaded to
+                the reward server. The config in the workspace is pointed at
+                the compressed files. Default is False.
+            population_seed (int): Seed of the generated population. Default
+                is None, which generates a different population every time.
+            use_population_cache (bool): Whether to link a generated
+                population with a fixed seed from the on-disk population
+                cache, generating it there on a miss, instead of generating
+                it in the workspace. Default is True.
+            population_cache_dir (Path): Directory of the population cache.
+                Default is the PopulationCache default directory.
+            snap_to_links (bool): Whether to write the nearest link of every
+                activity into the generated plans, which spares MATSim from
+                snapping the activities at the start of every simulation.
+                Default is False.
         """
         super().__init__(transform=None)
 
-        tmp_dir = Path("/tmp/" + time_string)
+        self.workspace = ScenarioWorkspace(config_path.parent, time_string)
+        tmp_dir = self.workspace.path
         output_path = Path(tmp_dir / "output")
 
-        shutil.copytree(config_path.parent, tmp_dir)
-
-        self.config_path = Path(tmp_dir / config_path.name)
+        self.config_path = self.workspace.materialize(config_path.name)
 
         (
             network_file_name,
@@ -53,7 +99,7 @@ class MatsimXMLDataset(Dataset):
             counts_file_name
         ) = setup_config(self.config_path, str(output_path))
 
-        self.charger_xml_path = Path(tmp_dir / chargers_file_name)
+        self.charger_xml_path = self.workspace.materialize(chargers_file_name)
         self.network_xml_path = Path(tmp_dir / network_file_name)
         self.plan_xml_path = Path(tmp_dir / plans_file_name)
         self.vehicle_xml_path = Path(tmp_dir / vehicles_file_name)
@@ -62,32 +108,122 @@ class MatsimXMLDataset(Dataset):
         self.charger_cost = 0
 
 
-        self.node_mapping: bidict[str, int] = (
-            bidict()
+        self.node_mapping: IdIndex = IdIndex(
+            np.array([], dtype=str)
         )  #: Store mapping of node IDs to indices in the graph
 
-        self.edge_mapping: bidict[str, int] = (
-            bidict()
+        self.edge_mapping: IdIndex = IdIndex(
+            np.array([], dtype=str)
         )  #: (key:edge id, value: index in edge list)
-        self.edge_attr_mapping: bidict[str, int] = (
-            bidict()
+        self.edge_attr_mapping: dict[str, int] = (
+            {}
         )  #: key: edge attribute name, value: index in edge attribute list
         self.graph: Data = Data()
         self.charger_list = charger_list
         self.num_charger_types = len(self.charger_list)
         self.max_charger_cost = 0
-        self.linegraph_transform = LineGraph()
+        self.linegraph_transform = CsrLineGraph()
+        self.graph_cache = GraphCache(graph_cache_dir) if use_graph_cache else None
+        self.shared_graph = shared_graph
         if num_agents:
-            create_population_and_plans_xml_counts(
-                self.network_xml_path,
-                self.plan_xml_path,
-                self.vehicle_xml_path,
-                num_agents=num_agents,
-                initial_soc=initial_soc,
+            self.workspace.materialize(plans_file_name, copy=False)
+            self.workspace.materialize(vehicles_file_name, copy=False)
+            self.create_population(
+                num_agents,
+                initial_soc,
+                population_seed,
+                True if gzip_inputs else None,
+                use_population_cache,
+                population_cache_dir,
+                snap_to_links,
             )
         self.create_edge_attr_mapping()
+        self.create_charger_price_vectors()
         self.parse_matsim_network()
+        self.applied_actions: np.ndarray = None
+        self.chargers_xml = ChargersXmlBuilder(
+            self.charger_list, self.edge_mapping.inverse
+        )
         self.parse_charger_network_get_charger_cost()
+        if gzip_inputs:
+            self.charger_xml_path = xml_writer.output_path(self.charger_xml_path, True)
+            self.write_charger_xml()
+            set_config_params(
+                self.config_path,
+                dict(
+                    inputPlansFile=self.plan_xml_path.relative_to(tmp_dir),
+                    vehiclesFile=self.vehicle_xml_path.relative_to(tmp_dir),
+                    chargersFile=self.charger_xml_path.relative_to(tmp_dir),
+                ),
+            )
+
+    def create_population(
+        self,
+        num_agents: int,
+        initial_soc: float,
+        seed: int,
+        compress: bool,
+        use_population_cache: bool,
+        population_cache_dir: Path,
+        snap_to_links: bool = False,
+    ):
+        """
+        Generates the plans and vehicles files of the workspace. A population
+        with a fixed seed is generated once into the population cache and
+        linked into every workspace that asks for it.
+
+        Args:
+            num_agents (int): Number of agents to create.
+            initial_soc (float): Initial state of charge of the agents.
+            seed (int): Seed of the population, None for a random one.
+            compress (bool): Whether to write gzipped files.
+            use_population_cache (bool): Whether to use the population cache.
+            population_cache_dir (Path): Directory of the population cache.
+            snap_to_links (bool): Whether to write the nearest link of every
+                activity into the plans.
+        """
+
+        def generate(plans_path, vehicles_path):
+            return create_population_and_plans_xml_counts(
+                self.network_xml_path,
+                plans_path,
+                vehicles_path,
+                num_agents=num_agents,
+                initial_soc=initial_soc,
+                seed=seed,
+                compress=compress,
+                snap_to_links=snap_to_links,
+            )
+
+        if seed is None or not use_population_cache:
+            self.plan_xml_path, self.vehicle_xml_path = generate(
+                self.plan_xml_path, self.vehicle_xml_path
+            )
+            return
+
+        population_cache = PopulationCache(population_cache_dir)
+        key = population_cache.key(
+            self.network_xml_path,
+            num_agents,
+            initial_soc,
+            seed,
+            compress=bool(compress),
+            snap_to_links=snap_to_links,
+        )
+        cached_plans, cached_vehicles = population_cache.get_or_create(
+            key, generate, bool(compress)
+        )
+        tmp_dir = self.workspace.path
+        self.plan_xml_path = self.workspace.link_file(
+            xml_writer.output_path(self.plan_xml_path, compress).relative_to(tmp_dir),
+            cached_plans,
+        )
+        self.vehicle_xml_path = self.workspace.link_file(
+            xml_writer.output_path(self.vehicle_xml_path, compress).relative_to(
+                tmp_dir
+            ),
+            cached_vehicles,
+        )
 
     def len(self):
         """
@@ -137,56 +273,61 @@ class MatsimXMLDataset(Dataset):
             edge_attr_idx += 1
 
     def parse_matsim_network(self):
+        """
+        Creates the graph representation of the MATSim network. The compiled
+        graph is loaded from the graph cache when available, otherwise the
+        network XML file is parsed and the result is stored in the cache.
+        When a shared graph was given, it is attached instead.
+        """
+        if self.shared_graph is not None:
+            self.load_graph_bundle(*self.shared_graph.attach())
+            return
+
+        if self.graph_cache is not None:
+            cache_key = self.graph_cache.key(self.network_xml_path, self.charger_list)
+            entry = self.graph_cache.load(cache_key)
+            if entry is not None:
+                self.load_graph_bundle(*entry)
+                return
+
+        self._parse_network_xml()
+
+        if self.graph_cache is not None:
+            self.graph_cache.save(cache_key, *self.graph_bundle())
+
+    def _parse_network_xml(self):
         """
         Parses the MATSim network XML file and creates a graph representation.
         """
-        tree = ET.parse(self.network_xml_path)
-        root = tree.getroot()
-        matsim_node_ids = []
-        node_ids = []
-        node_pos = []
-        edge_index = []
-        edge_attr = []
-
-        for i, node in enumerate(root.findall(".//node")):
-            node_id = node.get("id")
-            matsim_node_ids.append(node_id)
-            node_pos.append([float(node.get("x")), float(node.get("y"))])
-            self.node_mapping[node_id] = i
-            node_ids.append(i)
-
-        tot_attr = len(self.edge_attr_mapping)
-
-        for i, link in enumerate(root.findall(".//link")):
-            from_node = link.get("from")
-            to_node = link.get("to")
-            from_idx = self.node_mapping[from_node]
-            to_idx = self.node_mapping[to_node]
-            edge_index.append([from_idx, to_idx])
-            curr_link_attr = torch.zeros(tot_attr)
-            self.edge_mapping[link.get("id")] = i
-
-            for key, value in self.edge_attr_mapping.items():
-                if key in link.attrib:
-                    if key == "length":
-                        """
-                        Add the cost of either the static charger or the 
-                        dynamic charger times the length of the link, 
-                        converted to km from m.
-                        """
-                        link_len_km = float(link.get(key)) * 0.001
-                        self.max_charger_cost += max(
-                            StaticCharger.price,
-                            DynamicCharger.price * link_len_km,
-                        )
-                    curr_link_attr[value] = float(link.get(key))
-
-            edge_attr.append(curr_link_attr)
-
-        self.graph.x = torch.tensor(node_ids).view(-1, 1)
-        self.graph.pos = torch.tensor(node_pos)
-        self.graph.edge_index = torch.tensor(edge_index).t()
-        self.graph.edge_attr = torch.stack(edge_attr)
+        network = parse_network_arrays(self.network_xml_path)
+
+        self.node_mapping = IdIndex(network.node_ids)
+        self.edge_mapping = IdIndex(network.link_ids)
+
+        edge_attr = np.zeros(
+            (network.num_links, len(self.edge_attr_mapping)), dtype=np.float32
+        )
+        edge_attr[:, :3] = network.link_attr_matrix()
+
+        """
+        Add the cost of either the static charger or the dynamic charger
+        times the length of the link, converted to km from m.
+        """
+        self.link_length_km = network.length * 0.001
+        self.max_charger_cost = float(
+            np.maximum(
+                StaticCharger.price, DynamicCharger.price * self.link_length_km
+            ).sum()
+        )
+
+        self.graph.x = torch.arange(network.num_nodes).view(-1, 1)
+        self.graph.pos = torch.from_numpy(
+            np.stack([network.node_x, network.node_y], axis=1).astype(np.float32)
+        )
+        self.graph.edge_index = torch.from_numpy(
+            np.stack([network.from_idx, network.to_idx])
+        )
+        self.graph.edge_attr = torch.from_numpy(edge_attr)
         self.linegraph = self.linegraph_transform(self.graph)
         self.max_mins = torch.stack(
             [
@@ -200,68 +341,320 @@ class MatsimXMLDataset(Dataset):
         )
         self.state = self.graph.edge_attr
 
+    def graph_bundle(self):
+        """
+        Collects the compiled graph into plain arrays and metadata, the format
+        stored by the graph cache.
+
+        Returns:
+            tuple: Dict of arrays and dict of JSON serializable metadata.
+        """
+        linegraph_shares_x = self.linegraph.x.data_ptr() == self.graph.edge_attr.data_ptr()
+        arrays = dict(
+            node_ids=self.node_mapping.ids,
+            node_id_order=self.node_mapping.order,
+            edge_ids=self.edge_mapping.ids,
+            edge_id_order=self.edge_mapping.order,
+            pos=self.graph.pos.numpy(),
+            edge_index=self.graph.edge_index.numpy(),
+            edge_attr=self.graph.edge_attr.numpy(),
+            max_mins=self.max_mins.numpy(),
+            link_length_km=self.link_length_km,
+            linegraph_edge_index=self.linegraph.edge_index.numpy(),
+        )
+        if not linegraph_shares_x:
+            arrays["linegraph_x"] = self.linegraph.x.numpy()
+        meta = dict(
+            max_charger_cost=self.max_charger_cost,
+            linegraph_shares_x=linegraph_shares_x,
+            linegraph_num_nodes=int(self.linegraph.num_nodes),
+        )
+        return arrays, meta
+
+    def load_graph_bundle(self, arrays, meta):
+        """
+        Restores the compiled graph from arrays and metadata produced by
+        graph_bundle.
+
+        Args:
+            arrays (dict[str, np.ndarray]): Arrays of the compiled graph.
+            meta (dict): Metadata of the compiled graph.
+        """
+        self.node_mapping = IdIndex(arrays["node_ids"], arrays["node_id_order"])
+        self.edge_mapping = IdIndex(arrays["edge_ids"], arrays["edge_id_order"])
+        self.max_charger_cost = meta["max_charger_cost"]
+
+        self.graph.x = torch.arange(len(self.node_mapping)).view(-1, 1)
+        self.graph.pos = torch.from_numpy(arrays["pos"])
+        self.graph.edge_index = torch.from_numpy(arrays["edge_index"])
+        self.graph.edge_attr = torch.from_numpy(arrays["edge_attr"])
+        self.max_mins = torch.from_numpy(arrays["max_mins"])
+        self.link_length_km = arrays["link_length_km"]
+
+        if meta["linegraph_shares_x"]:
+            linegraph_x = self.graph.edge_attr
+        else:
+            linegraph_x = torch.from_numpy(arrays["linegraph_x"])
+        self.linegraph = Data(
+            x=linegraph_x,
+            pos=self.graph.pos,
+            edge_index=torch.from_numpy(arrays["linegraph_edge_index"]),
+            num_nodes=meta["linegraph_num_nodes"],
+        )
+        self.state = self.graph.edge_attr
+
+    def network_arrays(self) -> NetworkArrays:
+        """
+        Rebuilds the column representation of the network from the compiled
+        graph, so that it does not have to be parsed again.
+
+        Returns:
+            NetworkArrays: The network, with links in action space order.
+        """
+        link_attr = self._min_max_normalize(
+            self.graph.edge_attr[:, :3], reverse=True
+        ).numpy()
+        pos = self.graph.pos.numpy().astype(np.float64)
+        edge_index = self.graph.edge_index.numpy()
+        return NetworkArrays(
+            node_ids=self.node_mapping.ids_of(np.arange(len(self.node_mapping))),
+            node_x=pos[:, 0],
+            node_y=pos[:, 1],
+            link_ids=self.edge_mapping.ids_of(np.arange(len(self.edge_mapping))),
+            from_idx=edge_index[0].astype(np.int64),
+            to_idx=edge_index[1].astype(np.int64),
+            length=np.asarray(self.link_length_km, dtype=np.float64) * 1000,
+            freespeed=link_attr[:, 1].astype(np.float64),
+            capacity=link_attr[:, 2].astype(np.float64),
+        )
+
+    def create_charger_price_vectors(self):
+        """
+        Creates per charger type price vectors indexed like the action space:
+        a fixed price per charger and a price per km of link.
+        """
+        self.charger_fixed_price = np.zeros(self.num_charger_types)
+        self.charger_price_per_km = np.zeros(self.num_charger_types)
+        for action, charger in enumerate(self.charger_list):
+            if charger.type == StaticCharger.type:
+                self.charger_fixed_price[action] = charger.price
+            elif charger.type == DynamicCharger.type:
+                self.charger_price_per_km[action] = charger.price
+
+    def link_actions(self, actions: np.ndarray) -> np.ndarray:
+        """
+        Extends an action vector to one charger type per link. The line
+        graph merges parallel links, so the action space can be shorter than
+        the list of links, and the links beyond it get no charger.
+
+        Args:
+            actions (np.ndarray): Charger type index per link, indexed like
+                the action space.
+
+        Returns:
+            np.ndarray: Charger type index of every link.
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        num_links = len(self.edge_mapping)
+        if len(actions) < num_links:
+            actions = np.pad(actions, (0, num_links - len(actions)))
+        return actions
+
+    def compute_charger_cost(self, actions: np.ndarray) -> float:
+        """
+        Computes the total cost of a charger placement without modifying the
+        dataset. Dynamic chargers are priced by the length of their link,
+        static chargers by their count.
+
+        Args:
+            actions (np.ndarray): Charger type index per link, indexed like
+                the action space.
+
+        Returns:
+            float: Total cost of the chargers in USD.
+        """
+        actions = self.link_actions(actions)
+        counts = np.bincount(actions, minlength=self.num_charger_types)
+        fixed_cost = np.dot(counts, self.charger_fixed_price)
+        length_cost = np.dot(self.charger_price_per_km[actions], self.link_length_km)
+        return float(fixed_cost + length_cost)
+
+    def _link_charger_cost(self, link_indices: np.ndarray, actions: np.ndarray):
+        """
+        Computes the summed cost of placing the given charger types on the
+        given links.
+        """
+        return float(
+            self.charger_fixed_price[actions].sum()
+            + np.dot(
+                self.charger_price_per_km[actions], self.link_length_km[link_indices]
+            )
+        )
+
+    def apply_actions(self, actions: np.ndarray) -> float:
+        """
+        Sets the one-hot charger columns of the edge attributes from an
+        action vector and updates the charger cost and the serialized charger
+        set. Only the links whose charger type differs from the last applied
+        action are touched.
+
+        Args:
+            actions (np.ndarray): Charger type index per link, indexed like
+                the action space, see link_actions.
+
+        Returns:
+            float: Total cost of the chargers in USD.
+        """
+        actions = self.link_actions(actions)
+        charger_attr = self.graph.edge_attr.numpy()[:, 3:]
+
+        if self.applied_actions is None:
+            charger_attr[:] = 0
+            charger_attr[np.arange(len(actions)), actions] = 1
+            self.charger_cost = self.compute_charger_cost(actions)
+            changed = np.flatnonzero(actions)
+            self.applied_actions = actions.copy()
+            self.chargers_xml.update(changed, actions[changed])
+            return self.charger_cost
+
+        changed = np.flatnonzero(actions != self.applied_actions)
+        if len(changed) == 0:
+            return self.charger_cost
+
+        old_actions = self.applied_actions[changed]
+        new_actions = actions[changed]
+        charger_attr[changed, old_actions] = 0
+        charger_attr[changed, new_actions] = 1
+        self.charger_cost += self._link_charger_cost(
+            changed, new_actions
+        ) - self._link_charger_cost(changed, old_actions)
+        self.applied_actions[changed] = new_actions
+        self.chargers_xml.update(changed, new_actions)
+        return self.charger_cost
+
+    def scenario_files(self) -> dict[str, Path]:
+        """
+        Returns the static files of the scenario, which the reward server
+        keeps under their hash.
+
+        Returns:
+            dict[str, Path]: Form field name mapped to the path of every
+                static file.
+        """
+        return {
+            "network": self.network_xml_path,
+            "plans": self.plan_xml_path,
+            "vehicles": self.vehicle_xml_path,
+            "counts": self.counts_xml_path,
+            "consumption_map": self.consumption_map_path,
+        }
+
+    def sample_scenario(
+        self, fraction: float, seed: int = 0, population_cache_dir: Path = None
+    ) -> ScenarioSample:
+        """
+        Creates a low fidelity variant of the scenario, which simulates a
+        random sample of the population. The sample is drawn once per
+        population into the population cache and linked into the workspace.
+        Its config scales the flow capacity of the roads by the fraction and
+        their storage capacity by the fraction to the power of 0.75, which
+        MATSim recommends for small samples because vehicles are fewer but
+        not shorter, and scales the counts up to match.
+
+        Args:
+            fraction (float): Share of the persons to simulate.
+            seed (int): Seed of the sample. Default is 0.
+            population_cache_dir (Path): Directory of the population cache.
+                Default is the PopulationCache default directory.
+
+        Returns:
+            ScenarioSample: Config and static files of the sample.
+        """
+        tmp_dir = self.workspace.path
+        compress = xml_writer.is_gzip_path(self.plan_xml_path)
+
+        def generate(plans_path, vehicles_path):
+            return subsample_population(
+                self.plan_xml_path,
+                self.vehicle_xml_path,
+                plans_path,
+                vehicles_path,
+                fraction,
+                seed,
+            )
+
+        population_cache = PopulationCache(population_cache_dir)
+        key = population_cache.sample_key(
+            self.plan_xml_path, self.vehicle_xml_path, fraction, seed, compress
+        )
+        cached_plans, cached_vehicles = population_cache.get_or_create(
+            key, generate, compress
+        )
+        prefix = f"sample-{fraction:g}-"
+        plans_path = self.workspace.link_file(
+            prefix + self.plan_xml_path.name, cached_plans
+        )
+        vehicles_path = self.workspace.link_file(
+            prefix + self.vehicle_xml_path.name, cached_vehicles
+        )
+
+        config_path = self.workspace.file(prefix + self.config_path.name)
+        shutil.copyfile(self.config_path, config_path)
+        params = get_config_params(config_path)
+        flow_factor = float(params.get("flowCapacityFactor", 1)) * fraction
+        storage_factor = float(params.get("storageCapacityFactor", 1)) * fraction**0.75
+        counts_factor = float(params.get("countsScaleFactor", 1)) / fraction
+        set_config_params(
+            config_path,
+            dict(
+                inputPlansFile=plans_path.relative_to(tmp_dir),
+                vehiclesFile=vehicles_path.relative_to(tmp_dir),
+                countsScaleFactor=counts_factor,
+            ),
+        )
+        set_module_params(
+            config_path,
+            "qsim",
+            dict(
+                flowCapacityFactor=flow_factor,
+                storageCapacityFactor=storage_factor,
+            ),
+        )
+        files = dict(self.scenario_files(), plans=plans_path, vehicles=vehicles_path)
+        return ScenarioSample(fraction, config_path, files)
+
+    def write_charger_xml(self):
+        """
+        Writes the charger set of the last applied action to the chargers XML
+        file.
+        """
+        self.chargers_xml.write(self.charger_xml_path)
+
     def parse_charger_network_get_charger_cost(self):
         """
-        Parses the charger network XML file and calculates the total charger
-        cost.
+        Parses the charger network XML file, applies it to the edge
+        attributes and calculates the total charger cost.
 
         Returns:
             float: Total cost of chargers in the network.
         """
-        cost = 0
         tree = ET.parse(self.charger_xml_path)
         root = tree.getroot()
-
-        # Reset the values of the charger placements
-        self.graph.edge_attr[:, 3:] = torch.zeros(
-            self.graph.edge_attr.shape[0], self.graph.edge_attr[:, 3:].shape[1]
+        charger_actions = {
+            charger.type: action for action, charger in enumerate(self.charger_list)
+        }
+        actions = np.zeros(self.graph.edge_attr.shape[0], dtype=np.int64)
+
+        chargers = root.findall(".//charger")
+        link_indices = self.edge_mapping.indices_of(
+            np.array([charger.get("link") for charger in chargers], dtype=str)
         )
+        actions[link_indices] = [
+            charger_actions[charger.get("type", StaticCharger.type)]
+            for charger in chargers
+        ]
 
-        for charger in root.findall(".//charger"):
-            link_id = charger.get("link")
-            charger_type = charger.get("type")
-            if charger_type is None:
-                charger_type = StaticCharger.type
-
-            if charger_type == StaticCharger.type:
-                cost += StaticCharger.price
-            elif charger_type == DynamicCharger.type:
-                link_idx = self.edge_mapping[link_id]
-                link_attr = self.graph.edge_attr[link_idx]
-                link_attr_denormalized = self._min_max_normalize(
-                    link_attr[:3], reverse=True
-                )
-                link_len_km = (
-                    link_attr_denormalized[self.edge_attr_mapping["length"]] * 0.001
-                )
-                cost += DynamicCharger.price * link_len_km
-
-            self.graph.edge_attr[self.edge_mapping[link_id]][
-                self.edge_attr_mapping[charger_type]
-            ] = 1
-
-        # Update the rest of the links to have no charger
-        tree = ET.parse(self.network_xml_path)
-        root = tree.getroot()
-        for link in root.findall(".//link"):
-            link_id = link.get("id")
-
-            if not (
-                self.graph.edge_attr[self.edge_mapping[link_id]][
-                    self.edge_attr_mapping["default"]
-                ]
-                == 1
-                or self.graph.edge_attr[self.edge_mapping[link_id]][
-                    self.edge_attr_mapping["dynamic"]
-                ]
-                == 1
-            ):
-                self.graph.edge_attr[self.edge_mapping[link_id]][
-                    self.edge_attr_mapping["none"]
-                ] = 1
-
-        self.charger_cost = cost
-        return cost
+        return self.apply_actions(actions)
 
     def get_graph(self):
         """
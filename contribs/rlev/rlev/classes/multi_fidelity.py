@@ -0,0 +1,69 @@
+import numpy as np
+from dataclasses import dataclass
+from pathlib import Path
+
+
+@dataclass
+class ScenarioSample:
+    """
+    Low fidelity variant of a scenario, simulating a sample of its
+    population with the road capacities scaled down to match. The config
+    and the sampled plans and vehicles live in the workspace of the full
+    scenario, next to its files.
+    """
+
+    fraction: float
+    config_path: Path
+    files: dict[str, Path]
+    scenario_hash: str = None
+    config_hash: str = None
+
+
+class ScreeningPolicy:
+    """
+    Decides which charger placements evaluated on a ScenarioSample are run
+    again on the full scenario. A placement is promoted when its screened
+    reward could beat the best full scale reward, when it reaches a fixed
+    threshold, or when it is among the top quantile of the screened rewards
+    so far. The others keep their screened rewards.
+    """
+
+    def __init__(self, threshold: float = None, quantile: float = None):
+        """
+        Initializes the ScreeningPolicy.
+
+        Args:
+            threshold (float): Screened reward from which placements are
+                promoted. Default is None, which promotes by quantile only.
+            quantile (float): Quantile of the screened rewards so far from
+                which placements are promoted, for instance 0.9 for the top
+                10 percent. Default is None, which promotes by threshold
+                only.
+        """
+        if quantile is not None and not 0 <= quantile <= 1:
+            raise ValueError(f"Quantile must be in [0, 1], got {quantile}")
+        self.threshold = threshold
+        self.quantile = quantile
+        self.rewards: list[float] = []
+
+    def should_promote(self, reward: float, best_reward: float) -> bool:
+        """
+        Records a screened reward and decides if its placement is run again
+        at full scale.
+
+        Args:
+            reward (float): Reward of the placement on the sample.
+            best_reward (float): Best full scale reward so far.
+
+        Returns:
+            bool: Whether to simulate the placement at full scale.
+        """
+        self.rewards.append(reward)
+        if reward > best_reward:
+            return True
+        if self.threshold is not None and reward >= self.threshold:
+            return True
+        return (
+            self.quantile is not None
+            and reward >= np.quantile(self.rewards, self.quantile)
+        )
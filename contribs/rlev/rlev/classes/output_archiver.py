@@ -0,0 +1,209 @@
+import fnmatch
+import shutil
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path, PurePosixPath
+from typing import Sequence
+from filelock import FileLock
+
+
+CHUNK_SIZE = 1 << 20
+
+
+def stream_to_file(response, path: Path, chunk_size: int = CHUNK_SIZE) -> Path:
+    """
+    Writes the body of a response to a file chunk by chunk, so that it is
+    never held in memory as a whole. The file appears under its name only
+    once it is complete.
+
+    Args:
+        response (requests.Response): Response opened with stream=True.
+        path (Path): Path of the file to write.
+        chunk_size (int): Number of bytes read at a time.
+
+    Returns:
+        Path: Path of the written file.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".part")
+    with open(tmp_path, "wb") as f:
+        for chunk in response.iter_content(chunk_size):
+            f.write(chunk)
+    tmp_path.replace(path)
+    return path
+
+
+async def stream_to_file_async(
+    response, path: Path, chunk_size: int = CHUNK_SIZE
+) -> Path:
+    """
+    Coroutine version of stream_to_file for the responses of
+    AsyncRewardClient, which reads the body as it arrives.
+
+    Args:
+        response (RewardResponse): Response whose body is not read yet.
+        path (Path): Path of the file to write.
+        chunk_size (int): Number of bytes read at a time.
+
+    Returns:
+        Path: Path of the written file.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".part")
+    with open(tmp_path, "wb") as f:
+        async for chunk in response.iter_chunked(chunk_size):
+            f.write(chunk)
+    tmp_path.replace(path)
+    return path
+
+
+def extract_members(
+    zip_path: Path, extract_dir: Path, members: Sequence[str] = None
+) -> list[str]:
+    """
+    Extracts the members of a zip archive matching any of the given glob
+    patterns. A pattern matches the full name of a member or its base name,
+    so "scorestats.csv", "*.csv" and "output/ITERS/*" all work.
+
+    Args:
+        zip_path (Path): Path of the zip archive.
+        extract_dir (Path): Directory to extract to.
+        members (Sequence[str]): Glob patterns of the members to extract.
+            Default is None, which extracts everything.
+
+    Returns:
+        list[str]: Names of the extracted members.
+    """
+    with zipfile.ZipFile(zip_path, "r") as zip_file:
+        names = zip_file.namelist()
+        if members is not None:
+            names = [
+                name
+                for name in names
+                if any(
+                    fnmatch.fnmatch(name, pattern)
+                    or fnmatch.fnmatch(PurePosixPath(name).name, pattern)
+                    for pattern in members
+                )
+            ]
+        for name in names:
+            zip_file.extract(name, extract_dir)
+    return names
+
+
+class OutputArchiver:
+    """
+    Saves zipped simulation outputs from a background thread, so that
+    copying and extracting outputs of several GB does not stall training.
+    Jobs run one at a time in the order they were submitted, so a spooled
+    archive can be removed by a job submitted after the ones reading it.
+
+    The archiver can be pickled, for instance along with an env, in which
+    case the copy starts its own thread on first use.
+    """
+
+    def __init__(self, members: Sequence[str] = None):
+        """
+        Initializes the OutputArchiver.
+
+        Args:
+            members (Sequence[str]): Glob patterns of the archive members to
+                extract, see extract_members. Default is None, which
+                extracts everything.
+        """
+        self.members = None if members is None else list(members)
+        self._executor: ThreadPoolExecutor = None
+        self._pending: list[Future] = []
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """
+        Executor running the jobs, started on first use.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(1, thread_name_prefix="rlev-archiver")
+        return self._executor
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_executor"] = None
+        state["_pending"] = []
+        return state
+
+    def _submit(self, function, *args) -> Future:
+        self._pending = [future for future in self._pending if not future.done()]
+        future = self.executor.submit(function, *args)
+        future.add_done_callback(_report_error)
+        self._pending.append(future)
+        return future
+
+    def submit(
+        self,
+        archive_path: Path,
+        zip_path: Path,
+        extract_dir: Path,
+        lock_file: Path = None,
+    ) -> Future:
+        """
+        Copies a zipped output to its destination and extracts the requested
+        members next to it.
+
+        Args:
+            archive_path (Path): Path of the zipped output.
+            zip_path (Path): Destination of the zip file.
+            extract_dir (Path): Directory to extract the members to.
+            lock_file (Path): File lock held while writing, for outputs
+                saved to the same place by several processes. Default is
+                None.
+
+        Returns:
+            Future: Future of the names of the extracted members.
+        """
+        return self._submit(
+            self._archive, archive_path, zip_path, extract_dir, lock_file
+        )
+
+    def _archive(self, archive_path, zip_path, extract_dir, lock_file):
+        with FileLock(lock_file) if lock_file is not None else nullcontext():
+            shutil.copyfile(archive_path, zip_path)
+            print(f"Saved zip file: {zip_path}")
+
+            names = extract_members(zip_path, extract_dir, self.members)
+            print(f"Extracted {len(names)} files to: {extract_dir}")
+        return names
+
+    def remove(self, path: Path) -> Future:
+        """
+        Deletes a file once the jobs submitted before have finished.
+
+        Args:
+            path (Path): Path of the file to delete.
+
+        Returns:
+            Future: Future of the deletion.
+        """
+        return self._submit(Path(path).unlink, True)
+
+    def wait(self):
+        """
+        Waits for the submitted jobs to finish and raises the first error
+        any of them raised.
+        """
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def close(self):
+        """
+        Finishes the submitted jobs and stops the thread.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._pending = []
+
+
+def _report_error(future: Future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Saving server output failed: {future.exception()!r}")
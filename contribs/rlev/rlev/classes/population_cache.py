@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import shutil
+from filelock import FileLock
+from pathlib import Path
+from typing import Callable
+from rlev.classes.graph_cache import DEFAULT_CACHE_DIR
+from rlev.scripts.util import hash_file
+
+
+class PopulationCache:
+    """
+    On-disk cache of generated plans and vehicles files. Each entry is a
+    directory holding the two files plus a meta.json file, keyed by a hash of
+    the network and counts file contents and of the generator arguments. A
+    population only depends on these when its seed is fixed, so envs started
+    with the same seed link the cached files into their workspace instead of
+    each generating their own. Generation of an entry is serialized with a
+    file lock, so of many envs starting at once only the first one generates.
+    Samples of a population for multi-fidelity evaluation are cached the same
+    way, keyed by the contents of the sampled files, see sample_key.
+    """
+
+    FORMAT_VERSION = 2
+
+    def __init__(self, cache_dir: Path = None):
+        """
+        Initializes the PopulationCache.
+
+        Args:
+            cache_dir (Path): Directory holding the cache entries. Defaults to
+                $RLEV_CACHE_DIR/populations or ~/.cache/rlev/populations.
+        """
+        self.cache_dir = Path(cache_dir or Path(DEFAULT_CACHE_DIR, "populations"))
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def key(
+        self,
+        network_xml_path: Path,
+        num_agents: int,
+        initial_soc: float,
+        seed: int,
+        counts_path: Path = None,
+        compress: bool = False,
+        **generator_kwargs,
+    ) -> str:
+        """
+        Computes the cache key of a population.
+
+        Args:
+            network_xml_path (Path): Path to the MATSim network XML file.
+            num_agents (int): Number of agents.
+            initial_soc (float): Initial state of charge of every vehicle.
+            seed (int): Seed of the population generator.
+            counts_path (Path): Counts file the population follows, if any.
+            compress (bool): Whether the files are gzipped.
+            **generator_kwargs: Further generator arguments that change the
+                population.
+
+        Returns:
+            str: Hex digest identifying the population.
+        """
+        if seed is None:
+            raise ValueError("Only populations with a fixed seed can be cached")
+
+        hasher = hashlib.sha256()
+        hasher.update(f"v{self.FORMAT_VERSION};".encode())
+        args = dict(
+            generator_kwargs,
+            num_agents=num_agents,
+            initial_soc=initial_soc,
+            seed=seed,
+            compress=bool(compress),
+            network=hash_file(network_xml_path),
+            counts=hash_file(counts_path) if counts_path else None,
+        )
+        hasher.update(json.dumps(args, sort_keys=True, default=str).encode())
+        return hasher.hexdigest()
+
+    def sample_key(
+        self,
+        plans_xml_path: Path,
+        vehicles_xml_path: Path,
+        fraction: float,
+        seed: int,
+        compress: bool = False,
+    ) -> str:
+        """
+        Computes the cache key of a sample of a population, see
+        rlev.scripts.subsample_population.
+
+        Args:
+            plans_xml_path (Path): Path to the plans XML file sampled from.
+            vehicles_xml_path (Path): Path to the vehicles XML file.
+            fraction (float): Share of persons in the sample.
+            seed (int): Seed of the sample.
+            compress (bool): Whether the files are gzipped.
+
+        Returns:
+            str: Hex digest identifying the sample.
+        """
+        hasher = hashlib.sha256()
+        hasher.update(f"v{self.FORMAT_VERSION};sample;".encode())
+        args = dict(
+            fraction=fraction,
+            seed=seed,
+            compress=bool(compress),
+            plans=hash_file(plans_xml_path),
+            vehicles=hash_file(vehicles_xml_path),
+        )
+        hasher.update(json.dumps(args, sort_keys=True).encode())
+        return hasher.hexdigest()
+
+    def load(self, key: str):
+        """
+        Looks up a cache entry.
+
+        Args:
+            key (str): Cache key returned by PopulationCache.key.
+
+        Returns:
+            tuple[Path, Path] | None: Paths of the cached plans and vehicles
+                files, or None on a cache miss.
+        """
+        entry_dir = Path(self.cache_dir, key)
+        meta_path = Path(entry_dir, "meta.json")
+        if not meta_path.exists():
+            return None
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+        return Path(entry_dir, meta["plans"]), Path(entry_dir, meta["vehicles"])
+
+    def get_or_create(
+        self,
+        key: str,
+        generate: Callable[[Path, Path], tuple[Path, Path]],
+        compress: bool = False,
+    ):
+        """
+        Returns the files of a cache entry, generating them first on a miss.
+
+        Args:
+            key (str): Cache key returned by PopulationCache.key.
+            generate (Callable): Called with the plans and vehicles paths to
+                write on a miss, returns the paths actually written.
+            compress (bool): Whether generate writes gzipped files.
+
+        Returns:
+            tuple[Path, Path]: Paths of the cached plans and vehicles files.
+        """
+        entry = self.load(key)
+        if entry is not None:
+            return entry
+
+        with FileLock(Path(self.cache_dir, f".{key}.lock")):
+            entry = self.load(key)
+            if entry is not None:
+                return entry
+
+            suffix = ".xml.gz" if compress else ".xml"
+            tmp_dir = Path(self.cache_dir, f".{key}.{os.getpid()}.tmp")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            tmp_dir.mkdir(parents=True)
+            try:
+                plans_path, vehicles_path = generate(
+                    Path(tmp_dir, "plans" + suffix),
+                    Path(tmp_dir, "vehicles" + suffix),
+                )
+                with open(Path(tmp_dir, "meta.json"), "w") as f:
+                    json.dump(
+                        dict(
+                            plans=Path(plans_path).name,
+                            vehicles=Path(vehicles_path).name,
+                        ),
+                        f,
+                    )
+                os.rename(tmp_dir, Path(self.cache_dir, key))
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        return self.load(key)
+
+    def clear(self):
+        """
+        Removes every entry from the cache.
+        """
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
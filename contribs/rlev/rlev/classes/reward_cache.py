@@ -0,0 +1,191 @@
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable
+from rlev.classes.graph_cache import DEFAULT_CACHE_DIR
+
+
+def charger_placement_hash(placements: Iterable[tuple]) -> str:
+    """
+    Computes a canonical hash of a charger placement, independent of the
+    order the chargers are listed in and of their IDs.
+
+    Args:
+        placements (Iterable[tuple]): One tuple of strings per charger, such
+            as link ID, charger type, plug power and plug count.
+
+    Returns:
+        str: Hex digest identifying the placement.
+    """
+    rows = sorted("\x1f".join(map(str, placement)) for placement in placements)
+    return hashlib.sha256("\x1e".join(rows).encode()).hexdigest()
+
+
+class RewardCache:
+    """
+    Persistent cache of simulated rewards in a SQLite database, keyed by the
+    scenario and the charger placement that was simulated. The database is
+    shared by every process using the same file, so envs running in
+    parallel reuse each other's simulations. Entries are evicted least
+    recently used first once the cache holds more than max_entries of them.
+    Hits and misses are counted per instance.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, db_path: Path = None, max_entries: int = 100_000):
+        """
+        Initializes the RewardCache.
+
+        Args:
+            db_path (Path): Path of the SQLite database. Defaults to
+                $RLEV_CACHE_DIR/rewards.sqlite or ~/.cache/rlev/rewards.sqlite.
+            max_entries (int): Number of entries kept before the least
+                recently used ones are evicted. Default is 100000.
+        """
+        self.db_path = Path(db_path or Path(DEFAULT_CACHE_DIR, "rewards.sqlite"))
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._connection: sqlite3.Connection = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """
+        Connection to the database, opened on first use and again after the
+        cache was pickled into another process.
+        """
+        if self._connection is None:
+            # Envs stepped by AsyncMatsimVecEnv use the cache from the event
+            # loop thread, one call at a time
+            self._connection = sqlite3.connect(
+                self.db_path, timeout=60, check_same_thread=False
+            )
+            with self._connection:
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS rewards ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                    "created REAL NOT NULL, last_access REAL NOT NULL)"
+                )
+                self._connection.execute(
+                    "CREATE INDEX IF NOT EXISTS rewards_last_access "
+                    "ON rewards (last_access)"
+                )
+        return self._connection
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        return state
+
+    def key(self, scenario_hash: str, charger_hash: str, **extra) -> str:
+        """
+        Computes the cache key of a simulation.
+
+        Args:
+            scenario_hash (str): Hash of the static scenario files.
+            charger_hash (str): Hash of the charger placement, for instance
+                from charger_placement_hash.
+            **extra: Further values the reward depends on, such as a hash of
+                the config.
+
+        Returns:
+            str: Hex digest identifying the simulation.
+        """
+        args = dict(
+            extra,
+            version=self.FORMAT_VERSION,
+            scenario=scenario_hash,
+            chargers=charger_hash,
+        )
+        return hashlib.sha256(
+            json.dumps(args, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    def get(self, key: str):
+        """
+        Looks up a cached reward and marks it as recently used.
+
+        Args:
+            key (str): Cache key returned by RewardCache.key.
+
+        Returns:
+            dict | None: The cached values exactly as they were stored, or
+                None on a cache miss.
+        """
+        with self.connection:
+            row = self.connection.execute(
+                "SELECT value FROM rewards WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.connection.execute(
+                "UPDATE rewards SET last_access = ? WHERE key = ?",
+                (time.time(), key),
+            )
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value: dict):
+        """
+        Stores the values of a simulation and evicts the least recently used
+        entries beyond max_entries.
+
+        Args:
+            key (str): Cache key returned by RewardCache.key.
+            value (dict): JSON serializable values, such as the rewards and
+                the cost breakdown.
+        """
+        now = time.time()
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO rewards VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            evicted = self.connection.execute(
+                "DELETE FROM rewards WHERE key IN (SELECT key FROM rewards "
+                "ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+        self.evictions += evicted
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM rewards").fetchone()[0]
+
+    def stats(self) -> dict:
+        """
+        Returns the hit and miss counts of this instance and the size of the
+        cache.
+
+        Returns:
+            dict: hits, misses, hit_rate, evictions and entries.
+        """
+        lookups = self.hits + self.misses
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hits / lookups if lookups else 0.0,
+            evictions=self.evictions,
+            entries=len(self),
+        )
+
+    def clear(self):
+        """
+        Removes every entry from the cache.
+        """
+        with self.connection:
+            self.connection.execute("DELETE FROM rewards")
+
+    def close(self):
+        """
+        Closes the database connection.
+        """
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,419 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import requests
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Iterable
+from requests.adapters import HTTPAdapter
+from rlev.classes.reward_cache import RewardCache
+from rlev.scripts.create_chargers import ChargersXmlBuilder
+from rlev.scripts.util import hash_config, hash_file
+
+
+DEFAULT_REWARD_SERVER_URL = os.environ.get(
+    "RLEV_REWARD_SERVER_URL", "http://localhost:8000"
+)
+
+
+class UnknownScenarioError(Exception):
+    """
+    Raised when the reward server does not hold the scenario of a request.
+    """
+
+
+def parse_rewards(message: dict) -> dict:
+    """
+    Reads the simulated rewards from the X-Response-Message of a reward
+    server response.
+
+    Args:
+        message (dict): Decoded X-Response-Message header.
+
+    Returns:
+        dict: Charge reward and time reward.
+    """
+    return dict(
+        charge_reward=float(message["charge_reward"]),
+        time_reward=float(message["time_reward"]),
+    )
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Checks whether a failed reward request is worth sending again, which is
+    the case for connection errors, timeouts and server errors.
+    """
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+class BaseRewardClient:
+    """
+    Scenario bookkeeping shared by the blocking and the asyncio clients of
+    the reward server. The static files of a scenario, such as the network
+    and plans, are uploaded once under a hash of their contents, after which
+    reward requests only carry the files that change between steps plus that
+    hash. Envs whose scenarios have the same contents share one upload.
+    """
+
+    def __init__(
+        self, base_url: str = DEFAULT_REWARD_SERVER_URL, timeout: float = None
+    ):
+        """
+        Initializes the BaseRewardClient.
+
+        Args:
+            base_url (str): URL of the reward server. Defaults to
+                $RLEV_REWARD_SERVER_URL or http://localhost:8000.
+            timeout (float): Seconds to wait for a response, None waits as
+                long as the simulation takes. Default is None.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.scenarios: dict[str, dict[str, Path]] = {}
+        self._file_hashes: dict[tuple, str] = {}
+
+    def _hash_file(self, path: Path) -> str:
+        stat = os.stat(path)
+        key = (str(path), stat.st_size, stat.st_mtime_ns)
+        if key not in self._file_hashes:
+            self._file_hashes[key] = hash_file(path)
+        return self._file_hashes[key]
+
+    def register_scenario(self, files: dict[str, Path]) -> str:
+        """
+        Computes the hash of a scenario's static files and remembers them
+        for uploading. Nothing is sent until a request needs the scenario.
+
+        Args:
+            files (dict[str, Path]): Form field name mapped to the path of
+                every static file. The server stores the files under their
+                base names, which the config refers to.
+
+        Returns:
+            str: Scenario hash to pass to get_reward.
+        """
+        files = {field: Path(path) for field, path in files.items()}
+        hasher = hashlib.sha256()
+        for field in sorted(files):
+            path = files[field]
+            hasher.update(f"{field};{path.name};{self._hash_file(path)};".encode())
+        scenario_hash = hasher.hexdigest()
+        self.scenarios[scenario_hash] = files
+        return scenario_hash
+
+    @staticmethod
+    def is_unknown_scenario(status: int, headers) -> bool:
+        """
+        Checks whether a response rejected a request because the server
+        does not hold its scenario.
+
+        Args:
+            status (int): HTTP status code of the response.
+            headers (Mapping[str, str]): Case-insensitive response headers.
+
+        Returns:
+            bool: Whether the scenario has to be uploaded again.
+        """
+        if status != 404:
+            return False
+        message = headers.get("X-Response-Message")
+        return message is not None and json.loads(message).get("error") == (
+            "unknown_scenario"
+        )
+
+
+class RewardClient(BaseRewardClient):
+    """
+    Blocking client of the reward server. Requests go through one pooled
+    requests.Session, so connections are reused across steps. The client
+    may be shared by threads, see evaluate_batch.
+    """
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_REWARD_SERVER_URL,
+        pool_maxsize: int = 4,
+        timeout: float = None,
+    ):
+        """
+        Initializes the RewardClient.
+
+        Args:
+            base_url (str): URL of the reward server. Defaults to
+                $RLEV_REWARD_SERVER_URL or http://localhost:8000.
+            pool_maxsize (int): Number of connections kept open to the
+                server. Default is 4.
+            timeout (float): Seconds to wait for a response, None waits as
+                long as the simulation takes. Default is None.
+        """
+        super().__init__(base_url, timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._upload_lock = threading.Lock()
+        self._uploads = Counter()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_upload_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._upload_lock = threading.Lock()
+
+    def _post(
+        self, endpoint: str, files: dict[str, Path], params: dict, stream=False
+    ):
+        with ExitStack() as stack:
+            opened = {
+                field: stack.enter_context(open(path, "rb"))
+                for field, path in files.items()
+            }
+            return self.session.post(
+                f"{self.base_url}/{endpoint}",
+                params=params,
+                files=opened,
+                timeout=self.timeout,
+                stream=stream,
+            )
+
+    def upload_scenario(self, scenario_hash: str, uploads_seen: int = None):
+        """
+        Uploads the static files of a registered scenario.
+
+        Args:
+            scenario_hash (str): Hash returned by register_scenario.
+            uploads_seen (int): Number of uploads of the scenario completed
+                when the request that found it missing was sent. If another
+                thread uploaded it since, nothing is uploaded. Default is
+                None, which always uploads.
+        """
+        with self._upload_lock:
+            uploads = self._uploads[scenario_hash]
+            if uploads_seen is not None and uploads_seen != uploads:
+                return
+            response = self._post(
+                "uploadScenario",
+                self.scenarios[scenario_hash],
+                {"scenario_hash": scenario_hash},
+            )
+            response.raise_for_status()
+            self._uploads[scenario_hash] += 1
+
+    def get_reward(
+        self,
+        files: dict[str, Path],
+        params: dict = None,
+        scenario_hash: str = None,
+        stream: bool = False,
+    ) -> requests.Response:
+        """
+        Requests the reward of a scenario. With a scenario hash only the
+        given files are sent. If the server does not know the scenario yet,
+        for instance because it restarted, the static files are uploaded and
+        the request is sent again.
+
+        Args:
+            files (dict[str, Path]): Form field name mapped to the path of
+                every file to send, such as the config and chargers.
+            params (dict): Query parameters of the request.
+            scenario_hash (str): Hash returned by register_scenario. Default
+                is None, which sends the files as a complete scenario.
+            stream (bool): Whether to return before the zipped output in the
+                body is downloaded. The caller then either reads it, for
+                instance with output_archiver.stream_to_file, or closes the
+                response to skip it. Default is False.
+
+        Returns:
+            requests.Response: The server response.
+        """
+        params = dict(params or {})
+        if scenario_hash is not None:
+            params["scenario_hash"] = scenario_hash
+
+        uploads_seen = self._uploads[scenario_hash]
+        response = self._post("getReward", files, params, stream)
+        if scenario_hash is not None and self._is_unknown_scenario(response):
+            response.close()
+            self.upload_scenario(scenario_hash, uploads_seen)
+            response = self._post("getReward", files, params, stream)
+            if self._is_unknown_scenario(response):
+                raise UnknownScenarioError(scenario_hash)
+        response.raise_for_status()
+        return response
+
+    def get_reward_with_retries(
+        self,
+        files: dict[str, Path],
+        params: dict = None,
+        scenario_hash: str = None,
+        retries: int = 2,
+        backoff: float = 1.0,
+        stream: bool = False,
+    ) -> requests.Response:
+        """
+        Requests the reward of a scenario like get_reward, and sends the
+        request again after connection errors, timeouts and server errors.
+
+        Args:
+            files (dict[str, Path]): Form field name mapped to the path of
+                every file to send.
+            params (dict): Query parameters of the request.
+            scenario_hash (str): Hash returned by register_scenario.
+            retries (int): Number of times a failed request is sent again.
+                Default is 2.
+            backoff (float): Seconds to wait before the first retry, doubled
+                for every further one. Default is 1.
+            stream (bool): Whether to return before the body is downloaded,
+                see get_reward. Default is False.
+
+        Returns:
+            requests.Response: The server response.
+        """
+        for attempt in range(retries + 1):
+            try:
+                return self.get_reward(files, params, scenario_hash, stream)
+            except requests.RequestException as error:
+                if attempt == retries or not is_retryable(error):
+                    raise
+            time.sleep(backoff * 2**attempt)
+
+    def evaluate_batch(
+        self,
+        actions: Iterable,
+        dataset,
+        reward_cache: RewardCache = None,
+        max_concurrency: int = 4,
+        retries: int = 2,
+        backoff: float = 1.0,
+    ) -> list[dict]:
+        """
+        Evaluates a batch of charger placements of one scenario, such as a
+        generation of an evolutionary search or an evaluation sweep. The
+        placements are rendered with one ChargersXmlBuilder. Placements found
+        in the reward cache, and repeats within the batch, are not simulated
+        again. The rest are sent to the server up to max_concurrency at a
+        time, and failed requests are retried, see get_reward_with_retries.
+
+        Args:
+            actions (Iterable[np.ndarray]): Charger type index per link of
+                every placement, indexed like the action space of the
+                dataset.
+            dataset (MatsimXMLDataset): Dataset of the scenario, whose
+                config, static files, charger types and links are used. It
+                is not modified.
+            reward_cache (RewardCache): Cache to look placements up in and
+                to store simulated rewards in. The entries are shared with
+                envs of the same scenario. Default is None.
+            max_concurrency (int): Number of requests in flight at once.
+                Connections beyond pool_maxsize are not kept open. Default
+                is 4.
+            retries (int): Number of times a failed request is sent again.
+                Default is 2.
+            backoff (float): Seconds to wait before the first retry, doubled
+                for every further one. Default is 1.
+
+        Returns:
+            list[dict]: Charge reward, time reward and charger cost of every
+                placement, in the order of actions.
+
+        Raises:
+            Exception: The first error of the requests that failed for good,
+                raised once every request finished and the rewards of the
+                successful ones are stored in the reward cache.
+        """
+        scenario_hash = self.register_scenario(dataset.scenario_files())
+        config_hash = hash_config(dataset.config_path)
+        builder = ChargersXmlBuilder(dataset.charger_list, dataset.edge_mapping.inverse)
+
+        def cache_key(digest):
+            return reward_cache.key(scenario_hash, digest, config=config_hash)
+
+        digests = []
+        charger_costs = []
+        rewards = {}
+        with tempfile.TemporaryDirectory(prefix="rlev-batch-") as tmp_dir:
+            # The server stores the chargers under the name the config
+            # refers to, so every placement gets a directory of its own
+            pending = {}
+            for placement in actions:
+                placement = dataset.link_actions(placement)
+                charger_costs.append(dataset.compute_charger_cost(placement))
+                builder.render(placement)
+                digest = builder.digest
+                digests.append(digest)
+                if digest in rewards or digest in pending:
+                    continue
+                if reward_cache is not None:
+                    cached = reward_cache.get(cache_key(digest))
+                    if cached is not None:
+                        rewards[digest] = cached
+                        continue
+                chargers_path = Path(
+                    tmp_dir, str(len(pending)), dataset.charger_xml_path.name
+                )
+                chargers_path.parent.mkdir()
+                pending[digest] = builder.write(chargers_path)
+
+            with ThreadPoolExecutor(max_concurrency) as executor:
+                futures = {
+                    executor.submit(
+                        self.get_reward_with_retries,
+                        {"config": dataset.config_path, "chargers": chargers_path},
+                        scenario_hash=scenario_hash,
+                        retries=retries,
+                        backoff=backoff,
+                        stream=True,
+                    ): digest
+                    for digest, chargers_path in pending.items()
+                }
+                errors = []
+                for future in as_completed(futures):
+                    digest = futures[future]
+                    # A failed request does not discard the simulations of
+                    # the others, which are still cached
+                    try:
+                        # Only the rewards in the headers are used, the
+                        # zipped output is not downloaded
+                        with future.result() as response:
+                            message = json.loads(
+                                response.headers["X-Response-Message"]
+                            )
+                        rewards[digest] = parse_rewards(message)
+                    except Exception as error:
+                        errors.append(error)
+                        continue
+                    if reward_cache is not None:
+                        reward_cache.put(cache_key(digest), rewards[digest])
+                if errors:
+                    raise errors[0]
+
+        return [
+            dict(rewards[digest], charger_cost=charger_cost)
+            for digest, charger_cost in zip(digests, charger_costs)
+        ]
+
+    def _is_unknown_scenario(self, response: requests.Response) -> bool:
+        return self.is_unknown_scenario(response.status_code, response.headers)
+
+    def close(self):
+        """
+        Closes the pooled connections.
+        """
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,184 @@
+import json
+import os
+import re
+import shutil
+import socket
+import time
+from pathlib import Path
+
+
+WORKSPACE_ROOT = Path("/tmp")
+MARKER_FILE_NAME = ".rlev_workspace"
+TIME_STRING_PATTERN = re.compile(r"^\d{8}_\d{6}_\d{6}$")
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ScenarioWorkspace:
+    """
+    Private working directory of one env. Instead of copying the scenario
+    folder, every input is linked into the workspace and only the files the
+    env rewrites (config, chargers, and plans/vehicles when a population is
+    generated) are materialized as private files. A marker file records the
+    owning process so orphaned workspaces of crashed workers can be found and
+    removed by ScenarioWorkspace.collect_orphans.
+    """
+
+    def __init__(
+        self,
+        scenario_dir: Path,
+        time_string: str,
+        root: Path = WORKSPACE_ROOT,
+        link_mode: str = "symlink",
+    ):
+        """
+        Creates the workspace root/time_string and links every entry of the
+        scenario folder into it.
+
+        Args:
+            scenario_dir (Path): Folder of the scenario, usually the parent of
+                the config file.
+            time_string (str): Unique name of the workspace directory.
+            root (Path): Directory the workspace is created in. Default is
+                /tmp.
+            link_mode (str): "symlink" or "hardlink". Hardlinks fall back to
+                symlinks across file systems. Default is "symlink".
+        """
+        if link_mode not in ("symlink", "hardlink"):
+            raise ValueError(f"Unknown link mode: {link_mode}")
+
+        self.scenario_dir = Path(scenario_dir).resolve()
+        self.path = Path(root, time_string)
+        self.link_mode = link_mode
+        self.path.mkdir(parents=True)
+
+        with open(Path(self.path, MARKER_FILE_NAME), "w") as f:
+            json.dump(
+                dict(pid=os.getpid(), host=socket.gethostname(), created=time.time()),
+                f,
+            )
+
+        for entry in self.scenario_dir.iterdir():
+            self._link(entry, Path(self.path, entry.name))
+
+    def _link(self, source: Path, target: Path):
+        if self.link_mode == "hardlink" and source.is_file():
+            try:
+                os.link(source, target)
+                return
+            except OSError:
+                pass
+        os.symlink(source, target)
+
+    def file(self, name: str) -> Path:
+        """
+        Returns the path of a file inside the workspace.
+
+        Args:
+            name (str): File name relative to the scenario folder.
+
+        Returns:
+            Path: Path of the file in the workspace.
+        """
+        return Path(self.path, name)
+
+    def materialize(self, name: str, copy: bool = True) -> Path:
+        """
+        Replaces the link to a scenario file by a private file, so that it can
+        be rewritten without touching the scenario folder. Writing to a file
+        that has not been materialized would write through the link.
+
+        Args:
+            name (str): File name relative to the scenario folder.
+            copy (bool): Whether to copy the original contents. Use False for
+                files that are about to be regenerated. Default is True.
+
+        Returns:
+            Path: Path of the private file.
+        """
+        path = self.file(name)
+        source = Path(self.scenario_dir, name)
+        if path.is_symlink() or (path.exists() and os.stat(path).st_nlink > 1):
+            path.unlink()
+            if copy:
+                shutil.copyfile(source, path)
+        elif not path.exists() and copy and source.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(source, path)
+        return path
+
+    def link_file(self, name: str, source: Path) -> Path:
+        """
+        Points a workspace file at an arbitrary existing file, for instance a
+        cached input that is shared between envs.
+
+        Args:
+            name (str): File name relative to the scenario folder.
+            source (Path): File to link to.
+
+        Returns:
+            Path: Path of the file in the workspace.
+        """
+        path = self.file(name)
+        if path.is_symlink() or path.exists():
+            path.unlink()
+        self._link(Path(source).resolve(), path)
+        return path
+
+    def cleanup(self):
+        """
+        Removes the workspace. Links are removed, their targets are not.
+        """
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    @staticmethod
+    def collect_orphans(root: Path = WORKSPACE_ROOT, unmarked_max_age: float = None):
+        """
+        Removes workspaces whose owning process is no longer running on this
+        host.
+
+        Args:
+            root (Path): Directory holding the workspaces. Default is /tmp.
+            unmarked_max_age (float): If given, directories named like a time
+                string that have no marker file, as left behind by older
+                versions which copied the whole scenario, are removed too once
+                they are older than this many seconds.
+
+        Returns:
+            list[Path]: The removed workspaces.
+        """
+        removed = []
+        host = socket.gethostname()
+
+        for path in Path(root).iterdir():
+            if not path.is_dir() or path.is_symlink():
+                continue
+            marker = Path(path, MARKER_FILE_NAME)
+
+            try:
+                if marker.exists():
+                    with open(marker) as f:
+                        owner = json.load(f)
+                    orphaned = owner["host"] == host and not _process_alive(owner["pid"])
+                else:
+                    orphaned = (
+                        unmarked_max_age is not None
+                        and TIME_STRING_PATTERN.match(path.name) is not None
+                        and time.time() - path.stat().st_mtime > unmarked_max_age
+                    )
+            except (OSError, ValueError, KeyError):
+                continue
+
+            if orphaned:
+                shutil.rmtree(path, ignore_errors=True)
+                removed.append(path)
+
+        return removed
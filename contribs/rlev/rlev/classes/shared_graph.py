@@ -0,0 +1,110 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+
+class SharedGraph:
+    """
+    Read-only compiled graph published in shared memory. The parent process
+    publishes the arrays produced by MatsimXMLDataset.graph_bundle once, and
+    the SharedGraph is then pickled into every SubprocVecEnv worker, which
+    attaches to the same segments without copying them. Only the edge
+    attributes, whose charger columns every env mutates, are copied into
+    private memory on attach.
+    """
+
+    PRIVATE_ARRAYS = ("edge_attr",)
+
+    def __init__(self, layout: dict[str, tuple[str, tuple, str]], meta: dict):
+        """
+        Initializes a SharedGraph handle. Use SharedGraph.publish to create
+        one from arrays.
+
+        Args:
+            layout (dict): Array name mapped to (segment name, shape, dtype).
+            meta (dict): Metadata of the compiled graph.
+        """
+        self.layout = layout
+        self.meta = meta
+        self._segments: dict[str, shared_memory.SharedMemory] = {}
+
+    @classmethod
+    def publish(cls, arrays: dict[str, np.ndarray], meta: dict) -> "SharedGraph":
+        """
+        Copies arrays into new shared memory segments.
+
+        Args:
+            arrays (dict[str, np.ndarray]): Arrays of the compiled graph.
+            meta (dict): Metadata of the compiled graph.
+
+        Returns:
+            SharedGraph: Handle owning the new segments.
+        """
+        layout = {}
+        segments = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            segment = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[...] = array
+            layout[name] = (segment.name, array.shape, array.dtype.str)
+            segments[name] = segment
+
+        shared_graph = cls(layout, meta)
+        shared_graph._segments = segments
+        return shared_graph
+
+    def attach(self):
+        """
+        Maps the shared segments into this process.
+
+        Returns:
+            tuple: Dict of arrays and dict of metadata, in the format accepted
+                by MatsimXMLDataset.load_graph_bundle. All arrays except the
+                private ones are views of shared memory and must not be
+                written to.
+        """
+        arrays = {}
+        for name, (segment_name, shape, dtype) in self.layout.items():
+            if name not in self._segments:
+                self._segments[name] = shared_memory.SharedMemory(name=segment_name)
+            array = np.ndarray(shape, dtype=dtype, buffer=self._segments[name].buf)
+            if name in self.PRIVATE_ARRAYS:
+                array = array.copy()
+            arrays[name] = array
+        return arrays, self.meta
+
+    @property
+    def nbytes(self):
+        """
+        Total size of the shared segments in bytes.
+        """
+        return sum(
+            int(np.prod(shape)) * np.dtype(dtype).itemsize
+            for _, shape, dtype in self.layout.values()
+        )
+
+    def close(self):
+        """
+        Detaches this process from the shared segments.
+        """
+        for segment in self._segments.values():
+            segment.close()
+        self._segments = {}
+
+    def unlink(self):
+        """
+        Detaches and frees the shared segments. Must be called once by the
+        publishing process after every worker is done.
+        """
+        for name, (segment_name, _, _) in self.layout.items():
+            segment = self._segments.get(name)
+            if segment is None:
+                segment = shared_memory.SharedMemory(name=segment_name)
+            segment.close()
+            segment.unlink()
+        self._segments = {}
+
+    def __getstate__(self):
+        return dict(layout=self.layout, meta=self.meta)
+
+    def __setstate__(self, state):
+        self.__init__(state["layout"], state["meta"])
@@ -0,0 +1,432 @@
+import sqlite3
+import time
+import numpy as np
+import scipy.linalg
+from pathlib import Path
+from scipy.sparse import csr_matrix, diags, identity
+from rlev.classes.graph_cache import DEFAULT_CACHE_DIR
+
+
+REWARD_KEYS = ("charge_reward", "time_reward")
+# Candidate weights of the local kernel against the share kernel
+LOCAL_WEIGHTS = (0.001, 0.01, 0.1, 0.5, 0.9)
+
+
+class RewardSampleStore:
+    """
+    Persistent record of every charger placement simulated on the reward
+    server together with its rewards, in a SQLite database shared by every
+    process using the same file. Unlike the RewardCache, which only knows
+    placements by their hash, the store keeps the placements themselves so
+    that models can be trained on them.
+    """
+
+    def __init__(self, db_path: Path = None):
+        """
+        Initializes the RewardSampleStore.
+
+        Args:
+            db_path (Path): Path of the SQLite database. Defaults to
+                $RLEV_CACHE_DIR/reward_samples.sqlite or
+                ~/.cache/rlev/reward_samples.sqlite.
+        """
+        self.db_path = Path(db_path or Path(DEFAULT_CACHE_DIR, "reward_samples.sqlite"))
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection: sqlite3.Connection = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """
+        Connection to the database, opened on first use and again after the
+        store was pickled into another process.
+        """
+        if self._connection is None:
+            self._connection = sqlite3.connect(
+                self.db_path, timeout=60, check_same_thread=False
+            )
+            with self._connection:
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS samples ("
+                    "id INTEGER PRIMARY KEY AUTOINCREMENT, scenario TEXT NOT NULL, "
+                    "actions BLOB NOT NULL, charge_reward REAL NOT NULL, "
+                    "time_reward REAL NOT NULL, created REAL NOT NULL)"
+                )
+                self._connection.execute(
+                    "CREATE INDEX IF NOT EXISTS samples_scenario "
+                    "ON samples (scenario, id)"
+                )
+        return self._connection
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        return state
+
+    def add(self, scenario_key: str, actions: np.ndarray, rewards: dict):
+        """
+        Records a simulated placement.
+
+        Args:
+            scenario_key (str): Identifies the scenario and config the
+                placement was simulated in.
+            actions (np.ndarray): Charger type index per link.
+            rewards (dict): Charge reward and time reward.
+        """
+        actions = np.asarray(actions)
+        if actions.size and (actions.min() < 0 or actions.max() > 255):
+            raise ValueError("Charger type indices must be between 0 and 255")
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO samples (scenario, actions, charge_reward, "
+                "time_reward, created) VALUES (?, ?, ?, ?, ?)",
+                (
+                    scenario_key,
+                    actions.astype(np.uint8).tobytes(),
+                    rewards["charge_reward"],
+                    rewards["time_reward"],
+                    time.time(),
+                ),
+            )
+
+    def load(self, scenario_key: str, after_id: int = 0):
+        """
+        Loads the placements recorded for a scenario.
+
+        Args:
+            scenario_key (str): Identifies the scenario, see add.
+            after_id (int): Only load samples recorded after the one with
+                this ID, to pick up new samples incrementally. Default is 0,
+                which loads every sample.
+
+        Returns:
+            tuple[np.ndarray, list[np.ndarray], np.ndarray]: ID of every
+                sample, its charger type index per link, and its charge
+                reward and time reward as one row.
+        """
+        rows = self.connection.execute(
+            "SELECT id, actions, charge_reward, time_reward FROM samples "
+            "WHERE scenario = ? AND id > ? ORDER BY id",
+            (scenario_key, after_id),
+        ).fetchall()
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        actions = [np.frombuffer(row[1], dtype=np.uint8) for row in rows]
+        rewards = np.array([row[2:] for row in rows], dtype=np.float64).reshape(-1, 2)
+        return ids, actions, rewards
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM samples").fetchone()[0]
+
+    def close(self):
+        """
+        Closes the database connection.
+        """
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def propagation_matrix(edge_index: np.ndarray, num_nodes: int) -> csr_matrix:
+    """
+    Builds the symmetrically normalized adjacency matrix with self loops of
+    a graph, D^-1/2 (A + I) D^-1/2, treating its edges as undirected.
+
+    Args:
+        edge_index (np.ndarray): Source and target node of every edge.
+        num_nodes (int): Number of nodes.
+
+    Returns:
+        csr_matrix: The propagation matrix.
+    """
+    adjacency = csr_matrix(
+        (np.ones(edge_index.shape[1]), (edge_index[0], edge_index[1])),
+        shape=(num_nodes, num_nodes),
+    )
+    adjacency = adjacency + adjacency.T + identity(num_nodes, format="csr")
+    adjacency.data[:] = 1.0
+    scale = diags(1.0 / np.sqrt(np.asarray(adjacency.sum(axis=1)).ravel()))
+    return (scale @ adjacency @ scale).tocsr()
+
+
+class SurrogateRewardModel:
+    """
+    Learns the rewards of charger placements from the simulated ones in a
+    RewardSampleStore, so that most placements can be answered without the
+    reward server. A placement is described by the one-hot charger types of
+    the line graph nodes, propagated over the line graph for a few hops like
+    a simplified graph convolution, so that a charger also informs about
+    its neighbors. A Gaussian process predicts every reward together with
+    its uncertainty. Its kernel adds a linear kernel on these features,
+    which is Bayesian linear regression on where chargers are, to a
+    quadratic kernel on the share of links with every charger type, which
+    captures how rewards saturate as chargers are added. How much each
+    kernel contributes is chosen by the marginal likelihood of the samples
+    at every refit.
+
+    Placements are worth simulating while the model has seen few samples,
+    when its prediction is uncertain, or when the prediction could beat the
+    best reward so far. Samples recorded by other envs sharing the store
+    are picked up whenever the model is refit.
+    """
+
+    def __init__(
+        self,
+        linegraph_edge_index: np.ndarray,
+        num_nodes: int,
+        num_charger_types: int,
+        scenario_key: str,
+        sample_store: RewardSampleStore = None,
+        hops: int = 2,
+        noise_ratio: float = 0.01,
+        min_samples: int = 32,
+        uncertainty_threshold: float = 0.02,
+        exploration: float = 1.0,
+        refit_interval: int = 8,
+    ):
+        """
+        Initializes the SurrogateRewardModel.
+
+        Args:
+            linegraph_edge_index (np.ndarray): Edges of the line graph.
+            num_nodes (int): Number of line graph nodes, the length of the
+                action space.
+            num_charger_types (int): Number of charger types, including the
+                one meaning no charger at index 0.
+            scenario_key (str): Identifies the scenario in the sample store.
+            sample_store (RewardSampleStore): Store of the simulated samples.
+                Default is None, which opens the default store.
+            hops (int): Number of times the charger features are propagated
+                over the line graph. Default is 2.
+            noise_ratio (float): Variance of the simulated rewards around
+                the model, relative to the variance of the rewards. Default is
+                0.01.
+            min_samples (int): Number of samples simulated before any
+                prediction is trusted. Default is 32.
+            uncertainty_threshold (float): Standard deviation of a predicted
+                reward above which the placement is simulated. Default is
+                0.02.
+            exploration (float): Number of standard deviations added to a
+                predicted reward to decide if it could beat the best reward.
+                Default is 1.
+            refit_interval (int): Number of new samples after which the model
+                is refit. Default is 8.
+        """
+        self.num_nodes = num_nodes
+        self.num_charger_types = num_charger_types
+        self.scenario_key = scenario_key
+        self.sample_store = sample_store or RewardSampleStore()
+        self.hops = hops
+        self.noise_ratio = noise_ratio
+        self.min_samples = min_samples
+        self.uncertainty_threshold = uncertainty_threshold
+        self.exploration = exploration
+        self.refit_interval = refit_interval
+        self.propagation = propagation_matrix(
+            np.asarray(linegraph_edge_index), num_nodes
+        )
+        self._reset_fit()
+
+    def _reset_fit(self):
+        self._last_id = 0
+        self._features = np.zeros((0, self.num_features), dtype=np.float32)
+        self._shares = np.zeros((0, self.num_charger_types - 1))
+        self._rewards = np.zeros((0, len(REWARD_KEYS)))
+        self._gram = np.zeros((0, 0))
+        self._fit = None
+        self._pending = 0
+
+    def __getstate__(self):
+        # The fitted state can be large and is rebuilt from the store
+        state = self.__dict__.copy()
+        for key in ("_features", "_shares", "_rewards", "_gram", "_fit"):
+            state.pop(key)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset_fit()
+
+    @property
+    def num_features(self) -> int:
+        return (self.hops + 1) * self.num_nodes * (self.num_charger_types - 1)
+
+    @property
+    def num_samples(self) -> int:
+        return len(self._rewards)
+
+    def features(self, actions: list[np.ndarray]) -> np.ndarray:
+        """
+        Computes the features of placements.
+
+        Args:
+            actions (list[np.ndarray]): Charger type index per link of every
+                placement. Links beyond the line graph nodes are ignored.
+
+        Returns:
+            np.ndarray: One row of features per placement.
+        """
+        actions = np.stack([np.asarray(a)[: self.num_nodes] for a in actions])
+        types = np.arange(1, self.num_charger_types)
+        # Nodes as rows and (placement, charger type) as columns
+        signal = (actions.T[:, :, None] == types).reshape(self.num_nodes, -1)
+        signal = signal.astype(np.float32)
+        blocks = [signal]
+        for _ in range(self.hops):
+            blocks.append(self.propagation @ blocks[-1])
+        features = np.stack(blocks).reshape(
+            self.hops + 1, self.num_nodes, len(actions), len(types)
+        )
+        return (
+            features.transpose(2, 0, 1, 3)
+            .reshape(len(actions), -1)
+            .astype(np.float32, copy=False)
+        )
+
+    def shares(self, actions: list[np.ndarray]) -> np.ndarray:
+        """
+        Computes the share of line graph nodes with every charger type.
+
+        Args:
+            actions (list[np.ndarray]): Charger type index per link of every
+                placement.
+
+        Returns:
+            np.ndarray: One row of shares per placement.
+        """
+        actions = np.stack([np.asarray(a)[: self.num_nodes] for a in actions])
+        types = np.arange(1, self.num_charger_types)
+        return (actions[:, :, None] == types).mean(axis=1)
+
+    def _kernel(self, features, shares, other_features, other_shares):
+        fit = self._fit
+        local = (features @ other_features.T) / fit["scale"]
+        share = (1 + (shares @ other_shares.T) / fit["share_scale"]) ** 2 / 4
+        return fit["local_weight"] * local + (1 - fit["local_weight"]) * share
+
+    def add_sample(self, actions: np.ndarray, rewards: dict):
+        """
+        Records a simulated placement in the sample store, to be learned at
+        the next refit.
+
+        Args:
+            actions (np.ndarray): Charger type index per link.
+            rewards (dict): Charge reward and time reward.
+        """
+        self.sample_store.add(self.scenario_key, actions, rewards)
+        self._pending += 1
+
+    def refit(self):
+        """
+        Loads the samples recorded since the last fit, from this model and
+        any other sharing the store, and fits the model to every sample.
+        """
+        self._pending = 0
+        ids, actions, rewards = self.sample_store.load(
+            self.scenario_key, self._last_id
+        )
+        if len(ids) == 0:
+            return
+        self._last_id = int(ids[-1])
+        new_features = self.features(actions)
+        cross = new_features @ self._features.T
+        self._gram = np.block(
+            [
+                [self._gram, cross.T],
+                [cross, new_features @ new_features.T],
+            ]
+        ).astype(np.float64)
+        self._features = np.concatenate([self._features, new_features])
+        self._shares = np.concatenate([self._shares, self.shares(actions)])
+        self._rewards = np.concatenate([self._rewards, rewards])
+
+        # Scale both kernels so that a typical placement has unit variance
+        share_gram = self._shares @ self._shares.T
+        self._fit = dict(
+            scale=max(float(np.mean(np.diag(self._gram))), 1e-12),
+            share_scale=max(float(np.mean(np.diag(share_gram))), 1e-12),
+            mean=self._rewards.mean(axis=0),
+            variance=np.maximum(self._rewards.var(axis=0), 1e-12),
+        )
+        fit = self._fit
+        local_gram = self._gram / fit["scale"]
+        share_gram = (1 + share_gram / fit["share_scale"]) ** 2 / 4
+        targets = (self._rewards - fit["mean"]) / np.sqrt(fit["variance"])
+        best = -np.inf
+        for local_weight in LOCAL_WEIGHTS:
+            gram = local_weight * local_gram + (1 - local_weight) * share_gram
+            cholesky = scipy.linalg.cho_factor(
+                gram + self.noise_ratio * np.eye(self.num_samples)
+            )
+            weights = scipy.linalg.cho_solve(cholesky, targets)
+            # Log marginal likelihood of the standardized rewards up to a
+            # constant, summed over the rewards
+            log_det = 2 * np.sum(np.log(np.diag(cholesky[0])))
+            likelihood = -0.5 * (np.sum(targets * weights) + targets.shape[1] * log_det)
+            if likelihood > best:
+                best = likelihood
+                fit["local_weight"] = local_weight
+                fit["cholesky"] = cholesky
+        fit["weights"] = scipy.linalg.cho_solve(
+            fit["cholesky"], self._rewards - fit["mean"]
+        )
+
+    def predict(self, actions: np.ndarray) -> tuple[dict, dict]:
+        """
+        Predicts the rewards of a placement, refitting the model first if
+        enough new samples were recorded.
+
+        Args:
+            actions (np.ndarray): Charger type index per link.
+
+        Returns:
+            tuple[dict, dict]: Predicted charge reward and time reward, and
+                the standard deviation of each prediction. Without any
+                sample the predictions are 0 with infinite deviation.
+        """
+        if self._fit is None or self._pending >= self.refit_interval:
+            self.refit()
+        if self._fit is None:
+            return (
+                dict.fromkeys(REWARD_KEYS, 0.0),
+                dict.fromkeys(REWARD_KEYS, np.inf),
+            )
+
+        fit = self._fit
+        features = self.features([actions])
+        shares = self.shares([actions])
+        kernel = self._kernel(self._features, self._shares, features, shares)[:, 0]
+        prior = float(self._kernel(features, shares, features, shares)[0, 0])
+        mean = fit["mean"] + kernel @ fit["weights"]
+        explained = kernel @ scipy.linalg.cho_solve(fit["cholesky"], kernel)
+        std = np.sqrt(fit["variance"] * max(prior - explained, 0.0))
+        return (
+            dict(zip(REWARD_KEYS, mean.tolist())),
+            dict(zip(REWARD_KEYS, std.tolist())),
+        )
+
+    def should_simulate(
+        self, predicted_reward: float, reward_std: float, best_reward: float
+    ) -> bool:
+        """
+        Decides if a placement is worth simulating.
+
+        Args:
+            predicted_reward (float): Predicted reward of the placement.
+            reward_std (float): Standard deviation of the prediction.
+            best_reward (float): Best reward found so far.
+
+        Returns:
+            bool: Whether the placement is too little known, too uncertain or
+                promising enough to simulate.
+        """
+        if self.num_samples + self._pending < self.min_samples:
+            return True
+        if reward_std > self.uncertainty_threshold:
+            return True
+        return predicted_reward + self.exploration * reward_std > best_reward
+
+    def close(self):
+        """
+        Closes the sample store.
+        """
+        self.sample_store.close()
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+from concurrent.futures import as_completed
+from typing import Callable, Iterator
+import gymnasium as gym
+import numpy as np
+from stable_baselines3.common.vec_env import DummyVecEnv
+from rlev.classes.async_reward_client import AsyncRewardClient
+
+
+class AsyncMatsimVecEnv(DummyVecEnv):
+    """
+    Vectorized environment stepping every MatsimGraphEnv of one process
+    concurrently. The reward requests of a step are sent at once through a
+    shared AsyncRewardClient, from an event loop running in a background
+    thread, so one process keeps as many simulations in flight as it has
+    envs instead of one per SubprocVecEnv worker. Steps are finished in the
+    order their simulations complete.
+
+    Steps run on the event loop thread, which has the envs to itself
+    between step_async and step_wait.
+    """
+
+    def __init__(
+        self,
+        env_fns: list[Callable[[], gym.Env]],
+        reward_client: AsyncRewardClient = None,
+    ):
+        """
+        Initializes the AsyncMatsimVecEnv.
+
+        Args:
+            env_fns (list[Callable[[], gym.Env]]): Functions creating the
+                MatsimGraphEnv instances, possibly wrapped.
+            reward_client (AsyncRewardClient): Client shared by the envs.
+                Default is None, which creates one with a connection per env.
+        """
+        super().__init__(env_fns)
+        if reward_client is None:
+            reward_client = AsyncRewardClient(max_connections=self.num_envs)
+        self.reward_client = reward_client
+        self.loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._loop_thread.start()
+        self._futures = None
+
+    def step_async(self, actions: np.ndarray) -> None:
+        self.actions = actions
+        self._futures = {
+            asyncio.run_coroutine_threadsafe(
+                env.unwrapped.async_step(env_actions, self.reward_client),
+                self.loop,
+            ): env_idx
+            for env_idx, (env, env_actions) in enumerate(zip(self.envs, actions))
+        }
+
+    def step_as_completed(self) -> Iterator[int]:
+        """
+        Finishes the steps sent by step_async in the order their simulations
+        complete. Once an env's index is yielded, its observation, reward,
+        done flag and info are in the buffers of the vectorized env.
+
+        Yields:
+            int: Index of the env whose step completed.
+        """
+        futures, self._futures = self._futures, None
+        for future in as_completed(futures):
+            env_idx = futures[future]
+            obs, self.buf_rews[env_idx], terminated, truncated, info = (
+                future.result()
+            )
+            self.buf_dones[env_idx] = terminated or truncated
+            info["TimeLimit.truncated"] = truncated and not terminated
+            if self.buf_dones[env_idx]:
+                info["terminal_observation"] = obs
+                obs, self.reset_infos[env_idx] = self.envs[env_idx].reset()
+            self.buf_infos[env_idx] = info
+            self._save_obs(env_idx, obs)
+            yield env_idx
+
+    def step_wait(self):
+        for _ in self.step_as_completed():
+            pass
+        # The infos are fresh dicts of every step, which are not copied
+        return (
+            self._obs_from_buf(),
+            np.copy(self.buf_rews),
+            np.copy(self.buf_dones),
+            list(self.buf_infos),
+        )
+
+    def close(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.reward_client.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._loop_thread.join()
+        self.loop.close()
+        super().close()
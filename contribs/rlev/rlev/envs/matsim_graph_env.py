@@ -1,27 +1,58 @@
 import gymnasium as gym
+import math
 import numpy as np
-import shutil
 import torch
-import requests
 import json
-import zipfile
 import pandas as pd
 from abc import abstractmethod
 from gymnasium import spaces
+from rlev.classes.analytic_reward import AnalyticRewardModel
 from rlev.classes.matsim_xml_dataset import MatsimXMLDataset
+from rlev.classes.multi_fidelity import ScreeningPolicy
+from rlev.classes.output_archiver import (
+    OutputArchiver,
+    stream_to_file,
+    stream_to_file_async,
+)
+from rlev.classes.reward_cache import RewardCache
+from rlev.classes.reward_client import RewardClient, parse_rewards
+from rlev.classes.shared_graph import SharedGraph
+from rlev.classes.surrogate_reward import RewardSampleStore, SurrogateRewardModel
 from datetime import datetime
 from pathlib import Path
 from rlev.classes.chargers import Charger, StaticCharger, NoneCharger, DynamicCharger
+from rlev.scripts.util import hash_config
 from typing import List
-from filelock import FileLock
-from rlev.scripts.create_chargers import create_chargers_xml_gymnasium
 
 class MatsimGraphEnv(gym.Env):
     """
     A custom Gymnasium environment for Matsim graph-based simulations.
     """
 
-    def __init__(self, config_path, num_agents=100, save_dir=None):
+    default_charger_list: List[Charger] = [
+        NoneCharger,
+        DynamicCharger,
+        StaticCharger,
+    ]
+
+    def __init__(
+        self,
+        config_path,
+        num_agents=100,
+        save_dir=None,
+        shared_graph=None,
+        gzip_inputs=False,
+        population_seed=None,
+        use_reward_cache=True,
+        output_members=None,
+        reward_mode="server",
+        simulation_budget=None,
+        screening_fraction=None,
+        screening_threshold=None,
+        screening_quantile=0.9,
+        population_cache_dir=None,
+        snap_to_links=False,
+    ):
         """
         Initialize the environment.
 
@@ -29,8 +60,52 @@ class MatsimGraphEnv(gym.Env):
             config_path (str): Path to the configuration file.
             num_agents (int): Number of agents in the environment.
             save_dir (str): Directory to save outputs.
+            shared_graph (SharedGraph): Compiled graph published in shared
+                memory by the parent process, if any.
+            gzip_inputs (bool): Whether to write the generated plans, vehicles
+                and chargers as .xml.gz, which the reward server accepts as
+                is, to shrink the upload of every step.
+            population_seed (int): Seed of the generated population. Envs
+                with the same seed share one cached population instead of
+                each generating their own. Default is None, which generates
+                a different population for every env.
+            use_reward_cache (bool): Whether to look charger placements up
+                in the persistent reward cache before simulating them, and
+                store the rewards of new ones there. Default is True.
+            output_members (list[str]): Glob patterns of the members of
+                saved server outputs to extract, such as "scorestats.csv".
+                Default is None, which extracts everything.
+            reward_mode (str): "server" to simulate charger placements on
+                the reward server, "analytic" to estimate their rewards
+                in milliseconds with an AnalyticRewardModel of the scenario,
+                for instance to pretrain or pre-screen policies, or
+                "surrogate" to answer most steps with a SurrogateRewardModel
+                learned from the simulated placements and only simulate the
+                uncertain or promising ones. Default is "server".
+            simulation_budget (int): Number of placements the env simulates
+                at most in surrogate mode, after which every step is answered
+                by the surrogate. Default is None, which lets the surrogate
+                decide alone.
+            screening_fraction (float): Share of the population to simulate
+                every placement with first, see
+                MatsimXMLDataset.sample_scenario. Only placements promoted by
+                a ScreeningPolicy are simulated again with the full
+                population. Default is None, which simulates every placement
+                with the full population.
+            screening_threshold (float): Screened reward from which
+                placements are promoted. Default is None.
+            screening_quantile (float): Quantile of the screened rewards
+                from which placements are promoted. Default is 0.9.
+            population_cache_dir (Path): Directory of the population cache
+                the population is shared through. Default is None, which
+                uses the persistent PopulationCache default directory.
+            snap_to_links (bool): Whether to write the nearest link of every
+                activity into the generated plans, see MatsimXMLDataset.
+                Default is False, which leaves snapping to MATSim.
         """
         super().__init__()
+        if reward_mode not in ("server", "analytic", "surrogate"):
+            raise ValueError(f"Unknown reward mode: {reward_mode}")
         self.save_dir = save_dir
         current_time = datetime.now()
         self.time_string = current_time.strftime("%Y%m%d_%H%M%S_%f")
@@ -40,21 +115,26 @@ class MatsimGraphEnv(gym.Env):
 
         # Initialize the dataset with custom variables
         self.config_path: Path = Path(config_path)
-        self.charger_list: List[Charger] = [
-            NoneCharger,
-            DynamicCharger,
-            StaticCharger,
-        ]
+        self.charger_list: List[Charger] = list(self.default_charger_list)
         self.dataset = MatsimXMLDataset(
             self.config_path,
             self.time_string,
             self.charger_list,
             num_agents=self.num_agents,
             initial_soc=0.5,
+            shared_graph=shared_graph,
+            gzip_inputs=gzip_inputs,
+            population_seed=population_seed,
+            population_cache_dir=population_cache_dir,
+            snap_to_links=snap_to_links,
         )
         self.num_links_reward_scale = -100
         self.reward: float = 0
+        # Only simulated rewards can be the best, predicted ones are tracked
+        # apart since their placements have no output to save
         self.best_reward = -np.inf
+        self.best_predicted_reward = -np.inf
+        self._is_best = False
         self.num_charger_types: int = len(self.charger_list)
 
         # Define action and observation space
@@ -78,105 +158,622 @@ class MatsimGraphEnv(gym.Env):
         )
         self.done: bool = False
         self.lock_file = Path(self.save_dir, "lockfile.lock")
-        self.best_output_response = None
+        # Zipped output of the best reward, spooled to the workspace
+        self.best_output_path = None
+        self.output_archiver = OutputArchiver(output_members)
+        self._num_spooled_outputs = 0
         self._charger_efficiency = 0
+        # Digest of the last charger set sent to the server and the rewards
+        # it returned, an unchanged charger set is not sent again
+        self._last_charger_digest = None
+        self._last_server_rewards = None
+        # Whether the rewards of the last step, and of the last charger set
+        # sent to the server, were predicted instead of simulated
+        self._rewards_predicted = False
+        self._last_rewards_predicted = False
+        self.reward_client = RewardClient()
+        self.reward_cache = RewardCache() if use_reward_cache else None
+        self.scenario_hash = None
+        self.config_hash = None
+        self.reward_mode = reward_mode
+        # Simulated placements are recorded to learn the surrogate from
+        self.sample_store = RewardSampleStore() if reward_mode == "surrogate" else None
+        self.sample_key = None
+        self.surrogate = None
+        self.simulation_budget = simulation_budget
+        self.num_simulations = 0
+        self.num_surrogate_steps = 0
+        # Low fidelity variant of the scenario, created with the scenario hash
+        self.screening_fraction = screening_fraction
+        self.population_cache_dir = population_cache_dir
+        self.screening = None
+        self.screening_policy = (
+            ScreeningPolicy(screening_threshold, screening_quantile)
+            if screening_fraction is not None
+            else None
+        )
+        self.num_screenings = 0
+        self.num_promotions = 0
+        self.reward_model = (
+            AnalyticRewardModel.from_dataset(self.dataset)
+            if reward_mode == "analytic"
+            else None
+        )
 
-    def save_server_output(self, response, filetype):
+    @classmethod
+    def publish_shared_graph(cls, config_path) -> SharedGraph:
         """
-        Save server output to a zip file and extract its contents.
+        Compiles the network of a scenario once and publishes it in shared
+        memory, so that envs created in worker processes can attach to it
+        instead of each building a private copy.
 
         Args:
-            response (requests.Response): Server response object.
+            config_path (str): Path to the configuration file.
+
+        Returns:
+            SharedGraph: The published graph, the caller must unlink it once
+                every env is closed.
+        """
+        time_string = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        dataset = MatsimXMLDataset(
+            Path(config_path), time_string, list(cls.default_charger_list), num_agents=None
+        )
+        shared_graph = SharedGraph.publish(*dataset.graph_bundle())
+        dataset.workspace.cleanup()
+        return shared_graph
+
+    def save_server_output(self, output, filetype):
+        """
+        Saves a zipped server output to the save directory and extracts the
+        requested members, in a background thread.
+
+        Args:
+            output (Path | requests.Response): Zipped output spooled by
+                spool_server_output, or a response whose body is spooled
+                first. None if there is no output to save, for instance
+                because the rewards came from the reward cache.
             filetype (str): Type of file to save.
+
+        Returns:
+            Future | None: Future of the names of the extracted members.
+        """
+        if output is None:
+            return None
+        if not isinstance(output, Path):
+            output = self.spool_server_output(output)
+
+        return self.output_archiver.submit(
+            output,
+            Path(self.save_dir, f"{filetype}.zip"),
+            Path(self.save_dir, filetype),
+            # Envs in other processes save to the same files
+            self.lock_file,
+        )
+
+    def spool_server_output(self, response):
+        """
+        Streams the zipped output in the body of a response to a file in the
+        workspace, without holding it in memory.
+
+        Args:
+            response (requests.Response): Server response opened with
+                stream=True.
+
+        Returns:
+            Path: Path of the zipped output.
         """
-        zip_filename = Path(self.save_dir, f"{filetype}.zip")
-        extract_folder = Path(self.save_dir, filetype)
+        return stream_to_file(response, self._spool_path())
 
-        # Use a lock to prevent simultaneous access
-        lock = FileLock(self.lock_file)
+    def _spool_path(self):
+        self._num_spooled_outputs += 1
+        output_name = f"output-{self._num_spooled_outputs}.zip"
+        return Path(self.dataset.workspace.path, output_name)
 
-        with lock:
-            # Save the zip file
-            with open(zip_filename, "wb") as f:
-                f.write(response.content)
+    def keep_server_output(self, response, is_best):
+        """
+        Downloads the zipped output of a response when it is needed, which
+        is for the initial output of the scenario and for a new best reward.
+        Otherwise the response is closed without downloading its body.
 
-            print(f"Saved zip file: {zip_filename}")
+        Args:
+            response (requests.Response): Server response of the step, None
+                if the rewards were not simulated in this step.
+            is_best (bool): Whether the step reached a new best reward.
+        """
+        filetype = self._kept_output_filetype(response, is_best)
+        if filetype is not None:
+            self._store_server_output(
+                self.spool_server_output(response), filetype, is_best
+            )
 
-            # Extract the zip file
-            with zipfile.ZipFile(zip_filename, "r") as zip_ref:
-                zip_ref.extractall(extract_folder)
+    async def keep_server_output_async(self, response, is_best):
+        """
+        Coroutine version of keep_server_output for the responses of
+        AsyncRewardClient, which downloads a kept output in chunks as it
+        arrives.
 
-            print(f"Extracted files to: {extract_folder}")
+        Args:
+            response (RewardResponse): Server response of the step, None if
+                the rewards were not simulated in this step.
+            is_best (bool): Whether the step reached a new best reward.
+        """
+        filetype = self._kept_output_filetype(response, is_best)
+        if filetype is not None:
+            output_path = await stream_to_file_async(response, self._spool_path())
+            self._store_server_output(output_path, filetype, is_best)
+
+    def _kept_output_filetype(self, response, is_best):
+        # Drops the output of the previous best and closes the response if
+        # its output is not needed, returns its filetype otherwise
+        if is_best and self.best_output_path is not None:
+            self.output_archiver.remove(self.best_output_path)
+            self.best_output_path = None
+        if response is None:
+            return None
+
+        filetype = json.loads(response.headers["X-Response-Message"])["filetype"]
+        if not is_best and filetype != "initialoutput":
+            response.close()
+            return None
+        return filetype
+
+    def _store_server_output(self, output_path, filetype, is_best):
+        if filetype == "initialoutput":
+            self.save_server_output(output_path, filetype)
+        if is_best:
+            self.best_output_path = output_path
+        else:
+            self.output_archiver.remove(output_path)
 
     def send_reward_request(self, actions):
         """
         Send a reward request to the server and process the response.
 
+        Args:
+            actions (np.ndarray): Charger type index per link.
+
         Returns:
-            tuple: Reward value and server response.
+            float: Reward of the actions.
         """
+        rewards = self.lookup_rewards(actions)
+        response = None
+        if rewards is None and self.screening is not None:
+            rewards = self.lookup_screening_rewards()
+            if rewards is None:
+                rewards, screening_response = self.request_rewards(self.screening)
+                self.keep_server_output(screening_response, False)
+                self.store_screening_rewards(rewards)
+            rewards = self.screen(rewards)
+        if rewards is None:
+            rewards, response = self.request_rewards()
+            self.store_rewards(rewards)
+        reward = self.compute_reward(rewards)
+        self.keep_server_output(response, self._is_best)
+        return reward
 
-        create_chargers_xml_gymnasium(
-            self.dataset.charger_xml_path,
-            self.charger_list,
-            actions,
-            self.dataset.edge_mapping,
-        )
-        
-        url = "http://localhost:8000/getReward"
-        files = {
-            "config": open(self.dataset.config_path, "rb"),
-            "network": open(self.dataset.network_xml_path, "rb"),
-            "plans": open(self.dataset.plan_xml_path, "rb"),
-            "vehicles": open(self.dataset.vehicle_xml_path, "rb"),
-            "chargers": open(self.dataset.charger_xml_path, "rb"),
-            "counts": open(self.dataset.counts_xml_path, "rb"),
-            "consumption_map": open(self.dataset.consumption_map_path, "rb"),
-        }
-        response = requests.post(
-            url, params={"folder_name": self.time_string}, files=files
+    async def send_reward_request_async(self, actions, reward_client):
+        """
+        Coroutine version of send_reward_request, which awaits the server
+        response instead of blocking on it.
+
+        Args:
+            actions (np.ndarray): Charger type index per link.
+            reward_client (AsyncRewardClient): Client to send the request
+                with, usually shared by every env of the process.
+
+        Returns:
+            float: Reward of the actions.
+        """
+        rewards = self.lookup_rewards(actions)
+        response = None
+        if rewards is None and self.screening is not None:
+            rewards = self.lookup_screening_rewards()
+            if rewards is None:
+                self.dataset.write_charger_xml()
+                screening_response = await reward_client.get_reward(
+                    **self.reward_request(reward_client, self.screening)
+                )
+                rewards = self.parse_reward_response(screening_response)
+                await self.keep_server_output_async(screening_response, False)
+                self.store_screening_rewards(rewards)
+            rewards = self.screen(rewards)
+        if rewards is None:
+            self.dataset.write_charger_xml()
+            response = await reward_client.get_reward(
+                **self.reward_request(reward_client)
+            )
+            rewards = self.parse_reward_response(response)
+            self.store_rewards(rewards)
+        reward = self.compute_reward(rewards)
+        await self.keep_server_output_async(response, self._is_best)
+        return reward
+
+    def lookup_rewards(self, actions):
+        """
+        Applies the actions and looks their full scale rewards up without
+        simulating them, first in the rewards of the last step, then in the
+        reward cache and in surrogate mode from the surrogate model. In analytic
+        reward mode the rewards are estimated instead and nothing is ever
+        simulated, the estimates then count as simulated rewards.
+
+        Args:
+            actions (np.ndarray): Charger type index per link.
+
+        Returns:
+            dict | None: Charge reward and time reward of the actions, or
+                None if they have to be simulated.
+        """
+        self.dataset.apply_actions(actions)
+        self._rewards_predicted = False
+        if self.reward_model is not None:
+            return self.reward_model.evaluate(self.dataset.applied_actions)
+
+        charger_digest = self.dataset.chargers_xml.digest
+        if charger_digest == self._last_charger_digest:
+            self._rewards_predicted = self._last_rewards_predicted
+            return self._last_server_rewards
+
+        # The static files are uploaded once, every step only sends the
+        # config and the chargers
+        if self.scenario_hash is None:
+            self.scenario_hash = self.reward_client.register_scenario(
+                self.dataset.scenario_files()
+            )
+            self.config_hash = hash_config(self.dataset.config_path)
+            # Samples of other servers, such as stubs, are kept apart
+            self.sample_key = (
+                f"{self.reward_client.base_url}:{self.scenario_hash}:{self.config_hash}"
+            )
+            if self.reward_mode == "surrogate":
+                self.surrogate = SurrogateRewardModel(
+                    self.dataset.linegraph.edge_index.numpy(),
+                    self.dataset.linegraph.num_nodes,
+                    self.num_charger_types,
+                    self.sample_key,
+                    self.sample_store,
+                )
+            if self.screening_policy is not None:
+                self.screening = self.dataset.sample_scenario(
+                    self.screening_fraction,
+                    population_cache_dir=self.population_cache_dir,
+                )
+                self.screening.scenario_hash = self.reward_client.register_scenario(
+                    self.screening.files
+                )
+                self.screening.config_hash = hash_config(self.screening.config_path)
+
+        rewards = None
+        if self.reward_cache is not None:
+            rewards = self.reward_cache.get(self._reward_cache_key(charger_digest))
+            if rewards is not None:
+                self._last_charger_digest = charger_digest
+                self._last_server_rewards = rewards
+                self._last_rewards_predicted = False
+        if rewards is None and self.surrogate is not None:
+            rewards = self.surrogate_rewards()
+        return rewards
+
+    def surrogate_rewards(self):
+        """
+        Predicts the rewards of the last applied actions with the surrogate
+        model, unless they are uncertain or promising enough to be simulated
+        and the simulation budget allows it.
+
+        Returns:
+            dict | None: Predicted charge reward and time reward, or None if
+                the actions have to be simulated.
+        """
+        rewards, std = self.surrogate.predict(self.dataset.applied_actions)
+        if (
+            self.simulation_budget is None
+            or self.num_simulations < self.simulation_budget
+        ) and self.surrogate.should_simulate(
+            self.reward_of(rewards),
+            math.hypot(std["charge_reward"], std["time_reward"]),
+            self.best_reward,
+        ):
+            return None
+        self.num_surrogate_steps += 1
+        self._rewards_predicted = True
+        return rewards
+
+    def lookup_screening_rewards(self):
+        """
+        Looks the rewards of the last applied actions on the population
+        sample up in the reward cache.
+
+        Returns:
+            dict | None: Screened charge reward and time reward, or None if
+                they have to be simulated.
+        """
+        if self.reward_cache is None:
+            return None
+        return self.reward_cache.get(
+            self._reward_cache_key(self.dataset.chargers_xml.digest, self.screening)
         )
-        json_response = json.loads(response.headers["X-response-message"])
-        charge_reward = float(json_response["charge_reward"])
-        time_reward = float(json_response["time_reward"])
 
-        self._charger_efficiency = charge_reward
-        self._time_efficiency = time_reward
+    def store_screening_rewards(self, rewards):
+        """
+        Stores the rewards of the last applied actions simulated on the
+        population sample in the reward cache.
 
-        filetype = json_response["filetype"]
+        Args:
+            rewards (dict): Screened charge reward and time reward.
+        """
+        self.num_screenings += 1
+        if self.reward_cache is not None:
+            self.reward_cache.put(
+                self._reward_cache_key(
+                    self.dataset.chargers_xml.digest, self.screening
+                ),
+                rewards,
+            )
 
-        if filetype == "initialoutput":
-            self.save_server_output(response, filetype)
+    def screen(self, rewards):
+        """
+        Decides with the screening policy if the last applied actions are
+        simulated again at full scale.
+
+        Args:
+            rewards (dict): Screened charge reward and time reward.
+
+        Returns:
+            dict | None: The screened rewards, or None if the actions have
+                to be simulated at full scale.
+        """
+        if self.screening_policy.should_promote(
+            self.reward_of(rewards), self.best_reward
+        ):
+            self.num_promotions += 1
+            return None
+        self._last_charger_digest = self.dataset.chargers_xml.digest
+        self._last_server_rewards = rewards
+        self._last_rewards_predicted = True
+        self._rewards_predicted = True
+        return rewards
+
+    def store_rewards(self, rewards):
+        """
+        Stores the simulated rewards of the last applied actions in the
+        reward cache and, in surrogate mode, the sample store, and remembers
+        them for the next step.
+
+        Args:
+            rewards (dict): Charge reward and time reward.
+        """
+        charger_digest = self.dataset.chargers_xml.digest
+        if self.reward_cache is not None:
+            self.reward_cache.put(self._reward_cache_key(charger_digest), rewards)
+        self.num_simulations += 1
+        actions = self.dataset.applied_actions
+        if self.surrogate is not None:
+            self.surrogate.add_sample(actions, rewards)
+        self._last_charger_digest = charger_digest
+        self._last_server_rewards = rewards
+        self._last_rewards_predicted = False
+        self._rewards_predicted = False
 
-        charger_cost = self.dataset.parse_charger_network_get_charger_cost().item()
-        self._charger_cost = charger_cost
+    def _reward_cache_key(self, charger_digest, scenario=None):
+        if scenario is not None:
+            return self.reward_cache.key(
+                scenario.scenario_hash, charger_digest, config=scenario.config_hash
+            )
+        return self.reward_cache.key(
+            self.scenario_hash, charger_digest, config=self.config_hash
+        )
 
-        charger_cost_reward = charger_cost / self.dataset.max_charger_cost
-        reward = (charge_reward - time_reward - charger_cost_reward)
+    def compute_reward(self, rewards):
+        """
+        Combines the rewards of the last applied actions into the reward of
+        the step and keeps track of the best one. Rewards predicted by the
+        surrogate model or screened on the population sample are tracked
+        apart from the simulated ones, they never replace the best reward.
+        The caller keeps the output of the step if it reached a new best.
 
-        if reward > self.best_reward:
-            self.best_reward = reward
-            self.best_output_response = response
+        Args:
+            rewards (dict): Charge reward and time reward.
+
+        Returns:
+            float: Reward of the step.
+        """
+        self._charger_efficiency = rewards["charge_reward"]
+        self._time_efficiency = rewards["time_reward"]
+        self._charger_cost = self.dataset.charger_cost
+        reward = self.reward_of(rewards)
+
+        if self._rewards_predicted:
+            is_best = False
+            self.best_predicted_reward = max(self.best_predicted_reward, reward)
+        else:
+            is_best = reward > self.best_reward
+            if is_best:
+                self.best_reward = reward
+        self._is_best = is_best
 
         self._reward = reward
         
         return reward
 
+    def reward_of(self, rewards):
+        """
+        Combines the rewards of the last applied actions with the cost of
+        their chargers.
+
+        Args:
+            rewards (dict): Charge reward and time reward.
+
+        Returns:
+            float: Reward of the actions.
+        """
+        charger_cost_reward = self.dataset.charger_cost / self.dataset.max_charger_cost
+        return rewards["charge_reward"] - rewards["time_reward"] - charger_cost_reward
+
+    def reward_request(self, reward_client, scenario=None):
+        """
+        Returns the arguments of the reward request of the last written
+        chargers.
+
+        Args:
+            reward_client (BaseRewardClient): Client the request is sent
+                with, which has to know the scenario.
+            scenario (ScenarioSample): Population sample to simulate the
+                chargers with. Default is None, which simulates them at full
+                scale.
+
+        Returns:
+            dict: Keyword arguments of get_reward.
+        """
+        if scenario is not None:
+            if scenario.scenario_hash not in reward_client.scenarios:
+                reward_client.register_scenario(scenario.files)
+            return dict(
+                files={
+                    "config": scenario.config_path,
+                    "chargers": self.dataset.charger_xml_path,
+                },
+                params={"folder_name": f"{self.time_string}-sample"},
+                scenario_hash=scenario.scenario_hash,
+            )
+
+        if self.scenario_hash not in reward_client.scenarios:
+            reward_client.register_scenario(self.dataset.scenario_files())
+        return dict(
+            files={
+                "config": self.dataset.config_path,
+                "chargers": self.dataset.charger_xml_path,
+            },
+            params={"folder_name": self.time_string},
+            scenario_hash=self.scenario_hash,
+        )
+
+    def request_rewards(self, scenario=None):
+        """
+        Writes the chargers of the last applied action and simulates them on
+        the reward server.
+
+        Args:
+            scenario (ScenarioSample): Population sample to simulate the
+                chargers with. Default is None, which simulates them at full
+                scale.
+
+        Returns:
+            tuple[dict, requests.Response]: Charge reward and time reward,
+                and the server response.
+        """
+        self.dataset.write_charger_xml()
+        response = self.reward_client.get_reward(
+            **self.reward_request(self.reward_client, scenario), stream=True
+        )
+        return self.parse_reward_response(response), response
+
+    def parse_reward_response(self, response):
+        """
+        Reads the rewards from the headers of a server response.
+
+        Args:
+            response (requests.Response): Server response.
+
+        Returns:
+            dict: Charge reward and time reward.
+        """
+        json_response = json.loads(response.headers["X-response-message"])
+        return parse_rewards(json_response)
+
     @abstractmethod
     def reset(self, **kwargs):
         pass
 
-    @abstractmethod
     def step(self, actions):
+        """
+        Take an action and return the next state, reward, done, and info.
+
+        Args:
+            actions (np.ndarray): Actions to perform.
+
+        Returns:
+            tuple: Next state, reward, done flags, and additional info.
+        """
+        return self.step_result(self.send_reward_request(actions))
+
+    async def async_step(self, actions, reward_client):
+        """
+        Coroutine version of step, see send_reward_request_async.
+
+        Args:
+            actions (np.ndarray): Actions to perform.
+            reward_client (AsyncRewardClient): Client to send the reward
+                request with.
+
+        Returns:
+            tuple: Next state, reward, done flags, and additional info.
+        """
+        return self.step_result(
+            await self.send_reward_request_async(actions, reward_client)
+        )
+
+    @abstractmethod
+    def step_result(self, reward):
         pass
 
+    def step_info(self):
+        """
+        Returns the info of the last step, a few metrics for logging. The
+        env itself is not included, since SubprocVecEnv would pickle it with
+        its dataset, graphs and outputs and send it to the trainer on every
+        step.
+
+        Returns:
+            dict: Reward, charger cost and efficiencies of the last step,
+                whether it reached a new best simulated reward, the best
+                simulated and predicted rewards so far, and counts of
+                simulations and reward cache lookups.
+        """
+        info = dict(
+            reward=self._reward,
+            is_best=self._is_best,
+            best_reward=self.best_reward,
+            best_predicted_reward=self.best_predicted_reward,
+            charger_cost=self._charger_cost,
+            charger_efficiency=self._charger_efficiency,
+            time_efficiency=self._time_efficiency,
+            num_simulations=self.num_simulations,
+            num_surrogate_steps=self.num_surrogate_steps,
+            num_screenings=self.num_screenings,
+            num_promotions=self.num_promotions,
+        )
+        if self.reward_cache is not None:
+            info["cache_hits"] = self.reward_cache.hits
+            info["cache_misses"] = self.reward_cache.misses
+        return info
+
+    def save_best(self, save_dir):
+        """
+        Saves the charger configuration of the last step and the output of
+        the best simulation, meant to be called through env_method of the
+        vectorized env after a step reached a new best simulated reward, see
+        the is_best entry of step_info. The output is
+        saved to the save directory of the env, like the initial output.
+
+        Args:
+            save_dir (str): Directory to save the charger configuration to.
+        """
+        self.save_charger_config_to_csv(Path(save_dir, "best_chargers.csv"))
+        # The future is not returned, it cannot be sent between processes
+        self.save_server_output(self.best_output_path, "bestoutput")
+
     def close(self):
         """
         Clean up resources used by the environment.
 
         This method is optional and can be customized.
         """
-        shutil.rmtree(self.dataset.config_path.parent)
+        self.reward_client.close()
+        self.output_archiver.close()
+        if self.reward_cache is not None:
+            self.reward_cache.close()
+        if self.sample_store is not None:
+            self.sample_store.close()
+        self.dataset.workspace.cleanup()
 
     def save_charger_config_to_csv(self, csv_path):
         """
@@ -185,22 +782,19 @@ class MatsimGraphEnv(gym.Env):
         Args:
             csv_path (str): Path to save the CSV file.
         """
-        static_chargers = []
-        dynamic_chargers = []
-        charger_config = self.dataset.graph.edge_attr[:, 3:]
-
-        for idx, row in enumerate(charger_config):
-            if not row[0]:
-                if row[1]:
-                    dynamic_chargers.append(int(self.dataset.edge_mapping.inverse[idx]))
-                elif row[2]:
-                    static_chargers.append(int(self.dataset.edge_mapping.inverse[idx]))
+        charger_config = self.dataset.graph.edge_attr[:, 3:].numpy()
+        placed = charger_config[:, 0] == 0
+        dynamic = placed & (charger_config[:, 1] != 0)
+        static = placed & ~dynamic & (charger_config[:, 2] != 0)
+        link_ids = self.dataset.edge_mapping.inverse
+        dynamic_chargers = link_ids[np.flatnonzero(dynamic)].astype(np.int64).tolist()
+        static_chargers = link_ids[np.flatnonzero(static)].astype(np.int64).tolist()
 
         df = pd.DataFrame(
             {
                 "iteration": [0],
                 "reward": [self.reward],
-                "cost": [self.dataset.charger_cost.item()],
+                "cost": [self.dataset.charger_cost],
                 "static_chargers": [static_chargers],
                 "dynamic_chargers": [dynamic_chargers],
             }
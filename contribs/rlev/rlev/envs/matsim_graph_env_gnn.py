@@ -1,4 +1,3 @@
-import numpy as np
 from gymnasium import spaces
 from rlev.envs.matsim_graph_env import MatsimGraphEnv
 from rlev.scripts.create_chargers import create_chargers_xml_gymnasium
@@ -10,7 +9,24 @@ class MatsimGraphEnvGNN(MatsimGraphEnv):
     with GNNs. It supports multi-agent actions and observations.
     """
 
-    def __init__(self, config_path, num_agents=100, save_dir=None):
+    def __init__(
+        self,
+        config_path,
+        num_agents=100,
+        save_dir=None,
+        shared_graph=None,
+        gzip_inputs=False,
+        population_seed=None,
+        use_reward_cache=True,
+        output_members=None,
+        reward_mode="server",
+        simulation_budget=None,
+        screening_fraction=None,
+        screening_threshold=None,
+        screening_quantile=0.9,
+        population_cache_dir=None,
+        snap_to_links=False,
+    ):
         """
         Initialize the environment.
 
@@ -18,8 +34,46 @@ class MatsimGraphEnvGNN(MatsimGraphEnv):
             config_path (str): Path to the configuration file.
             num_agents (int): Number of agents in the environment.
             save_dir (str): Directory to save outputs.
+            shared_graph (SharedGraph): Compiled graph published in shared
+                memory by the parent process, if any.
+            gzip_inputs (bool): Whether to upload the generated inputs as
+                .xml.gz.
+            population_seed (int): Seed of the generated population.
+            use_reward_cache (bool): Whether to use the persistent reward
+                cache.
+            output_members (list[str]): Glob patterns of the members of
+                saved server outputs to extract.
+            reward_mode (str): "server", "analytic" or "surrogate", see
+                MatsimGraphEnv.
+            simulation_budget (int): Number of placements simulated at most
+                in surrogate mode.
+            screening_fraction (float): Share of the population every
+                placement is simulated with first, see MatsimGraphEnv.
+            screening_threshold (float): Screened reward from which
+                placements are simulated at full scale.
+            screening_quantile (float): Quantile of the screened rewards from
+                which placements are simulated at full scale.
+            population_cache_dir (Path): Directory of the population cache.
+            snap_to_links (bool): Whether to write the nearest link of every
+                activity into the generated plans.
         """
-        super().__init__(config_path, num_agents, save_dir)
+        super().__init__(
+            config_path,
+            num_agents,
+            save_dir,
+            shared_graph,
+            gzip_inputs,
+            population_seed,
+            use_reward_cache,
+            output_members,
+            reward_mode,
+            simulation_budget,
+            screening_fraction,
+            screening_threshold,
+            screening_quantile,
+            population_cache_dir=population_cache_dir,
+            snap_to_links=snap_to_links,
+        )
 
         self.observation_space: spaces.Dict = spaces.Dict(
             spaces=dict(x=self.x, edge_index=self.edge_index_space)
@@ -34,28 +88,26 @@ class MatsimGraphEnvGNN(MatsimGraphEnv):
         """
         return dict(
             x=self.dataset.linegraph.x.numpy(),
-            edge_index=self.dataset.linegraph.edge_index.numpy().astype(np.int32),
+            edge_index=self.edge_index.numpy(),
         ), dict(info="info")
 
-    def step(self, actions):
+    def step_result(self, reward):
         """
-        Take an action and return the next state, reward, done, and info.
+        Returns the next state, reward, done, and info of a step.
 
         Args:
-            actions (list): Actions to perform.
+            reward (float): Reward of the actions of the step.
 
         Returns:
             tuple: Next state, reward, done flags, and additional info.
         """
-        reward = self.send_reward_request(actions)
-
         return (
             dict(
                 x=self.dataset.linegraph.x.numpy(),
-                edge_index=self.dataset.linegraph.edge_index.numpy().astype(np.int32),
+                edge_index=self.edge_index.numpy(),
             ),
             reward,
             self.done,
             self.done,
-            dict(graph_env_inst=self),
+            self.step_info(),
         )
@@ -9,8 +9,41 @@ class MatsimGraphEnvMlp(MatsimGraphEnv):
     A custom Gymnasium environment for Matsim graph-based simulations.
     """
 
-    def __init__(self, config_path, num_agents=100, save_dir=None):
-        super().__init__(config_path, num_agents, save_dir)
+    def __init__(
+        self,
+        config_path,
+        num_agents=100,
+        save_dir=None,
+        shared_graph=None,
+        gzip_inputs=False,
+        population_seed=None,
+        use_reward_cache=True,
+        output_members=None,
+        reward_mode="server",
+        simulation_budget=None,
+        screening_fraction=None,
+        screening_threshold=None,
+        screening_quantile=0.9,
+        population_cache_dir=None,
+        snap_to_links=False,
+    ):
+        super().__init__(
+            config_path,
+            num_agents,
+            save_dir,
+            shared_graph,
+            gzip_inputs,
+            population_seed,
+            use_reward_cache,
+            output_members,
+            reward_mode,
+            simulation_budget,
+            screening_fraction,
+            screening_threshold,
+            screening_quantile,
+            population_cache_dir=population_cache_dir,
+            snap_to_links=snap_to_links,
+        )
 
         self.observation_space = spaces.Box(
             low=0,
@@ -29,22 +62,20 @@ class MatsimGraphEnvMlp(MatsimGraphEnv):
         """
         return self.dataset.linegraph.x.numpy(), dict(info="info")
 
-    def step(self, actions):
+    def step_result(self, reward):
         """
-        Take an action and return the next state, reward, done, and info.
+        Returns the next state, reward, done, and info of a step.
 
         Args:
-            actions (np.ndarray): Actions to take.
+            reward (float): Reward of the actions of the step.
 
         Returns:
             tuple: Next state, reward, done flags, and additional info.
         """
-        reward = self.send_reward_request(actions)
-
         return (
             self.dataset.linegraph.x.numpy(),
             reward,
             self.done,
             self.done,
-            dict(graph_env_inst=self),
+            self.step_info(),
         )
@@ -42,6 +42,38 @@ Command-line Arguments:
     --clip_range (float): Clip range for the PPO algorithm. Default is 0.2.
     --policy_type (str): Type of policy to use ("MlpPolicy" or "GNNPolicy").
     Default is "MlpPolicy".
+    --shared_graph: Build the network graph once in the main process and
+    share it with every environment through shared memory.
+    --gzip_inputs: Write the generated plans, vehicles and chargers as
+    .xml.gz to shrink the files uploaded to the reward server.
+    --population_seed (int): Seed of the population generated when
+    --num_agents is set. Every environment uses the same population, which
+    is generated once and cached. Default is a random seed per run, whose
+    population is only shared within the run and removed at its end.
+    --snap_to_links: Write the nearest link of every activity into the
+    generated plans, so that MATSim does not snap them at startup.
+    --no_reward_cache: Simulate every charger placement instead of looking
+    it up in the persistent reward cache first.
+    --async_envs: Run every environment in the main process and send their
+    reward requests concurrently from an asyncio event loop, instead of
+    running one worker process per environment.
+    --output_members (str): Glob patterns of the files to extract from saved
+    simulation outputs, such as "scorestats.csv". Default is everything.
+    --reward_mode (str): "server" to simulate every charger placement,
+    "analytic" to estimate rewards from shortest paths and the consumption
+    map without MATSim, to pretrain policies cheaply, or "surrogate" to
+    answer most steps with a model learned from the simulated placements.
+    Default is "server".
+    --simulation_budget (int): Number of placements every environment
+    simulates at most in surrogate mode. Default is no limit.
+    --screening_fraction (float): Simulate every charger placement with this
+    share of the population first, for instance 0.1, and only simulate the
+    promising ones again with the full population. Default is to simulate
+    every placement with the full population.
+    --screening_threshold (float): Screened reward from which placements are
+    simulated with the full population. Default is none.
+    --screening_quantile (float): Quantile of the screened rewards from which
+    placements are simulated with the full population. Default is 0.9.
 
 Usage:
     Run the script from the command line, providing the required arguments.
@@ -53,6 +85,9 @@ Usage:
 import gymnasium as gym
 import argparse
 import os
+import secrets
+import shutil
+import tempfile
 import numpy as np
 import torch
 from stable_baselines3 import PPO
@@ -64,8 +99,10 @@ from stable_baselines3.common.callbacks import (
 )
 from datetime import datetime
 from pathlib import Path
-from rlev.envs.matsim_graph_env_gnn import MatsimGraphEnvGNN
-from rlev.envs.matsim_graph_env_mlp import MatsimGraphEnvMlp
+import rlev.envs  # registers the gym envs
+from rlev.envs.matsim_graph_env import MatsimGraphEnv
+from rlev.envs.async_matsim_vec_env import AsyncMatsimVecEnv
+from rlev.classes.scenario_workspace import ScenarioWorkspace
 
 
 class TensorboardCallback(BaseCallback):
@@ -76,14 +113,15 @@ class TensorboardCallback(BaseCallback):
     Attributes:
         save_dir (str or None): Directory path to save the best-performing
         environment's data.
-        best_reward (float): The highest reward observed during training.
-        best_env (MatsimGraphEnvGNN | MatsimGraphEnvMlp): The environment
-        instance corresponding to the best reward.
+        best_reward (float): The highest simulated reward observed during
+        training.
+        best_env_index (int): Index of the environment corresponding to the
+        best reward.
 
     Methods:
         _on_step() -> bool:
             Executes at each step of the training process. Calculates average
-            reward, updates the best reward and environment instance if a new
+            reward, updates the best reward and environment index if a new
             best reward is observed, and logs metrics to TensorBoard.
     """
 
@@ -99,7 +137,7 @@ class TensorboardCallback(BaseCallback):
         super(TensorboardCallback, self).__init__(verbose)
         self.save_dir = save_dir
         self.best_reward = -np.inf
-        self.best_env: MatsimGraphEnvGNN | MatsimGraphEnvMlp = None
+        self.best_env_index: int = None
 
     def _on_step(self) -> bool:
         """
@@ -114,30 +152,54 @@ class TensorboardCallback(BaseCallback):
         avg_cost = 0
         avg_charger_efficiency = 0
         avg_time_efficiency = 0
-
+        cache_hits = 0
+        cache_lookups = 0
+        simulations = 0
+        surrogate_steps = 0
+        screenings = 0
+        promotions = 0
+        best_predicted_reward = -np.inf
+
+        # The infos only hold metrics, see MatsimGraphEnv.step_info
         for i, infos in enumerate(self.locals["infos"]):
-            env_inst: MatsimGraphEnvGNN | MatsimGraphEnvMlp = infos["graph_env_inst"]
-            reward = env_inst._reward
+            reward = infos["reward"]
             avg_reward += reward
-            avg_cost += env_inst._charger_cost
-            avg_charger_efficiency += env_inst._charger_efficiency
-            avg_time_efficiency += env_inst._time_efficiency
-
-            if reward > self.best_reward:
-                self.best_env = env_inst
-                self.best_reward = self.best_env.best_reward
-                self.best_env.save_charger_config_to_csv(
-                    Path(self.save_dir, "best_chargers.csv")
-                )
-                self.best_env.save_server_output(
-                    self.best_env.best_output_response, "bestoutput"
-                )
+            avg_cost += infos["charger_cost"]
+            avg_charger_efficiency += infos["charger_efficiency"]
+            avg_time_efficiency += infos["time_efficiency"]
+            if "cache_hits" in infos:
+                cache_hits += infos["cache_hits"]
+                cache_lookups += infos["cache_hits"] + infos["cache_misses"]
+            simulations += infos["num_simulations"]
+            surrogate_steps += infos["num_surrogate_steps"]
+            screenings += infos["num_screenings"]
+            promotions += infos["num_promotions"]
+            best_predicted_reward = max(
+                best_predicted_reward, infos["best_predicted_reward"]
+            )
+
+            # Predicted rewards have no simulation to save
+            if infos["is_best"] and infos["best_reward"] > self.best_reward:
+                self.best_env_index = i
+                self.best_reward = infos["best_reward"]
+                # The env saves its own outputs in its worker
+                self.training_env.env_method("save_best", self.save_dir, indices=[i])
 
         self.logger.record("Avg Reward", (avg_reward / (i + 1)))
         self.logger.record("Best Reward", self.best_reward)
         self.logger.record("Avg Charger Cost", (avg_cost / (i + 1)))
         self.logger.record("Avg Charger Efficiency", (avg_charger_efficiency / (i + 1)))
         self.logger.record("Avg Time Efficiency", (avg_time_efficiency / (i + 1)))
+        if cache_lookups:
+            self.logger.record("Reward Cache Hit Rate", cache_hits / cache_lookups)
+        self.logger.record("Simulations", simulations)
+        if surrogate_steps:
+            self.logger.record("Surrogate Steps", surrogate_steps)
+        if best_predicted_reward > -np.inf:
+            self.logger.record("Best Predicted Reward", best_predicted_reward)
+        if screenings:
+            self.logger.record("Screenings", screenings)
+            self.logger.record("Promotions", promotions)
 
         return True
 
@@ -153,10 +215,25 @@ def main(args: argparse.Namespace):
     save_dir = f"{args.results_dir}/{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}/"
     os.makedirs(save_dir)
 
+    for orphan in ScenarioWorkspace.collect_orphans():
+        print(f"Removed orphaned workspace {orphan}")
+
+    # A random population is shared by the envs of this run only, since no
+    # later run could reuse it from the persistent population cache
+    population_cache_dir = None
+    if args.population_seed is None:
+        args.population_seed = secrets.randbits(32)
+        population_cache_dir = tempfile.mkdtemp(prefix="rlev-populations-")
+
     with open(Path(save_dir, "args.txt"), "w") as f:
         for key, val in args.__dict__.items():
             f.write(f"{key}:{val}\n")
 
+    shared_graph = None
+    if args.shared_graph:
+        shared_graph = MatsimGraphEnv.publish_shared_graph(args.matsim_config)
+        print(f"Published shared graph ({shared_graph.nbytes / 1e6:.1f} MB)")
+
     def make_env():
         """
         Creates a new environment instance based on the policy type.
@@ -170,6 +247,18 @@ def main(args: argparse.Namespace):
                 config_path=args.matsim_config,
                 num_agents=args.num_agents,
                 save_dir=save_dir,
+                shared_graph=shared_graph,
+                gzip_inputs=args.gzip_inputs,
+                population_seed=args.population_seed,
+                population_cache_dir=population_cache_dir,
+                snap_to_links=args.snap_to_links,
+                use_reward_cache=not args.no_reward_cache,
+                output_members=args.output_members,
+                reward_mode=args.reward_mode,
+                simulation_budget=args.simulation_budget,
+                screening_fraction=args.screening_fraction,
+                screening_threshold=args.screening_threshold,
+                screening_quantile=args.screening_quantile,
             )
         elif args.policy_type == "GNNPolicy":
             return gym.make(
@@ -177,9 +266,24 @@ def main(args: argparse.Namespace):
                 config_path=args.matsim_config,
                 num_agents=args.num_agents,
                 save_dir=save_dir,
+                shared_graph=shared_graph,
+                gzip_inputs=args.gzip_inputs,
+                population_seed=args.population_seed,
+                population_cache_dir=population_cache_dir,
+                snap_to_links=args.snap_to_links,
+                use_reward_cache=not args.no_reward_cache,
+                output_members=args.output_members,
+                reward_mode=args.reward_mode,
+                simulation_budget=args.simulation_budget,
+                screening_fraction=args.screening_fraction,
+                screening_threshold=args.screening_threshold,
+                screening_quantile=args.screening_quantile,
             )
 
-    env = SubprocVecEnv([make_env for _ in range(args.num_envs)])
+    if args.async_envs:
+        env = AsyncMatsimVecEnv([make_env for _ in range(args.num_envs)])
+    else:
+        env = SubprocVecEnv([make_env for _ in range(args.num_envs)])
     """
     n_steps: Number of steps for each environment to collect data before a 
     batch is processed.
@@ -226,8 +330,15 @@ def main(args: argparse.Namespace):
         )
 
     # total_timesteps = n_steps * num_envs * iterations
-    model.learn(total_timesteps=args.num_timesteps, callback=callback)
-    model.save(Path(save_dir, "ppo_matsim"))
+    try:
+        model.learn(total_timesteps=args.num_timesteps, callback=callback)
+        model.save(Path(save_dir, "ppo_matsim"))
+    finally:
+        env.close()
+        if shared_graph is not None:
+            shared_graph.unlink()
+        if population_cache_dir is not None:
+            shutil.rmtree(population_cache_dir, ignore_errors=True)
 
 
 if __name__ == "__main__":
@@ -317,6 +428,93 @@ if __name__ == "__main__":
         type=str,
         help="The policy type to use for the PPO algorithm.",
     )
+    parser.add_argument(
+        "--shared_graph",
+        action="store_true",
+        help="Build the network graph once and share it with every \
+                        environment through shared memory instead of each \
+                        environment building its own copy.",
+    )
+    parser.add_argument(
+        "--gzip_inputs",
+        action="store_true",
+        help="Write the generated plans, vehicles and chargers as .xml.gz \
+                        to shrink the files uploaded to the reward server.",
+    )
+    parser.add_argument(
+        "--population_seed",
+        type=int,
+        default=None,
+        help="Seed of the population generated when num_agents is set, \
+                        shared by every environment and cached across runs. \
+                        Random and not cached across runs if not given.",
+    )
+    parser.add_argument(
+        "--snap_to_links",
+        action="store_true",
+        help="Write the nearest link of every activity into the generated \
+                        plans, so that MATSim does not snap them at startup.",
+    )
+
+    parser.add_argument(
+        "--no_reward_cache",
+        action="store_true",
+        help="Simulate every charger placement instead of looking it up in \
+                        the persistent reward cache first.",
+    )
+    parser.add_argument(
+        "--async_envs",
+        action="store_true",
+        help="Run every environment in the main process and keep their \
+                        reward requests in flight concurrently instead of \
+                        running one worker process per environment.",
+    )
+    parser.add_argument(
+        "--output_members",
+        nargs="+",
+        default=None,
+        help="Glob patterns of the files to extract from saved simulation \
+                        outputs, such as scorestats.csv or '*.csv'. \
+                        Everything is extracted if not given.",
+    )
+    parser.add_argument(
+        "--reward_mode",
+        choices=["server", "analytic", "surrogate"],
+        default="server",
+        help="Simulate charger placements on the reward server, estimate \
+                        their rewards analytically in milliseconds, or learn \
+                        a surrogate that only simulates uncertain or \
+                        promising placements.",
+    )
+    parser.add_argument(
+        "--simulation_budget",
+        type=int,
+        default=None,
+        help="Number of placements every environment simulates at most in \
+                        surrogate mode.",
+    )
+    parser.add_argument(
+        "--screening_fraction",
+        type=float,
+        default=None,
+        help="Share of the population to simulate every placement with \
+                        first. Only promising placements are simulated again \
+                        with the full population.",
+    )
+    parser.add_argument(
+        "--screening_threshold",
+        type=float,
+        default=None,
+        help="Screened reward from which placements are simulated with the \
+                        full population.",
+    )
+    parser.add_argument(
+        "--screening_quantile",
+        type=float,
+        default=0.9,
+        help="Quantile of the screened rewards from which placements are \
+                        simulated with the full population.",
+    )
 
     parser.print_help()
     args = parser.parse_args()
@@ -0,0 +1,134 @@
+"""
+Benchmarks serializing chargers XML files with ChargersXmlBuilder against
+building an ElementTree per step, on synthetic action vectors over an
+increasing number of candidate links, and checks that both produce identical
+files.
+
+Usage:
+    python -m rlev.scripts.benchmark_chargers_xml --sizes 10000 100000
+"""
+
+import argparse
+import io
+import os
+import time
+import xml.etree.ElementTree as ET
+import numpy as np
+from rlev.classes.chargers import DynamicCharger, NoneCharger, StaticCharger
+from rlev.scripts.create_chargers import CHARGERS_XML_HEADER, ChargersXmlBuilder
+
+
+CHARGER_LIST = [NoneCharger, DynamicCharger, StaticCharger]
+
+
+def element_tree_chargers(link_ids, actions):
+    """
+    Serializes a charger set the way create_chargers_xml_gymnasium used to,
+    with one ElementTree element per placed charger.
+    """
+    root = ET.Element("chargers")
+    for idx in np.flatnonzero(actions).tolist():
+        charger = CHARGER_LIST[actions[idx]]
+        ET.SubElement(
+            root,
+            "charger",
+            id=str(idx),
+            link=str(link_ids[idx]),
+            plug_power=str(charger.plug_power),
+            plug_count=str(charger.plug_count),
+            type=charger.type,
+        )
+    f = io.BytesIO()
+    f.write(CHARGERS_XML_HEADER)
+    ET.ElementTree(root).write(f)
+    return f.getvalue()
+
+
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark_size(num_links, changed_share, repeat, seed=0):
+    rng = np.random.default_rng(seed)
+    link_ids = np.arange(num_links).astype(str)
+    actions = rng.integers(0, len(CHARGER_LIST), num_links)
+    next_actions = actions.copy()
+    changed = rng.choice(num_links, max(1, int(num_links * changed_share)), False)
+    next_actions[changed] = rng.integers(0, len(CHARGER_LIST), len(changed))
+
+    start = time.perf_counter()
+    builder = ChargersXmlBuilder(CHARGER_LIST, link_ids)
+    setup_time = time.perf_counter() - start
+
+    builder.render(actions)
+    assert builder.tobytes() == element_tree_chargers(link_ids, actions)
+    builder.write(os.devnull)
+    reference_time = best_time(lambda: element_tree_chargers(link_ids, actions), 1)
+
+    def full_render():
+        builder.render(np.zeros(num_links, dtype=np.int64))
+        builder.render(actions)
+        builder.write(os.devnull, force=True)
+
+    # Steps write to os.devnull, which measures serialization without the
+    # cost of the disk
+    def step():
+        builder.render(next_actions)
+        builder.write(os.devnull, force=True)
+        builder.render(actions)
+        builder.write(os.devnull, force=True)
+
+    def unchanged_step():
+        builder.render(actions)
+        builder.write(os.devnull)
+
+    full_time = best_time(full_render, repeat)
+    step_time = best_time(step, repeat) / 2
+    unchanged_time = best_time(unchanged_step, repeat)
+
+    print(
+        f"{num_links:>10} links  setup {setup_time * 1e3:8.2f} ms"
+        f"  ElementTree {reference_time * 1e3:8.2f} ms"
+        f"  full render {full_time * 1e3:8.2f} ms"
+        f"  {changed_share:.1%} changed {step_time * 1e3:8.3f} ms"
+        f"  unchanged {unchanged_time * 1e3:8.3f} ms"
+    )
+
+
+def main(args):
+    for size in args.sizes:
+        benchmark_size(size, args.changed_share, args.repeat)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark chargers XML serialization.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1_000, 10_000, 100_000],
+        help="Number of candidate links.",
+    )
+    parser.add_argument(
+        "--changed_share",
+        type=float,
+        default=0.01,
+        help="Share of links whose charger changes between two steps.",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="Number of timed repetitions, the best one is reported.",
+    )
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,212 @@
+"""
+Benchmarks the env loop against the stand-in reward server and reports env
+steps per second, so client-side overhead can be profiled and regressions
+caught without a simulator. The stub server runs in this process unless
+--server_url points to one started with rlev.scripts.reward_stub_server,
+which keeps its work out of the measurement and the profile.
+
+The reward mode and the screening options of the envs can be set as for
+training, to time the surrogate and multi-fidelity paths as well.
+
+Usage:
+    python -m rlev.scripts.benchmark_env_steps \
+        scenario_examples/i-15-scenario/i-15-config.xml --num_envs 8 \
+        --vec_env async --latency 0.5 --output_size 10000000
+    python -m rlev.scripts.benchmark_env_steps \
+        scenario_examples/i-15-scenario/i-15-config.xml --vec_env dummy \
+        --reward_mode surrogate --simulation_budget 20 --screening_fraction 0.1
+"""
+
+import argparse
+import cProfile
+import pstats
+import tempfile
+import time
+import gymnasium as gym
+import numpy as np
+from stable_baselines3.common.vec_env import DummyVecEnv
+import rlev.envs
+from rlev.classes.async_reward_client import AsyncRewardClient
+from rlev.classes.reward_client import RewardClient
+from rlev.envs.async_matsim_vec_env import AsyncMatsimVecEnv
+from rlev.scripts.reward_stub_server import StubRewardServer
+
+
+def make_vec_env(args, save_dir):
+    def make_env():
+        env = gym.make(
+            "MatsimGraphEnvGNN-v0",
+            config_path=args.matsim_config,
+            num_agents=args.num_agents,
+            save_dir=save_dir,
+            gzip_inputs=args.gzip_inputs,
+            population_seed=args.population_seed,
+            use_reward_cache=args.reward_cache,
+            output_members=args.output_members,
+            reward_mode=args.reward_mode,
+            simulation_budget=args.simulation_budget,
+            screening_fraction=args.screening_fraction,
+            screening_threshold=args.screening_threshold,
+            screening_quantile=args.screening_quantile,
+            snap_to_links=args.snap_to_links,
+        )
+        env.unwrapped.reward_client = RewardClient(args.server_url)
+        return env
+
+    env_fns = [make_env for _ in range(args.num_envs)]
+    if args.vec_env == "async":
+        reward_client = AsyncRewardClient(
+            args.server_url, max_connections=args.num_envs
+        )
+        return AsyncMatsimVecEnv(env_fns, reward_client)
+    return DummyVecEnv(env_fns)
+
+
+def run_steps(env, num_steps):
+    start = time.perf_counter()
+    for _ in range(num_steps):
+        actions = np.stack([env.action_space.sample() for _ in range(env.num_envs)])
+        env.step(actions)
+    return time.perf_counter() - start
+
+
+def main(args):
+    server = None
+    if args.server_url is None:
+        server = StubRewardServer(
+            latency=args.latency,
+            jitter=args.jitter,
+            workers=args.workers,
+            output_size=args.output_size,
+        )
+        server.start()
+        args.server_url = server.url
+
+    with tempfile.TemporaryDirectory(prefix="rlev-benchmark-") as save_dir:
+        start = time.perf_counter()
+        env = make_vec_env(args, save_dir)
+        env.action_space.seed(args.seed)
+        env.reset()
+        setup_time = time.perf_counter() - start
+
+        try:
+            # The first step uploads the scenario and saves the initial output
+            warmup_time = run_steps(env, 1)
+
+            profiler = cProfile.Profile() if args.profile else None
+            if profiler is not None:
+                profiler.enable()
+            step_time = run_steps(env, args.num_steps)
+            if profiler is not None:
+                profiler.disable()
+            infos = env.env_method("step_info")
+        finally:
+            env.close()
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+    env_steps = args.num_steps * args.num_envs
+    print(
+        f"{args.vec_env} x {args.num_envs} envs  setup {setup_time:.2f} s"
+        f"  first step {warmup_time:.2f} s"
+        f"  {env_steps} env steps in {step_time:.2f} s"
+        f"  = {env_steps / step_time:.1f} steps/s"
+    )
+    # Surrogate and screened steps are not simulated at full scale
+    counts = {
+        key: sum(info[key] for info in infos)
+        for key in (
+            "num_simulations",
+            "num_surrogate_steps",
+            "num_screenings",
+            "num_promotions",
+        )
+    }
+    print(f"Steps by source: {counts}")
+    if server is not None:
+        print(f"Requests: {dict(server.requests)}")
+        print(f"Bytes received: {dict(server.bytes_received)}")
+    if profiler is not None:
+        profiler.dump_stats(args.profile)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark env steps per second against the stub reward server.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "matsim_config", type=str, help="Path to the matsim config.xml file."
+    )
+    parser.add_argument("--num_envs", type=int, default=4)
+    parser.add_argument(
+        "--num_steps",
+        type=int,
+        default=10,
+        help="Number of timed steps of the vectorized env.",
+    )
+    parser.add_argument(
+        "--vec_env",
+        choices=["dummy", "async"],
+        default="async",
+        help="Step the envs one after another or concurrently.",
+    )
+    parser.add_argument(
+        "--num_agents",
+        type=int,
+        default=-1,
+        help="Number of vehicles to generate, the scenario's plans if < 0.",
+    )
+    parser.add_argument("--population_seed", type=int, default=0)
+    parser.add_argument("--gzip_inputs", action="store_true")
+    parser.add_argument(
+        "--reward_cache",
+        action="store_true",
+        help="Use the persistent reward cache, which random actions rarely hit.",
+    )
+    parser.add_argument("--output_members", nargs="+", default=None)
+    parser.add_argument("--snap_to_links", action="store_true")
+    parser.add_argument(
+        "--reward_mode",
+        choices=["server", "analytic", "surrogate"],
+        default="server",
+        help="How the envs get their rewards, see MatsimGraphEnv.",
+    )
+    parser.add_argument(
+        "--simulation_budget",
+        type=int,
+        default=None,
+        help="Number of placements every env simulates at most in surrogate mode.",
+    )
+    parser.add_argument(
+        "--screening_fraction",
+        type=float,
+        default=None,
+        help="Share of the population every placement is simulated with first.",
+    )
+    parser.add_argument("--screening_threshold", type=float, default=None)
+    parser.add_argument("--screening_quantile", type=float, default=0.9)
+    parser.add_argument(
+        "--server_url",
+        type=str,
+        default=None,
+        help="URL of a running stub server. Starts one in this process if not "
+        "given, configured by the options below.",
+    )
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output_size", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--profile",
+        type=str,
+        default=None,
+        help="Profile the timed steps and write the cProfile stats here. Only "
+        "covers the main thread, so profile with --vec_env dummy to see the envs.",
+    )
+
+    args = parser.parse_args()
+    main(args)
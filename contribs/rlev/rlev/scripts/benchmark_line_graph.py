@@ -0,0 +1,133 @@
+"""
+Benchmarks CsrLineGraph against torch_geometric's LineGraph on synthetic
+road-like networks of increasing size and on a MATSim network, and checks
+that both transforms produce identical line graphs.
+
+Usage:
+    python -m rlev.scripts.benchmark_line_graph --sizes 1000 10000 100000
+"""
+
+import argparse
+import time
+import numpy as np
+import torch
+from pathlib import Path
+from torch_geometric.data import Data
+from torch_geometric.transforms import LineGraph
+from rlev.classes.csr_line_graph import CsrLineGraph
+from rlev.scripts.network_parser import parse_network_arrays
+
+
+def synthetic_road_graph(num_links, seed=0):
+    """
+    Builds a directed grid graph with roughly num_links links where every
+    link is one-way with probability 0.5, so the graph is directed like a
+    real road network.
+
+    Args:
+        num_links (int): Approximate number of links.
+        seed (int): Seed for the random one-way choice and attributes.
+
+    Returns:
+        Data: The graph, with edges in random order.
+    """
+    rng = np.random.default_rng(seed)
+    side = max(2, int(np.ceil(np.sqrt(num_links / 3))))
+    nodes = np.arange(side * side).reshape(side, side)
+    pairs = np.concatenate(
+        [
+            np.stack([nodes[:, :-1].ravel(), nodes[:, 1:].ravel()]),
+            np.stack([nodes[:-1, :].ravel(), nodes[1:, :].ravel()]),
+        ],
+        axis=1,
+    )
+    two_way = rng.random(pairs.shape[1]) < 0.5
+    edge_index = np.concatenate([pairs, pairs[::-1, two_way]], axis=1)
+    edge_index = edge_index[:, rng.permutation(edge_index.shape[1])]
+    edge_attr = rng.random((edge_index.shape[1], 6)).astype(np.float32)
+    return Data(
+        x=torch.arange(side * side).view(-1, 1),
+        edge_index=torch.from_numpy(edge_index),
+        edge_attr=torch.from_numpy(edge_attr),
+    )
+
+
+def network_graph(network_xml_path):
+    """
+    Builds the graph of a MATSim network the way MatsimXMLDataset does.
+    """
+    network = parse_network_arrays(network_xml_path)
+    edge_attr = np.zeros((network.num_links, 6), dtype=np.float32)
+    edge_attr[:, :3] = network.link_attr_matrix()
+    return Data(
+        x=torch.arange(network.num_nodes).view(-1, 1),
+        edge_index=torch.from_numpy(np.stack([network.from_idx, network.to_idx])),
+        edge_attr=torch.from_numpy(edge_attr),
+    )
+
+
+def time_transform(transform, graph):
+    start = time.perf_counter()
+    line_graph = transform(graph)
+    return time.perf_counter() - start, line_graph
+
+
+def benchmark_graph(name, graph, skip_reference):
+    csr_time, csr_line_graph = time_transform(CsrLineGraph(), graph)
+    line = f"{name:<28} {graph.edge_index.size(1):>10} links  csr {csr_time:8.3f} s"
+
+    if not skip_reference:
+        reference_time, reference = time_transform(LineGraph(), graph)
+        assert torch.equal(reference.edge_index, csr_line_graph.edge_index)
+        assert torch.equal(reference.x, csr_line_graph.x)
+        assert reference.num_nodes == csr_line_graph.num_nodes
+        line += (
+            f"  LineGraph {reference_time:8.3f} s"
+            f"  speedup {reference_time / csr_time:7.1f}x"
+        )
+    print(line)
+
+
+def main(args):
+    if args.network:
+        benchmark_graph(Path(args.network).name, network_graph(args.network), False)
+
+    for size in args.sizes:
+        benchmark_graph(
+            "synthetic grid",
+            synthetic_road_graph(size),
+            size > args.max_reference_size,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark line-graph construction.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--network",
+        type=str,
+        default=Path(
+            Path(__file__).parents[2],
+            "scenario_examples/i-15-scenario/i-15-network.xml",
+        ),
+        help="MATSim network to benchmark on, empty string to skip it.",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1_000, 10_000, 100_000, 1_000_000],
+        help="Number of links of the synthetic networks.",
+    )
+    parser.add_argument(
+        "--max_reference_size",
+        type=int,
+        default=1_000_000,
+        help="Skip the torch_geometric LineGraph reference above this many \
+            links, it gets very slow.",
+    )
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,271 @@
+"""
+Benchmarks the streaming network parser against the ElementTree based parser
+that MatsimXMLDataset used originally. Every parser runs in its own process so
+the reported peak memory is not polluted by the other run. The memory of a
+parse is the peak RSS of its process above the RSS after the imports, which
+already hold a few hundred MB for torch and NumPy. On Linux the peak is reset
+before parsing, elsewhere it includes whatever the imports peaked at.
+
+Usage:
+    python -m rlev.scripts.benchmark_network_parser \
+        --network scenario_examples/i-15-scenario/i-15-network.xml \
+        --synthetic_links 1000000
+"""
+
+import xml.etree.ElementTree as ET
+import argparse
+import multiprocessing as mp
+import resource
+import tempfile
+import time
+import numpy as np
+import torch
+from pathlib import Path
+from rlev.scripts.network_parser import parse_network_arrays, LINK_ATTRIBUTES
+
+
+def write_synthetic_network(output_path, num_links, seed=0):
+    """
+    Writes a synthetic MATSim network laid out on a square grid where every
+    pair of neighbouring nodes is connected in both directions.
+
+    Args:
+        output_path (Path): Where to write the network XML file.
+        num_links (int): Approximate number of links to generate.
+        seed (int): Seed for the random link attributes.
+    """
+    rng = np.random.default_rng(seed)
+    side = max(2, int(np.ceil(np.sqrt(num_links / 4))))
+    spacing = 250.0
+
+    with open(output_path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write(
+            '<!DOCTYPE network SYSTEM "http://www.matsim.org/files/dtd/network_v2.dtd">\n'
+        )
+        f.write("<network>\n\t<nodes>\n")
+        for row in range(side):
+            f.write(
+                "".join(
+                    f'\t\t<node id="{row * side + col}" x="{col * spacing}" '
+                    f'y="{row * spacing}" >\n\t\t</node>\n'
+                    for col in range(side)
+                )
+            )
+        f.write("\t</nodes>\n")
+        f.write('\t<links capperiod="01:00:00" effectivecellsize="7.5" '
+                'effectivelanewidth="3.75">\n')
+
+        link_id = 0
+        for row in range(side):
+            lines = []
+            for col in range(side):
+                node = row * side + col
+                neighbours = []
+                if col + 1 < side:
+                    neighbours.append(node + 1)
+                if row + 1 < side:
+                    neighbours.append(node + side)
+                for other in neighbours:
+                    for from_node, to_node in ((node, other), (other, node)):
+                        length = spacing * rng.uniform(1.0, 1.2)
+                        freespeed = rng.choice([13.9, 22.2, 31.3])
+                        lines.append(
+                            f'\t\t<link id="{link_id}" from="{from_node}" '
+                            f'to="{to_node}" length="{length}" '
+                            f'freespeed="{freespeed}" capacity="2000.0" '
+                            f'permlanes="1.0" oneway="1" modes="car" >\n'
+                            f"\t\t</link>\n"
+                        )
+                        link_id += 1
+            f.write("".join(lines))
+        f.write("\t</links>\n</network>\n")
+
+
+def parse_network_legacy(network_xml_path, tot_attr=6):
+    """
+    The original MatsimXMLDataset parser: builds the whole ElementTree and
+    allocates one tensor per link.
+
+    Args:
+        network_xml_path (Path): Path to the network XML file.
+        tot_attr (int): Number of edge attributes, link attributes plus one
+            column per charger type.
+
+    Returns:
+        tuple: Node positions, edge index and edge attributes as tensors.
+    """
+    tree = ET.parse(network_xml_path)
+    root = tree.getroot()
+    node_mapping = {}
+    node_pos = []
+    edge_index = []
+    edge_attr = []
+
+    for i, node in enumerate(root.findall(".//node")):
+        node_mapping[node.get("id")] = i
+        node_pos.append([float(node.get("x")), float(node.get("y"))])
+
+    for link in root.findall(".//link"):
+        edge_index.append([node_mapping[link.get("from")], node_mapping[link.get("to")]])
+        curr_link_attr = torch.zeros(tot_attr)
+        for value, key in enumerate(LINK_ATTRIBUTES):
+            if key in link.attrib:
+                curr_link_attr[value] = float(link.get(key))
+        edge_attr.append(curr_link_attr)
+
+    return (
+        torch.tensor(node_pos),
+        torch.tensor(edge_index).t(),
+        torch.stack(edge_attr),
+    )
+
+
+def parse_network_streaming(network_xml_path, tot_attr=6):
+    """
+    The streaming parser producing the same tensors as parse_network_legacy.
+    """
+    network = parse_network_arrays(network_xml_path)
+    edge_attr = np.zeros((network.num_links, tot_attr), dtype=np.float32)
+    edge_attr[:, :3] = network.link_attr_matrix()
+    return (
+        torch.from_numpy(
+            np.stack([network.node_x, network.node_y], axis=1).astype(np.float32)
+        ),
+        torch.from_numpy(np.stack([network.from_idx, network.to_idx])),
+        torch.from_numpy(edge_attr),
+    )
+
+
+PARSERS = {
+    "legacy": parse_network_legacy,
+    "streaming": parse_network_streaming,
+}
+
+
+def _proc_status_mb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) / 1024
+    raise OSError(f"No {field} in /proc/self/status")
+
+
+def _reset_peak_rss():
+    """
+    Resets the peak RSS of this process to its current RSS, which Linux does
+    when 5 is written to /proc/self/clear_refs.
+
+    Returns:
+        float: Current RSS in MB.
+    """
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+        return _proc_status_mb("VmRSS")
+    except OSError:
+        return _peak_rss_mb()
+
+
+def _peak_rss_mb():
+    try:
+        return _proc_status_mb("VmHWM")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_parser(name, network_xml_path, queue):
+    # The module, and with it torch, is imported by the time this runs
+    baseline_mb = _reset_peak_rss()
+    start = time.perf_counter()
+    result = PARSERS[name](network_xml_path)
+    elapsed = time.perf_counter() - start
+    parse_mb = _peak_rss_mb() - baseline_mb
+    queue.put(
+        (elapsed, parse_mb, baseline_mb, [tensor.numpy() for tensor in result])
+    )
+
+
+def benchmark_network(network_xml_path, parsers):
+    """
+    Times every parser on the given network in a fresh process and checks
+    that they agree.
+
+    Args:
+        network_xml_path (Path): Network to parse.
+        parsers (list[str]): Names of the parsers to run.
+
+    Returns:
+        dict: Parser name mapped to (seconds, peak RSS of the parse in MB,
+            baseline RSS of the process after its imports in MB).
+    """
+    ctx = mp.get_context("spawn")
+    results = {}
+    reference = None
+    for name in parsers:
+        queue = ctx.Queue()
+        process = ctx.Process(target=_run_parser, args=(name, network_xml_path, queue))
+        process.start()
+        elapsed, parse_mb, baseline_mb, arrays = queue.get()
+        process.join()
+        results[name] = (elapsed, parse_mb, baseline_mb)
+
+        if reference is None:
+            reference = arrays
+        else:
+            for expected, actual in zip(reference, arrays):
+                assert np.array_equal(expected, actual), f"{name} output differs"
+    return results
+
+
+def main(args):
+    networks = []
+    if args.network:
+        networks.append(Path(args.network))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.synthetic_links:
+            synthetic_path = Path(tmp_dir, "synthetic_network.xml")
+            print(f"Writing synthetic network with ~{args.synthetic_links} links...")
+            write_synthetic_network(synthetic_path, args.synthetic_links)
+            networks.append(synthetic_path)
+
+        for network in networks:
+            print(f"\n{network}")
+            results = benchmark_network(network, args.parsers)
+            for name, (elapsed, parse_mb, baseline_mb) in results.items():
+                print(
+                    f"  {name:<10} {elapsed:8.2f} s  {parse_mb:10.1f} MB peak RSS"
+                    f" above the {baseline_mb:.1f} MB baseline"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark MATSim network parsers.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--network",
+        type=str,
+        default=Path(
+            Path(__file__).parents[2],
+            "scenario_examples/i-15-scenario/i-15-network.xml",
+        ),
+        help="MATSim network to benchmark on.",
+    )
+    parser.add_argument(
+        "--synthetic_links",
+        type=int,
+        default=1_000_000,
+        help="Number of links in the synthetic network, 0 to skip it.",
+    )
+    parser.add_argument(
+        "--parsers",
+        nargs="+",
+        default=list(PARSERS),
+        choices=list(PARSERS),
+        help="Parsers to benchmark.",
+    )
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,44 @@
+import argparse
+from pathlib import Path
+from rlev.classes.scenario_workspace import ScenarioWorkspace, WORKSPACE_ROOT
+
+
+def main(args):
+    """
+    Removes orphaned env workspaces left behind by crashed workers.
+
+    Args:
+        args (argparse.Namespace): Parsed command-line arguments.
+    """
+    unmarked_max_age = None
+    if args.unmarked_max_age_hours is not None:
+        unmarked_max_age = args.unmarked_max_age_hours * 3600
+
+    removed = ScenarioWorkspace.collect_orphans(Path(args.root), unmarked_max_age)
+    for path in removed:
+        print(f"Removed {path}")
+    print(f"Removed {len(removed)} orphaned workspaces")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Remove orphaned env workspaces.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--root",
+        type=str,
+        default=str(WORKSPACE_ROOT),
+        help="Directory holding the workspaces.",
+    )
+    parser.add_argument(
+        "--unmarked_max_age_hours",
+        type=float,
+        default=None,
+        help="Also remove time-string named directories without a workspace \
+            marker, as created by older versions, once they are older than \
+            this many hours.",
+    )
+
+    args = parser.parse_args()
+    main(args)
@@ -2,6 +2,7 @@ import xml.etree.ElementTree as ET
 import pandas as pd
 import os
 import argparse
+from rlev.scripts.xml_writer import XmlWriter, et_declaration
 from rlev.scripts.util import get_str
 
 def generate_counts_from_files(
@@ -11,20 +12,19 @@ def generate_counts_from_files(
     year,
     name,
     desc,
+    compress=None,
 ):
     """
     Generate an XML counts file from station data by reading counts from files.
+    Set compress to write .xml.gz, see xml_writer.output_path.
     """
-    counts = ET.Element(
-        "counts",
-        {
-            "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
-            "xsi:noNamespaceSchemaLocation": "http://matsim.org/files/dtd/counts_v1.xsd",
-            "name": name,
-            "desc": desc,
-            "year": get_str(year),
-        },
-    )
+    counts_attrib = {
+        "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
+        "xsi:noNamespaceSchemaLocation": "http://matsim.org/files/dtd/counts_v1.xsd",
+        "name": name,
+        "desc": desc,
+        "year": get_str(year),
+    }
 
     station_df = pd.read_csv(station_path)
     counts_data = []
@@ -34,12 +34,16 @@ def generate_counts_from_files(
         udot_counts_df = pd.read_csv(station_data_path, sep="\t").sort_values("Hour")
         counts_data.append((link_id, station_id, udot_counts_df["Flow (Veh/Hour)"].values))
 
-    for loc_id, cs_id, volumes in counts_data:
-        count = ET.SubElement(counts, "count", loc_id=get_str(loc_id), cs_id=get_str(cs_id))
-        for hour, val in enumerate(volumes, start=1):
-            ET.SubElement(count, "volume", h=get_str(hour), val=get_str(val))
-
-    ET.ElementTree(counts).write(outputpath, encoding="utf-8", xml_declaration=True)
+    with XmlWriter(
+        outputpath, compress, declaration=et_declaration("utf-8"), encoding="utf-8"
+    ) as writer:
+        writer.start("counts", counts_attrib)
+        for loc_id, cs_id, volumes in counts_data:
+            count = ET.Element("count", loc_id=get_str(loc_id), cs_id=get_str(cs_id))
+            for hour, val in enumerate(volumes, start=1):
+                ET.SubElement(count, "volume", h=get_str(hour), val=get_str(val))
+            writer.write_element(count)
+    return writer.path
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate XML counts from station data files.")
@@ -49,6 +53,7 @@ if __name__ == "__main__":
     parser.add_argument("--year", type=int, default=2024, help="Year for the counts.")
     parser.add_argument("--name", type=str, default="default", help="Name for the counts.")
     parser.add_argument("--desc", type=str, default="default", help="Description for the counts.")
+    parser.add_argument("--compress", action="store_true", default=None, help="Write the counts as .xml.gz.")
 
     args = parser.parse_args()
 
@@ -59,4 +64,5 @@ if __name__ == "__main__":
         args.year,
         args.name,
         args.desc,
+        args.compress,
     )
@@ -1,11 +1,23 @@
 import xml.etree.ElementTree as ET
 import argparse
+import gzip
+import hashlib
 import os
 import numpy as np
 from gymnasium import spaces
-from bidict import bidict
+from rlev.classes.id_index import IdIndex
 from rlev.classes.chargers import Charger
 from pathlib import Path
+from typing import Sequence
+from xml.sax.saxutils import escape
+from rlev.scripts.xml_writer import (
+    XML_DECLARATION,
+    XmlWriter,
+    doctype,
+    is_gzip_path,
+    open_xml_output,
+    output_path,
+)
 
 
 def load_network_xml(network_file):
@@ -28,7 +40,8 @@ def create_chargers_xml_gymnasium(
     charger_xml_path: Path,
     charger_list: list[Charger],
     actions: spaces.MultiDiscrete,
-    link_id_mapping: bidict,
+    link_id_mapping: IdIndex,
+    compress: bool = None,
 ):
     """
     Create a chargers XML file for MATSim using a multi-discrete action space.
@@ -39,35 +52,210 @@ def create_chargers_xml_gymnasium(
         actions (spaces.MultiDiscrete): Action space with dimension (num_edges),
             where each value corresponds to the index of the charger list
             (0 is no charger).
-        link_id_mapping (bidict): Mapping of link IDs to indices.
+        link_id_mapping (IdIndex): Mapping of link IDs to indices.
+        compress (bool): Whether to write gzip, see xml_writer.output_path.
+
+    Returns:
+        Path: Path of the written file.
     """
-    chargers = ET.Element("chargers")
-
-    for idx, action in enumerate(actions):
-        if action == 0:
-            continue
-        charger = charger_list[action]
-        link_id = link_id_mapping.inv[idx]
-        ET.SubElement(
-            chargers,
-            "charger",
-            id=str(idx),
-            link=str(link_id),
-            plug_power=str(charger.plug_power),
-            plug_count=str(charger.plug_count),
-            type=charger.type,
+    builder = ChargersXmlBuilder(charger_list, link_id_mapping.inv)
+    builder.render(actions)
+    return builder.write(charger_xml_path, compress)
+
+
+ATTR_ENTITIES = {'"': "&quot;"}
+CHARGERS_DOCTYPE = doctype("chargers", "http://matsim.org/files/dtd/chargers_v1.dtd")
+CHARGERS_XML_HEADER = XML_DECLARATION + CHARGERS_DOCTYPE
+
+
+class ChargersXmlBuilder:
+    """
+    Renders chargers XML files from action vectors. The start of the
+    <charger> element of every link and the rest of it for every charger
+    type are preformatted once as bytes, so rendering a charger is a byte
+    concatenation and an action that changes only some links only
+    re-renders those. Rendered chargers are joined in blocks of BLOCK_SIZE
+    links, and only the blocks holding a changed link are joined again on
+    the next render. The builder keeps a content hash of the charger set,
+    which lets callers skip writing and uploading a charger set that did not
+    change. The output is byte-identical to create_chargers_xml_gymnasium.
+    """
+
+    BLOCK_SIZE = 256
+
+    def __init__(self, charger_list: list[Charger], link_ids: Sequence[str]):
+        """
+        Initializes the ChargersXmlBuilder with no chargers placed.
+
+        Args:
+            charger_list (list): List of charger type objects, indexed like
+                the action space (0 is no charger).
+            link_ids (Sequence[str]): Link ID of every edge index, for
+                instance the inverse of the dataset's IdIndex.
+        """
+        self.charger_list = charger_list
+        self.link_ids = link_ids
+
+        ids = link_ids[:]
+        ids = ids.tolist() if isinstance(ids, np.ndarray) else list(ids)
+        self._link_templates = [
+            f'<charger id="{idx}" link="{escape(str(link_id), ATTR_ENTITIES)}" '.encode()
+            for idx, link_id in enumerate(ids)
+        ]
+        self._type_templates = [b""] + [
+            (
+                f'plug_power="{charger.plug_power}" '
+                f'plug_count="{charger.plug_count}" type="{charger.type}" />'
+            ).encode()
+            for charger in charger_list[1:]
+        ]
+
+        hasher = hashlib.blake2b(digest_size=16)
+        for template in self._type_templates:
+            hasher.update(template + b"\0")
+        for template in self._link_templates:
+            hasher.update(template)
+        self._template_digest = hasher.digest()
+
+        self.actions = np.zeros(
+            len(ids), dtype=np.uint8 if len(charger_list) <= 256 else np.int64
         )
+        self.elements: list[bytes] = [b""] * len(ids)
+        self._blocks: list[bytes] = [b""] * -(-len(ids) // self.BLOCK_SIZE)
+        self._digest: str = None
+        self._written: tuple[Path, str] = None
+
+    def update(self, link_indices: np.ndarray, actions: np.ndarray):
+        """
+        Re-serializes the chargers of the given links.
+
+        Args:
+            link_indices (np.ndarray): Edge indices whose charger changed.
+            actions (np.ndarray): New charger type index of each of those
+                links.
+        """
+        link_indices = np.asarray(link_indices)
+        if len(link_indices) == 0:
+            return
+        link_templates = self._link_templates
+        type_templates = self._type_templates
+        elements = self.elements
+        for idx, action in zip(link_indices.tolist(), np.asarray(actions).tolist()):
+            elements[idx] = (
+                link_templates[idx] + type_templates[action] if action else b""
+            )
+        self.actions[link_indices] = actions
+        for block in np.unique(link_indices // self.BLOCK_SIZE).tolist():
+            self._blocks[block] = None
+        self._digest = None
+
+    def render(self, actions: np.ndarray) -> bool:
+        """
+        Sets the charger of every link from an action vector, re-serializing
+        only the links whose charger changed. The line graph merges parallel
+        links, so the action vector can be shorter than the list of links,
+        and the links beyond it get no charger.
+
+        Args:
+            actions (np.ndarray): Charger type index per link, indexed like
+                the action space.
+
+        Returns:
+            bool: Whether the charger set changed.
+        """
+        actions = np.asarray(actions)
+        num_links = len(self.actions)
+        if len(actions) < num_links:
+            actions = np.pad(actions, (0, num_links - len(actions)))
+        else:
+            actions = actions[:num_links]
+        changed = np.flatnonzero(actions != self.actions)
+        self.update(changed, actions[changed])
+        return len(changed) > 0
+
+    @property
+    def digest(self) -> str:
+        """
+        Content hash of the rendered charger set. It only depends on the
+        link IDs, the charger types and the placed chargers, so equal
+        charger sets have equal digests across builders and processes.
+
+        Returns:
+            str: Hex digest.
+        """
+        if self._digest is None:
+            hasher = hashlib.blake2b(self._template_digest, digest_size=16)
+            hasher.update(self.actions.data)
+            self._digest = hasher.hexdigest()
+        return self._digest
+
+    def _parts(self) -> list[bytes]:
+        """
+        Joins the blocks changed since the last render and returns the
+        document as a list of byte strings.
+        """
+        blocks = self._blocks
+        for block, data in enumerate(blocks):
+            if data is None:
+                start = block * self.BLOCK_SIZE
+                blocks[block] = b"".join(
+                    self.elements[start : start + self.BLOCK_SIZE]
+                )
+        if not any(blocks):
+            return [CHARGERS_XML_HEADER, b"<chargers />"]
+        return [CHARGERS_XML_HEADER, b"<chargers>", *blocks, b"</chargers>"]
 
-    tree = ET.ElementTree(chargers)
-    with open(charger_xml_path, "wb") as f:
-        f.write(b'<?xml version="1.0" ?>\n')
-        f.write(
-            b'<!DOCTYPE chargers SYSTEM "http://matsim.org/files/dtd/chargers_v1.dtd">\n'
+    def tobytes(self) -> bytes:
+        """
+        Renders the complete chargers XML document.
+
+        Returns:
+            bytes: The chargers XML file contents.
+        """
+        return b"".join(self._parts())
+
+    def is_written(self, charger_xml_path: Path, compress: bool = None) -> bool:
+        """
+        Returns whether the current charger set was last written to a path
+        and the file is still there.
+
+        Args:
+            charger_xml_path (Path): Path of the chargers XML file.
+            compress (bool): Whether the file is gzipped, see
+                xml_writer.output_path.
+        """
+        charger_xml_path = output_path(charger_xml_path, compress)
+        return (
+            self._written == (charger_xml_path, self.digest)
+            and charger_xml_path.exists()
         )
-        tree.write(f)
+
+    def write(self, charger_xml_path: Path, compress: bool = None, force=False):
+        """
+        Writes the chargers XML file, unless this charger set was the last
+        one written to the same path.
+
+        Args:
+            charger_xml_path (Path): Path to save the chargers XML file.
+            compress (bool): Whether to write gzip, see
+                xml_writer.output_path.
+            force (bool): Whether to write even if the file is up to date.
+
+        Returns:
+            Path: Path of the written file.
+        """
+        charger_xml_path = output_path(charger_xml_path, compress)
+        if not force and self.is_written(charger_xml_path):
+            return charger_xml_path
+        with open_xml_output(charger_xml_path) as f:
+            f.writelines(self._parts())
+        self._written = (charger_xml_path, self.digest)
+        return charger_xml_path
 
 
-def create_chargers_xml(link_ids: list, output_file_path, percent_dynamic=0.0):
+def create_chargers_xml(
+    link_ids: list, output_file_path, percent_dynamic=0.0, compress=None
+):
     """
     Generate a chargers XML file with a mix of dynamic and static chargers.
 
@@ -75,9 +263,12 @@ def create_chargers_xml(link_ids: list, output_file_path, percent_dynamic=0.0):
         link_ids (list): List of link IDs to place chargers on.
         output_file_path (str): Path to save the chargers XML file.
         percent_dynamic (float): Percentage of chargers that are dynamic.
+        compress (bool): Whether to write gzip, see xml_writer.output_path.
+
+    Returns:
+        Path: Path of the written file.
     """
     num_chargers = len(link_ids)
-    chargers = ET.Element("chargers")
 
     num_dynamic = int(num_chargers * percent_dynamic)
     num_static = num_chargers - num_dynamic
@@ -87,37 +278,63 @@ def create_chargers_xml(link_ids: list, output_file_path, percent_dynamic=0.0):
     link_ids = np.setdiff1d(link_ids, dynamic_chargers)
     static_chargers = np.random.choice(link_ids, num_static, replace=False)
 
-    id = 0
-    for link_id in dynamic_chargers:
-        ET.SubElement(
-            chargers,
-            "charger",
-            id=str(id),
-            link=str(link_id),
-            plug_power="70",
-            plug_count="9999",
-            type="dynamic",
-        )
-        id += 1
-
-    for link_id in static_chargers:
-        ET.SubElement(
-            chargers,
-            "charger",
-            id=str(id),
-            link=str(link_id),
-            plug_power="100.0",
-            plug_count="1",
-        )
-        id += 1
+    with XmlWriter(output_file_path, compress, doctype=CHARGERS_DOCTYPE) as writer:
+        writer.start("chargers")
+        id = 0
+        for link_id in dynamic_chargers:
+            writer.write_element(
+                ET.Element(
+                    "charger",
+                    id=str(id),
+                    link=str(link_id),
+                    plug_power="70",
+                    plug_count="9999",
+                    type="dynamic",
+                )
+            )
+            id += 1
 
-    tree = ET.ElementTree(chargers)
-    with open(output_file_path, "wb") as f:
-        f.write(b'<?xml version="1.0" ?>\n')
-        f.write(
-            b'<!DOCTYPE chargers SYSTEM "http://matsim.org/files/dtd/chargers_v1.dtd">\n'
+        for link_id in static_chargers:
+            writer.write_element(
+                ET.Element(
+                    "charger",
+                    id=str(id),
+                    link=str(link_id),
+                    plug_power="100.0",
+                    plug_count="1",
+                )
+            )
+            id += 1
+    return writer.path
+
+
+def read_charger_placements(charger_xml_path: Path) -> list[tuple]:
+    """
+    Reads the placement of every charger of a chargers XML file, gzipped or
+    not, leaving out the charger IDs. Attributes missing from an element
+    take their MATSim defaults.
+
+    Args:
+        charger_xml_path (Path): Path of the chargers XML file.
+
+    Returns:
+        list[tuple]: Link ID, type, plug power and plug count of every
+            charger, as strings.
+    """
+    if is_gzip_path(charger_xml_path):
+        with gzip.open(charger_xml_path) as f:
+            root = ET.parse(f).getroot()
+    else:
+        root = ET.parse(charger_xml_path).getroot()
+    return [
+        (
+            charger.get("link"),
+            charger.get("type", "default"),
+            charger.get("plug_power"),
+            charger.get("plug_count", "1"),
         )
-        tree.write(f)
+        for charger in root.iter("charger")
+    ]
 
 
 def main(args):
@@ -139,7 +356,10 @@ def main(args):
 
     link_ids = np.random.choice(link_ids, num_chargers)
     create_chargers_xml(
-        link_ids, os.path.abspath(args.output_file), args.percent_dynamic
+        link_ids,
+        os.path.abspath(args.output_file),
+        args.percent_dynamic,
+        args.compress,
     )
 
 
@@ -162,6 +382,12 @@ if __name__ == "__main__":
         help="Percentage of chargers that are dynamic vs static chargers. "
         "1.0 = 100 percent dynamic, 0.0 = 100 percent static.",
     )
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="Write the chargers as .xml.gz",
+        default=None,
+    )
 
     args = parser.parse_args()
     main(args)
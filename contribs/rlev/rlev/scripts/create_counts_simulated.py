@@ -1,6 +1,7 @@
 import xml.etree.ElementTree as ET
 import numpy as np
 import argparse
+from rlev.scripts.xml_writer import XmlWriter, et_declaration
 from rlev.scripts.util import get_str, get_link_ids
 
 def generate_counts_simulated(
@@ -11,20 +12,19 @@ def generate_counts_simulated(
     desc,
     mean,
     std_dev,
+    compress=None,
 ):
     """
     Generate an XML counts file with simulated data using a normal distribution.
+    Set compress to write .xml.gz, see xml_writer.output_path.
     """
-    counts = ET.Element(
-        "counts",
-        {
-            "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
-            "xsi:noNamespaceSchemaLocation": "http://matsim.org/files/dtd/counts_v1.xsd",
-            "name": name,
-            "desc": desc,
-            "year": get_str(year),
-        },
-    )
+    counts_attrib = {
+        "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
+        "xsi:noNamespaceSchemaLocation": "http://matsim.org/files/dtd/counts_v1.xsd",
+        "name": name,
+        "desc": desc,
+        "year": get_str(year),
+    }
 
     link_ids = get_link_ids(network_path)
     link_ids = np.random.choice(link_ids, int(0.1*len(link_ids)), replace=False)  # Select 10% of links to simulate counts for
@@ -35,12 +35,16 @@ def generate_counts_simulated(
         simulated_counts = np.random.normal(mean, std_dev, 24).clip(0, np.inf)  # Simulate 24 hours
         counts_data.append((link_id, station_id, simulated_counts))
 
-    for loc_id, cs_id, volumes in counts_data:
-        count = ET.SubElement(counts, "count", loc_id=get_str(loc_id), cs_id=get_str(cs_id))
-        for hour, val in enumerate(volumes, start=1):
-            ET.SubElement(count, "volume", h=get_str(hour), val=get_str(val))
-
-    ET.ElementTree(counts).write(outputpath, encoding="utf-8", xml_declaration=True)
+    with XmlWriter(
+        outputpath, compress, declaration=et_declaration("utf-8"), encoding="utf-8"
+    ) as writer:
+        writer.start("counts", counts_attrib)
+        for loc_id, cs_id, volumes in counts_data:
+            count = ET.Element("count", loc_id=get_str(loc_id), cs_id=get_str(cs_id))
+            for hour, val in enumerate(volumes, start=1):
+                ET.SubElement(count, "volume", h=get_str(hour), val=get_str(val))
+            writer.write_element(count)
+    return writer.path
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate XML counts using simulated data.")
@@ -51,6 +55,7 @@ if __name__ == "__main__":
     parser.add_argument("--desc", type=str, default="default", help="Description for the counts.")
     parser.add_argument("--mean", type=float, default=1000, help="Mean value for simulated counts.")
     parser.add_argument("--std_dev", type=float, default=100, help="Standard deviation for simulated counts.")
+    parser.add_argument("--compress", action="store_true", default=None, help="Write the counts as .xml.gz.")
 
     args = parser.parse_args()
 
@@ -62,4 +67,5 @@ if __name__ == "__main__":
         args.desc,
         args.mean,
         args.std_dev,
+        args.compress,
     )
@@ -5,6 +5,8 @@ import argparse
 import numpy as np
 
 from rlev.scripts.util import get_str
+from rlev.scripts.link_snapping import nearest_links
+from rlev.scripts.network_parser import parse_network_arrays
 from tqdm import tqdm
 
 def get_node_coords(network_file):
@@ -34,14 +36,28 @@ def parse_counts_xml(counts_file):
 
     return counts
 
+def _link_attrib(node_links, node_id):
+    if node_id in node_links:
+        return {"link": str(node_links[node_id])}
+    return {}
+
 def create_population_and_plans_xml_counts(
     network_xml_path,
     plans_output,
     num_agents=100,
+    snap_to_links=False,
 ):
     node_coords = get_node_coords(os.path.abspath(network_xml_path))
     plans_output = os.path.abspath(plans_output)
 
+    # Nearest link of every node, written into the activities so MATSim
+    # does not have to snap them at startup
+    node_links = {}
+    if snap_to_links:
+        network = parse_network_arrays(os.path.abspath(network_xml_path))
+        links = nearest_links(network, network.node_x, network.node_y)
+        node_links = dict(zip(network.node_ids.tolist(), network.link_ids[links]))
+
     plans = ET.Element("plans", attrib={"xml:lang": "de-CH"})
     node_ids = list(node_coords.keys())
     person_ids = []
@@ -81,6 +97,7 @@ def create_population_and_plans_xml_counts(
                 type="h",
                 x=str(origin_node[0]),
                 y=str(origin_node[1]),
+                **_link_attrib(node_links, origin_node_id),
                 end_time=start_time_str,
             )
             ET.SubElement(plan, "leg", mode="car")
@@ -90,6 +107,7 @@ def create_population_and_plans_xml_counts(
                 type="h",
                 x=str(dest_node[0]),
                 y=str(dest_node[1]),
+                **_link_attrib(node_links, dest_node_id),
                 start_time=start_time_str,
                 end_time=end_time_str,
             )
@@ -115,6 +133,7 @@ def main(args):
         args.network,
         args.plans_output,
         args.num_agents,
+        args.snap_to_links,
     )
 
 
@@ -132,5 +151,12 @@ if __name__ == "__main__":
         default=100,
     )
 
+    parser.add_argument(
+        "--snap_to_links",
+        action="store_true",
+        help="Write the nearest link of every activity into the plans so "
+        "MATSim does not snap them at startup",
+    )
+
     args = parser.parse_args()
     main(args)
@@ -1,11 +1,30 @@
 import xml.etree.ElementTree as ET
-import random
 import os
 import argparse
 import pandas as pd
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
-from rlev.scripts.util import save_xml, get_str
+from rlev.scripts.util import get_str
+from rlev.scripts.link_snapping import nearest_links
+from rlev.scripts.network_parser import parse_network_arrays, parse_node_attribute
+from rlev.scripts.od_weights import (
+    DEFAULT_WEIGHT_RADIUS,
+    build_alias_tables,
+    count_station_weights,
+    node_attribute_weights,
+    sample_nodes,
+)
+from rlev.scripts.xml_writer import (
+    XML_DECLARATION,
+    XmlWriter,
+    concatenate_parts,
+    doctype,
+    et_declaration,
+    is_gzip_path,
+    open_xml_output,
+    output_path,
+)
 
 def get_node_coords(network_file):
     tree = ET.parse(network_file)
@@ -90,6 +109,310 @@ def create_vehicle_definitions(ids, initial_soc):
 
     return ET.ElementTree(root)
 
+PLANS_DOCTYPE = doctype("plans", "http://www.matsim.org/files/dtd/plans_v4.dtd")
+PLANS_ATTRIB = {"xml:lang": "de-CH"}
+VEHICLE_TYPE_ID = "EV_65.0kWh"
+WRITE_CHUNK_SIZE = 100_000
+SHARD_SIZE = 250_000
+
+
+def sample_departure_hours(counts, population_multiplier=1):
+    """
+    Expands hourly counts into the departure hour index of every agent.
+
+    Args:
+        counts (array_like): Number of agents per hour.
+        population_multiplier (float): Factor applied to every hourly count.
+
+    Returns:
+        np.ndarray: Hour index of every agent, in ascending order.
+    """
+    per_hour = [
+        int(int(get_str(count)) * population_multiplier) for count in counts
+    ]
+    return np.repeat(np.arange(len(per_hour)), per_hour)
+
+
+def _time_str(hour):
+    return f"0{hour}:00:00" if hour < 10 else f"{hour}:00:00"
+
+
+START_TIMES = [_time_str((hour + 1) % 24) for hour in range(24)]
+END_TIMES = [_time_str((hour + 9) % 24) for hour in range(24)]
+
+
+def _format_node_xy(node_x, node_y, node_links=None):
+    if node_links is None:
+        return [f'x="{x}" y="{y}"' for x, y in zip(node_x.tolist(), node_y.tolist())]
+    return [
+        f'x="{x}" y="{y}" link="{link}"'
+        for x, y, link in zip(node_x.tolist(), node_y.tolist(), node_links.tolist())
+    ]
+
+
+def _format_persons(node_xy, first_person_id, origins, destinations, hours):
+    """
+    Serializes <person> elements in chunks of WRITE_CHUNK_SIZE.
+
+    Yields:
+        bytes: Serialized persons of one chunk.
+    """
+    for chunk_start in range(0, len(hours), WRITE_CHUNK_SIZE):
+        chunk = slice(chunk_start, chunk_start + WRITE_CHUNK_SIZE)
+        person_id = first_person_id + chunk_start
+        persons = zip(
+            range(person_id, person_id + len(hours[chunk])),
+            origins[chunk].tolist(),
+            destinations[chunk].tolist(),
+            (hours[chunk] % 24).tolist(),
+        )
+        yield "".join(
+            f'<person id="{person_id}"><plan selected="yes">'
+            f'<act type="h" {node_xy[origin]} '
+            f'end_time="{START_TIMES[hour]}" />'
+            '<leg mode="car" />'
+            f'<act type="h" {node_xy[dest]} '
+            f'start_time="{START_TIMES[hour]}" '
+            f'end_time="{END_TIMES[hour]}" /></plan></person>'
+            for person_id, origin, dest, hour in persons
+        ).encode()
+
+
+def _format_vehicles(ids, initial_soc):
+    """
+    Serializes <vehicle> elements in chunks of WRITE_CHUNK_SIZE.
+
+    Yields:
+        bytes: Serialized vehicles of one chunk.
+    """
+    ids = list(ids)
+    soc = str(initial_soc)
+    for chunk_start in range(0, len(ids), WRITE_CHUNK_SIZE):
+        yield "".join(
+            f'<vehicle id="{id}" type="{VEHICLE_TYPE_ID}"><attributes>'
+            f'<attribute name="initialSoc" class="java.lang.Double">{soc}'
+            "</attribute></attributes></vehicle>"
+            for id in ids[chunk_start : chunk_start + WRITE_CHUNK_SIZE]
+        ).encode()
+
+
+def write_plans_xml(
+    plans_output,
+    node_x,
+    node_y,
+    origins,
+    destinations,
+    hours,
+    compress=None,
+    node_links=None,
+):
+    """
+    Streams a plans XML file with one home-to-home car trip per agent. The
+    output is byte-identical to serializing the equivalent ElementTree.
+
+    Args:
+        plans_output (str): Path of the plans XML file.
+        node_x (np.ndarray): X coordinate of every node.
+        node_y (np.ndarray): Y coordinate of every node.
+        origins (np.ndarray): Origin node index of every agent.
+        destinations (np.ndarray): Destination node index of every agent.
+        hours (np.ndarray): Departure hour index of every agent, the trip
+            starts at hour index + 1.
+        compress (bool): Whether to write gzip, see xml_writer.output_path.
+        node_links (np.ndarray): ID of the link activities at every node are
+            snapped to, written as the link attribute of the activities.
+            Default is None, which leaves snapping to MATSim.
+
+    Returns:
+        Path: Path of the written file.
+    """
+    node_xy = _format_node_xy(node_x, node_y, node_links)
+    with XmlWriter(plans_output, compress, doctype=PLANS_DOCTYPE) as writer:
+        writer.start("plans", PLANS_ATTRIB)
+        for data in _format_persons(node_xy, 1, origins, destinations, hours):
+            writer.write_raw(data)
+    return writer.path
+
+
+def write_vehicle_definitions(vehicles_output, ids, initial_soc, compress=None):
+    """
+    Streams the vehicle definitions of create_vehicle_definitions to a file
+    without building the tree of every vehicle. The output is byte-identical
+    to saving that tree with save_xml.
+
+    Args:
+        vehicles_output (str): Path of the vehicles XML file.
+        ids (Iterable): Vehicle IDs.
+        initial_soc (float): Initial state of charge of every vehicle.
+        compress (bool): Whether to write gzip, see xml_writer.output_path.
+
+    Returns:
+        Path: Path of the written file.
+    """
+    root = create_vehicle_definitions([], initial_soc).getroot()
+
+    with XmlWriter(
+        vehicles_output,
+        compress,
+        declaration=et_declaration("UTF-8"),
+        encoding="UTF-8",
+    ) as writer:
+        writer.start(root.tag, root.attrib)
+        for vehicle_type in root:
+            writer.write_element(vehicle_type)
+        for data in _format_vehicles(ids, initial_soc):
+            writer.write_raw(data)
+    return writer.path
+
+
+_shard_node_xy = None
+_shard_alias_tables = None
+
+
+def _init_shard_worker(node_x, node_y, alias_tables=None, node_links=None):
+    global _shard_node_xy, _shard_alias_tables
+    _shard_node_xy = _format_node_xy(node_x, node_y, node_links)
+    _shard_alias_tables = alias_tables
+
+
+def _write_population_shard(task):
+    """
+    Samples and serializes the agents of one shard into part files. Runs in
+    a worker process initialized with _init_shard_worker.
+
+    Args:
+        task (tuple): First agent index, departure hour index of every agent
+            of the shard, SeedSequence of the shard, number of nodes, initial
+            state of charge, plans part path and vehicles part path. Parts
+            ending with .gz are gzipped.
+
+    Returns:
+        tuple[Path, Path]: Paths of the plans and vehicles parts.
+    """
+    start, hours, seed_seq, num_nodes, initial_soc, plans_part, vehicles_part = task
+    rng = np.random.default_rng(seed_seq)
+    if _shard_alias_tables is None:
+        origins = rng.integers(0, num_nodes, len(hours))
+        destinations = rng.integers(0, num_nodes, len(hours))
+    else:
+        # Hour index i departs at (i + 1) % 24 o'clock, see START_TIMES
+        day_hours = (hours + 1) % 24
+        origins = sample_nodes(rng, _shard_alias_tables, day_hours)
+        destinations = sample_nodes(rng, _shard_alias_tables, day_hours)
+
+    with open_xml_output(plans_part) as f:
+        for data in _format_persons(
+            _shard_node_xy, start + 1, origins, destinations, hours
+        ):
+            f.write(data)
+    with open_xml_output(vehicles_part) as f:
+        for data in _format_vehicles(
+            range(start + 1, start + len(hours) + 1), initial_soc
+        ):
+            f.write(data)
+    return plans_part, vehicles_part
+
+
+def write_population_sharded(
+    plans_output,
+    vehicles_output,
+    node_x,
+    node_y,
+    hours,
+    initial_soc,
+    seed_seq: np.random.SeedSequence,
+    workers=1,
+    compress=None,
+    node_weights=None,
+    node_links=None,
+):
+    """
+    Samples origins and destinations and writes the plans and vehicles XML
+    files in shards of SHARD_SIZE agents. Every shard draws from its own
+    stream spawned from seed_seq and is serialized into part files, which
+    are then concatenated with the person and vehicle IDs already offset.
+    Since the shards do not depend on the number of workers, the output is
+    byte-identical for a given seed whatever the number of workers.
+
+    Args:
+        plans_output (str): Path of the plans XML file.
+        vehicles_output (str): Path of the vehicles XML file.
+        node_x (np.ndarray): X coordinate of every node.
+        node_y (np.ndarray): Y coordinate of every node.
+        hours (np.ndarray): Departure hour index of every agent.
+        initial_soc (float): Initial state of charge of every vehicle.
+        seed_seq (np.random.SeedSequence): Seed the shard streams are
+            spawned from.
+        workers (int): Number of worker processes, 1 generates every shard
+            in this process. Default is 1.
+        compress (bool): Whether to write gzip, see xml_writer.output_path.
+        node_weights (np.ndarray): Weights origins and destinations are drawn
+            with, see od_weights.build_alias_tables. The alias tables are
+            built once and handed to every worker. Default is None, which
+            draws nodes uniformly.
+        node_links (np.ndarray): ID of the link activities at every node are
+            snapped to, see write_plans_xml.
+
+    Returns:
+        tuple[Path, Path]: Paths of the written plans and vehicles files.
+    """
+    plans_output = output_path(plans_output, compress)
+    alias_tables = None if node_weights is None else build_alias_tables(node_weights)
+    vehicles_output = output_path(vehicles_output, compress)
+
+    shard_starts = range(0, len(hours), SHARD_SIZE)
+    shard_seqs = seed_seq.spawn(len(shard_starts))
+    tasks = [
+        (
+            start,
+            hours[start : start + SHARD_SIZE],
+            shard_seq,
+            len(node_x),
+            initial_soc,
+            output_path(f"{plans_output}.part{shard}", is_gzip_path(plans_output)),
+            output_path(
+                f"{vehicles_output}.part{shard}", is_gzip_path(vehicles_output)
+            ),
+        )
+        for shard, (start, shard_seq) in enumerate(zip(shard_starts, shard_seqs))
+    ]
+
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(
+            min(workers, len(tasks)),
+            initializer=_init_shard_worker,
+            initargs=(node_x, node_y, alias_tables, node_links),
+        ) as executor:
+            parts = list(executor.map(_write_population_shard, tasks))
+    else:
+        _init_shard_worker(node_x, node_y, alias_tables, node_links)
+        parts = [_write_population_shard(task) for task in tasks]
+
+    plans_header = XML_DECLARATION + PLANS_DOCTYPE
+    vehicles_root = create_vehicle_definitions([], initial_soc).getroot()
+    vehicles_header = et_declaration("UTF-8") + ET.tostring(
+        vehicles_root, encoding="UTF-8"
+    )
+    vehicles_footer = f"</{vehicles_root.tag}>".encode()
+    assert vehicles_header.endswith(vehicles_footer)
+    vehicles_header = vehicles_header[: -len(vehicles_footer)]
+
+    if parts:
+        plans_header += ET.tostring(ET.Element("plans", PLANS_ATTRIB))[:-3] + b">"
+        plans_footer = b"</plans>"
+    else:
+        plans_header += ET.tostring(ET.Element("plans", PLANS_ATTRIB))
+        plans_footer = b""
+
+    concatenate_parts(
+        plans_output, plans_header, [part[0] for part in parts], plans_footer
+    )
+    concatenate_parts(
+        vehicles_output, vehicles_header, [part[1] for part in parts], vehicles_footer
+    )
+    return plans_output, vehicles_output
+
+
 def create_population_and_plans_xml_counts(
     network_xml_path,
     plans_output,
@@ -98,76 +421,115 @@ def create_population_and_plans_xml_counts(
     counts_path=None,
     population_multiplier=1,
     initial_soc=1,
+    seed=None,
+    compress=None,
+    workers=1,
+    node_weights=None,
+    weight_counts_path=None,
+    node_weight_attribute=None,
+    weight_radius=DEFAULT_WEIGHT_RADIUS,
+    snap_to_links=False,
 ):
-    node_coords = get_node_coords(os.path.abspath(network_xml_path))
+    """
+    Creates a population of EV agents with one home-to-home car trip each
+    and writes the plans and vehicles XML files. Departure hours follow the
+    counts file when given, otherwise a bimodal distribution around 8:00 and
+    17:00. Origins and destinations are drawn uniformly over the nodes unless
+    node weights are given, in which case they are drawn from alias tables
+    at O(1) per agent. Weight sources given together are multiplied.
+
+    Args:
+        network_xml_path (str): Path of the MATSim network XML file.
+        plans_output (str): Path of the plans XML file to write.
+        vehicles_output (str): Path of the vehicles XML file to write.
+        num_agents (int): Number of agents when no counts file is given.
+        counts_path (str): Counts file giving the number of agents per hour.
+        population_multiplier (float): Factor applied to every hourly count.
+        initial_soc (float): Initial state of charge of every vehicle.
+        seed (int): Seed of the random generator. Default is None, which
+            draws fresh entropy.
+        compress (bool): Whether to write the plans and vehicles as gzip,
+            adding .gz to the output paths when missing. Default is None,
+            which decides by the suffix of each path.
+        workers (int): Number of processes generating shards of agents in
+            parallel, see write_population_sharded. The output does not
+            depend on it. Default is 1.
+        node_weights (np.ndarray): (num_nodes,) or per-hour (num_nodes, 24)
+            weights of the nodes, in network document order.
+        weight_counts_path (str): Counts file whose stations weight the
+            nodes around them per hour, see od_weights.count_station_weights.
+        node_weight_attribute (str): Name of a numeric node attribute of the
+            network, such as population, weighting the nodes.
+        weight_radius (float): Reach of a count station, in network
+            coordinate units.
+        snap_to_links (bool): Whether to write the nearest link of every
+            activity into the plans, so MATSim does not have to snap the
+            activities to links at every startup. The nearest link of every
+            node is looked up once with a k-d tree. Default is False.
+
+    Returns:
+        tuple[Path, Path]: Paths of the written plans and vehicles files.
+    """
+    network_xml_path = os.path.abspath(network_xml_path)
+    network = parse_network_arrays(network_xml_path)
     plans_output = os.path.abspath(plans_output)
     vehicles_output = os.path.abspath(vehicles_output)
-
-    plans = ET.Element("plans", attrib={"xml:lang": "de-CH"})
-    node_ids = list(node_coords.keys())
-    person_ids = []
-    person_count = 1
+    hours_seq, shards_seq = np.random.SeedSequence(seed).spawn(2)
 
     if counts_path:
         counts_path = os.path.abspath(counts_path)
         counts = parse_counts_xml(counts_path)
     else:
-        dist1 = np.random.normal(8, 2.5, num_agents // 2)
-        dist2 = np.random.normal(17, 2.5, num_agents - len(dist1))
+        rng = np.random.default_rng(hours_seq)
+        dist1 = rng.normal(8, 2.5, num_agents // 2)
+        dist2 = rng.normal(17, 2.5, num_agents - len(dist1))
         dist = np.concatenate([dist1, dist2])
         dist = np.clip(dist, 0, 24)
         bins = np.arange(0, 24)
         counts, _ = np.histogram(dist, bins)
 
-    for i, count in enumerate(counts):
-        count = int(get_str(count))
-        for j in range(int(count * population_multiplier)):
-            origin_node_id = random.choice(node_ids)
-            dest_node_id = random.choice(node_ids)
-            origin_node = node_coords[origin_node_id]
-            dest_node = node_coords[dest_node_id]
-            person = ET.SubElement(plans, "person", id=str(person_count))
-            person_ids.append(person_count)
-            person_count += 1
-            plan = ET.SubElement(person, "plan", selected="yes")
-            start_time = (i + 1) % 24
-            end_time = (start_time + 8) % 24
-            start_time_str = (
-                f"0{start_time}:00:00" if start_time < 10 else f"{start_time}:00:00"
-            )
-            end_time_str = (
-                f"0{end_time}:00:00" if end_time < 10 else f"{end_time}:00:00"
-            )
-            ET.SubElement(
-                plan,
-                "act",
-                type="h",
-                x=str(origin_node[0]),
-                y=str(origin_node[1]),
-                end_time=start_time_str,
-            )
-            ET.SubElement(plan, "leg", mode="car")
-            ET.SubElement(
-                plan,
-                "act",
-                type="h",
-                x=str(dest_node[0]),
-                y=str(dest_node[1]),
-                start_time=start_time_str,
-                end_time=end_time_str,
-            )
-
-    vehicle_tree = create_vehicle_definitions(person_ids, initial_soc)
-    save_xml(vehicle_tree, vehicles_output)
-
-    tree = ET.ElementTree(plans)
-    with open(plans_output, "wb") as f:
-        f.write(b'<?xml version="1.0" ?>\n')
-        f.write(
-            b'<!DOCTYPE plans SYSTEM "http://www.matsim.org/files/dtd/plans_v4.dtd">\n'
+    hours = sample_departure_hours(counts, population_multiplier)
+
+    if node_weights is not None:
+        node_weights = np.asarray(node_weights, dtype=np.float64)
+        if node_weights.ndim == 1:
+            node_weights = node_weights[:, np.newaxis]
+    if node_weight_attribute:
+        attribute_weights = node_attribute_weights(
+            parse_node_attribute(network_xml_path, node_weight_attribute)
+        )
+        node_weights = (
+            attribute_weights
+            if node_weights is None
+            else node_weights * attribute_weights
+        )
+    if weight_counts_path:
+        station_weights = count_station_weights(
+            network, os.path.abspath(weight_counts_path), weight_radius
+        )
+        node_weights = (
+            station_weights if node_weights is None else node_weights * station_weights
         )
-        tree.write(f)
 
+    node_links = None
+    if snap_to_links:
+        node_links = network.link_ids[
+            nearest_links(network, network.node_x, network.node_y)
+        ]
+
+    return write_population_sharded(
+        plans_output,
+        vehicles_output,
+        network.node_x,
+        network.node_y,
+        hours,
+        initial_soc,
+        shards_seq,
+        workers,
+        compress,
+        node_weights,
+        node_links,
+    )
 
 
 def main(args):
@@ -185,6 +547,13 @@ def main(args):
         args.counts_path,
         args.pop_mulitiplier,
         args.percent_home_charge,
+        args.seed,
+        args.compress,
+        args.workers,
+        weight_counts_path=args.weight_counts_path,
+        node_weight_attribute=args.node_weight_attribute,
+        weight_radius=args.weight_radius,
+        snap_to_links=args.snap_to_links,
     )
 
 
@@ -226,5 +595,57 @@ if __name__ == "__main__":
         default=1,
     )
 
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="Seed of the random generator, random if not given",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="Write the plans and vehicles as .xml.gz",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of processes generating the population in parallel, "
+        "the output for a given seed does not depend on it",
+        default=1,
+    )
+
+    parser.add_argument(
+        "--weight_counts_path",
+        type=str,
+        help="Counts file whose stations weight origins and destinations "
+        "near them by their hourly volumes, uniform if not given",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--node_weight_attribute",
+        type=str,
+        help="Numeric node attribute of the network, such as population, "
+        "weighting origins and destinations",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--weight_radius",
+        type=float,
+        help="Reach of a count station in network coordinate units",
+        default=DEFAULT_WEIGHT_RADIUS,
+    )
+
+    parser.add_argument(
+        "--snap_to_links",
+        action="store_true",
+        help="Write the nearest link of every activity into the plans so "
+        "MATSim does not snap them at startup",
+    )
+
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,71 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+from rlev.scripts.network_parser import NetworkArrays
+
+
+def nearest_links(network: NetworkArrays, x, y) -> np.ndarray:
+    """
+    Finds the link of every point the way MATSim's NetworkUtils.getNearestLink
+    assigns activities given by coordinates to links at startup: the node
+    closest to the point is found first, then the link closest to the point
+    among the links into and out of that node. The result is therefore not
+    always the link closest to the point overall. Like MATSim, which assigns
+    activities on the car network, only links open to cars and their nodes
+    are considered. Ties go to the link that comes first in the network,
+    MATSim may break them differently. All points are queried at once.
+
+    Args:
+        network (NetworkArrays): The parsed network.
+        x (array_like): X coordinate of every point.
+        y (array_like): Y coordinate of every point.
+
+    Returns:
+        np.ndarray: Index of the link of every point.
+    """
+    if network.car_link is None:
+        links = np.arange(network.num_links)
+    else:
+        links = np.flatnonzero(network.car_link)
+    if len(links) == 0:
+        raise ValueError("Cannot snap to a network without car links")
+
+    points = np.column_stack(
+        [np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)]
+    )
+
+    # Incident links of every node, grouped by node in link order
+    ends = np.concatenate([network.from_idx[links], network.to_idx[links]])
+    incident = np.concatenate([links, links])
+    order = np.lexsort((incident, ends))
+    ends, incident = ends[order], incident[order]
+    nodes, starts, degrees = np.unique(ends, return_index=True, return_counts=True)
+
+    tree = cKDTree(np.column_stack([network.node_x[nodes], network.node_y[nodes]]))
+    _, nearest = tree.query(points)
+    offsets = np.arange(degrees.max())
+    valid = offsets < degrees[nearest][:, None]
+    candidates = incident[
+        np.minimum(starts[nearest][:, None] + offsets, len(incident) - 1)
+    ]
+
+    start_x = network.node_x[network.from_idx][candidates]
+    start_y = network.node_y[network.from_idx][candidates]
+    dx = network.node_x[network.to_idx][candidates] - start_x
+    dy = network.node_y[network.to_idx][candidates] - start_y
+    px = points[:, :1] - start_x
+    py = points[:, 1:] - start_y
+
+    squared_length = dx * dx + dy * dy
+    t = np.divide(
+        px * dx + py * dy,
+        squared_length,
+        out=np.zeros_like(squared_length),
+        where=squared_length > 0,
+    )
+    t = np.clip(t, 0.0, 1.0)
+    distance = (px - t * dx) ** 2 + (py - t * dy) ** 2
+    distance[~valid] = np.inf
+
+    closest = np.argmin(distance, axis=1)
+    return candidates[np.arange(len(points)), closest]
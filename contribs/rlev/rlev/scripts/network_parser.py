@@ -0,0 +1,248 @@
+import xml.etree.ElementTree as ET
+import os
+import numpy as np
+from dataclasses import dataclass
+from pathlib import Path
+
+
+LINK_ATTRIBUTES = ("length", "freespeed", "capacity")
+
+
+@dataclass
+class NetworkArrays:
+    """
+    Column-oriented representation of a MATSim network. Row i of every link
+    column describes the i-th link in document order, row j of every node
+    column describes the j-th node in document order.
+    """
+
+    node_ids: np.ndarray
+    node_x: np.ndarray
+    node_y: np.ndarray
+    link_ids: np.ndarray
+    from_idx: np.ndarray
+    to_idx: np.ndarray
+    length: np.ndarray
+    freespeed: np.ndarray
+    capacity: np.ndarray
+    # Whether every link is open to cars, None if unknown, in which case
+    # every link is taken to be
+    car_link: np.ndarray = None
+
+    @property
+    def num_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def num_links(self):
+        return len(self.link_ids)
+
+    def link_midpoints(self):
+        """
+        Computes the midpoint of every link.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: X and Y coordinates of the link
+                midpoints.
+        """
+        return (
+            (self.node_x[self.from_idx] + self.node_x[self.to_idx]) / 2,
+            (self.node_y[self.from_idx] + self.node_y[self.to_idx]) / 2,
+        )
+
+    def link_attr_matrix(self, dtype=np.float32):
+        """
+        Stacks the link attribute columns into an (num_links, 3) matrix
+        ordered as in LINK_ATTRIBUTES.
+
+        Args:
+            dtype (np.dtype): Output dtype. Default is float32.
+
+        Returns:
+            np.ndarray: Link attribute matrix.
+        """
+        return np.stack([self.length, self.freespeed, self.capacity], axis=1).astype(
+            dtype, copy=False
+        )
+
+
+def _estimate_capacity(network_xml_path, bytes_per_element):
+    """
+    Guesses how many elements a network file holds so the columns can be
+    preallocated, the columns still grow if the guess is too small.
+    """
+    return max(1024, os.path.getsize(network_xml_path) // bytes_per_element)
+
+
+def _grow(columns, capacity):
+    """
+    Doubles the capacity of every column in place.
+    """
+    for key, column in columns.items():
+        grown = np.empty(capacity, dtype=column.dtype)
+        grown[: len(column)] = column
+        columns[key] = grown
+
+
+def parse_network_arrays(network_xml_path: Path) -> NetworkArrays:
+    """
+    Parses a MATSim network XML file in a single streaming pass. Nodes and
+    links are written into preallocated NumPy columns and every element is
+    cleared as soon as it has been read, so memory stays proportional to the
+    size of the columns rather than the size of the document.
+
+    Args:
+        network_xml_path (Path): Path to the MATSim network XML file.
+
+    Returns:
+        NetworkArrays: The parsed network.
+    """
+    node_capacity = _estimate_capacity(network_xml_path, 160)
+    link_capacity = _estimate_capacity(network_xml_path, 320)
+    nodes = dict(
+        x=np.empty(node_capacity, dtype=np.float64),
+        y=np.empty(node_capacity, dtype=np.float64),
+    )
+    links = dict(
+        from_idx=np.empty(link_capacity, dtype=np.int64),
+        to_idx=np.empty(link_capacity, dtype=np.int64),
+        length=np.zeros(link_capacity, dtype=np.float64),
+        freespeed=np.zeros(link_capacity, dtype=np.float64),
+        capacity=np.zeros(link_capacity, dtype=np.float64),
+        car_link=np.empty(link_capacity, dtype=bool),
+    )
+    node_ids = []
+    link_ids = []
+    node_index = {}
+    num_nodes = 0
+    num_links = 0
+    container = None
+
+    for event, elem in ET.iterparse(network_xml_path, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            if tag == "nodes" or tag == "links":
+                container = elem
+            continue
+
+        if tag == "node":
+            if num_nodes == len(nodes["x"]):
+                _grow(nodes, 2 * num_nodes)
+            node_id = elem.get("id")
+            node_index[node_id] = num_nodes
+            node_ids.append(node_id)
+            nodes["x"][num_nodes] = float(elem.get("x"))
+            nodes["y"][num_nodes] = float(elem.get("y"))
+            num_nodes += 1
+            container.clear()
+        elif tag == "link":
+            if num_links == len(links["from_idx"]):
+                _grow(links, 2 * num_links)
+            attrib = elem.attrib
+            link_ids.append(attrib["id"])
+            links["from_idx"][num_links] = node_index[attrib["from"]]
+            links["to_idx"][num_links] = node_index[attrib["to"]]
+            for key in LINK_ATTRIBUTES:
+                value = attrib.get(key)
+                links[key][num_links] = float(value) if value is not None else 0.0
+            # MATSim opens links without modes to cars
+            modes = attrib.get("modes")
+            links["car_link"][num_links] = modes is None or "car" in (
+                mode.strip() for mode in modes.split(",")
+            )
+            num_links += 1
+            container.clear()
+
+    return NetworkArrays(
+        node_ids=np.array(node_ids, dtype=str),
+        node_x=nodes["x"][:num_nodes].copy(),
+        node_y=nodes["y"][:num_nodes].copy(),
+        link_ids=np.array(link_ids, dtype=str),
+        from_idx=links["from_idx"][:num_links].copy(),
+        to_idx=links["to_idx"][:num_links].copy(),
+        length=links["length"][:num_links].copy(),
+        freespeed=links["freespeed"][:num_links].copy(),
+        capacity=links["capacity"][:num_links].copy(),
+        car_link=links["car_link"][:num_links].copy(),
+    )
+
+
+def parse_node_attribute(
+    network_xml_path: Path, name: str, default: float = 0.0
+) -> np.ndarray:
+    """
+    Reads a numeric attribute of every node, such as a population or job
+    count stored as <attribute name="..."> in the node's <attributes>.
+
+    Args:
+        network_xml_path (Path): Path to the MATSim network XML file.
+        name (str): Name of the attribute.
+        default (float): Value of nodes without the attribute.
+
+    Returns:
+        np.ndarray: Attribute value of every node, in document order.
+    """
+    values = []
+    container = None
+    for event, elem in ET.iterparse(network_xml_path, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            if tag == "nodes":
+                container = elem
+            elif tag == "links":
+                break
+            continue
+
+        if tag == "node":
+            value = default
+            for attribute in elem.iter("attribute"):
+                if attribute.get("name") == name:
+                    value = float(attribute.text)
+                    break
+            values.append(value)
+            container.clear()
+
+    return np.array(values, dtype=np.float64)
+
+
+def parse_link_attribute(
+    network_xml_path: Path, name: str, default: float = 0.0
+) -> np.ndarray:
+    """
+    Reads a numeric attribute of every link, given either on the <link>
+    element itself, like the slopes written by update_slopes, or as
+    <attribute name="..."> in the link's <attributes>. Attributes holding
+    several comma or space separated values, such as the slopes of the
+    segments of a link, are averaged.
+
+    Args:
+        network_xml_path (Path): Path to the MATSim network XML file.
+        name (str): Name of the attribute.
+        default (float): Value of links without the attribute.
+
+    Returns:
+        np.ndarray: Attribute value of every link, in document order.
+    """
+    values = []
+    container = None
+    for event, elem in ET.iterparse(network_xml_path, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            if tag == "links":
+                container = elem
+            continue
+
+        if tag == "link":
+            text = elem.get(name)
+            if text is None:
+                for attribute in elem.iter("attribute"):
+                    if attribute.get("name") == name:
+                        text = attribute.text
+                        break
+            numbers = text.replace(",", " ").split() if text is not None else []
+            values.append(
+                np.mean([float(number) for number in numbers]) if numbers else default
+            )
+            container.clear()
+
+    return np.array(values, dtype=np.float64)
@@ -0,0 +1,165 @@
+import xml.etree.ElementTree as ET
+import numpy as np
+from pathlib import Path
+from scipy.sparse import csr_matrix
+from scipy.spatial import cKDTree
+
+from rlev.classes.alias_table import AliasTable
+from rlev.classes.id_index import IdIndex
+from rlev.scripts.network_parser import NetworkArrays
+
+
+HOURS_PER_DAY = 24
+DEFAULT_WEIGHT_RADIUS = 2000.0
+DEFAULT_BACKGROUND_SHARE = 0.05
+
+
+def parse_counts_volumes(counts_file: Path):
+    """
+    Reads the hourly volumes of every count station.
+
+    Args:
+        counts_file (Path): Path to the MATSim counts XML file.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Link ID each station counts on, and
+            an (num_stations, 24) matrix whose column h holds the volume of
+            h:00 to h+1:00, that is of <volume h="h+1">.
+    """
+    loc_ids = []
+    volumes = []
+    for _, elem in ET.iterparse(counts_file):
+        if elem.tag != "count":
+            continue
+        row = np.zeros(HOURS_PER_DAY, dtype=np.float64)
+        for volume in elem.iter("volume"):
+            hour = int(volume.get("h")) - 1
+            if 0 <= hour < HOURS_PER_DAY:
+                row[hour] += float(volume.get("val"))
+        loc_ids.append(elem.get("loc_id"))
+        volumes.append(row)
+        elem.clear()
+
+    return (
+        np.array(loc_ids, dtype=str),
+        np.array(volumes, dtype=np.float64).reshape(-1, HOURS_PER_DAY),
+    )
+
+
+def count_station_weights(
+    network: NetworkArrays,
+    counts_file: Path,
+    radius: float = DEFAULT_WEIGHT_RADIUS,
+    background_share: float = DEFAULT_BACKGROUND_SHARE,
+) -> np.ndarray:
+    """
+    Derives per-hour node weights from the proximity of count stations. A
+    station sits at the midpoint of its link and lends its hourly volume to
+    every node within radius, decaying linearly with distance. The node and
+    station pairs are found with a k-d tree, so the cost grows with the
+    number of pairs rather than with nodes times stations.
+
+    Args:
+        network (NetworkArrays): The parsed network.
+        counts_file (Path): Path to the MATSim counts XML file. Stations on
+            links missing from the network are ignored.
+        radius (float): Reach of a station, in network coordinate units.
+        background_share (float): Share of every hour spread uniformly over
+            all nodes, so nodes far from any station can still be drawn.
+
+    Returns:
+        np.ndarray: (num_nodes, 24) matrix whose columns sum to one, column
+            h weighting departures between h:00 and h+1:00.
+    """
+    loc_ids, volumes = parse_counts_volumes(counts_file)
+    known = np.isin(loc_ids, network.link_ids)
+    links = IdIndex(network.link_ids).indices_of(loc_ids[known])
+    volumes = volumes[known]
+
+    midpoint_x, midpoint_y = network.link_midpoints()
+    station_x = midpoint_x[links]
+    station_y = midpoint_y[links]
+
+    weights = np.zeros((network.num_nodes, HOURS_PER_DAY), dtype=np.float64)
+    if len(links):
+        node_tree = cKDTree(np.column_stack([network.node_x, network.node_y]))
+        station_tree = cKDTree(np.column_stack([station_x, station_y]))
+        pairs = node_tree.sparse_distance_matrix(
+            station_tree, radius, output_type="ndarray"
+        )
+        kernel = csr_matrix(
+            (1.0 - pairs["v"] / radius, (pairs["i"], pairs["j"])),
+            shape=(network.num_nodes, len(links)),
+        )
+        weights = np.asarray(kernel @ volumes)
+
+    totals = weights.sum(axis=0)
+    covered = totals > 0
+    weights[:, covered] *= (1.0 - background_share) / totals[covered]
+    weights[:, covered] += background_share / network.num_nodes
+    weights[:, ~covered] = 1.0 / network.num_nodes
+    return weights
+
+
+def node_attribute_weights(values) -> np.ndarray:
+    """
+    Turns a node attribute, such as population, into node weights that are
+    the same at every hour.
+
+    Args:
+        values (array_like): Non-negative attribute value of every node.
+
+    Returns:
+        np.ndarray: (num_nodes, 1) matrix summing to one.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    total = values.sum()
+    if total <= 0:
+        raise ValueError("Node weights must not all be zero")
+    return (values / total)[:, np.newaxis]
+
+
+def build_alias_tables(node_weights) -> list[AliasTable]:
+    """
+    Builds one alias table per column of a weight matrix.
+
+    Args:
+        node_weights (array_like): (num_nodes,) weights, or (num_nodes, 1)
+            or (num_nodes, 24) per-hour weights.
+
+    Returns:
+        list[AliasTable]: One table, or one table per hour of the day.
+    """
+    node_weights = np.asarray(node_weights, dtype=np.float64)
+    if node_weights.ndim == 1:
+        node_weights = node_weights[:, np.newaxis]
+    if node_weights.ndim != 2 or node_weights.shape[1] not in (1, HOURS_PER_DAY):
+        raise ValueError(
+            f"Node weights must have 1 or {HOURS_PER_DAY} columns, "
+            f"got shape {node_weights.shape}"
+        )
+    return [AliasTable(column) for column in node_weights.T]
+
+
+def sample_nodes(
+    rng: np.random.Generator, tables: list[AliasTable], hours: np.ndarray
+) -> np.ndarray:
+    """
+    Draws one node per agent from the table of its hour of the day.
+
+    Args:
+        rng (np.random.Generator): Random generator to draw from.
+        tables (list[AliasTable]): Tables returned by build_alias_tables.
+        hours (np.ndarray): Hour of the day of every agent.
+
+    Returns:
+        np.ndarray: Drawn node index of every agent.
+    """
+    if len(tables) == 1:
+        return tables[0].sample(rng, len(hours))
+
+    nodes = np.empty(len(hours), dtype=np.int64)
+    for hour in np.unique(hours):
+        agents = np.flatnonzero(hours == hour)
+        nodes[agents] = tables[hour].sample(rng, len(agents))
+    return nodes
@@ -0,0 +1,167 @@
+import gzip
+import xml.etree.ElementTree as ET
+import numpy as np
+from dataclasses import dataclass
+from pathlib import Path
+from rlev.scripts.xml_writer import is_gzip_path
+
+
+@dataclass
+class PlanArrays:
+    """
+    Column-oriented representation of the selected plans of a MATSim
+    population. Row i of every activity column describes the i-th activity
+    in document order. The activities of a person are contiguous, and a leg
+    leads from every activity to the next activity of the same person.
+    """
+
+    person_ids: np.ndarray
+    act_person: np.ndarray
+    act_x: np.ndarray
+    act_y: np.ndarray
+    act_link: np.ndarray
+    act_start: np.ndarray
+    act_end: np.ndarray
+
+    @property
+    def num_persons(self):
+        return len(self.person_ids)
+
+    @property
+    def num_activities(self):
+        return len(self.act_person)
+
+    def leg_origins(self) -> np.ndarray:
+        """
+        Finds the activities that are followed by a leg, which are the ones
+        followed by another activity of the same person.
+
+        Returns:
+            np.ndarray: Index of the activity every leg departs from, the
+                leg arrives at the next activity.
+        """
+        return np.flatnonzero(self.act_person[1:] == self.act_person[:-1])
+
+
+def parse_time(text: str) -> float:
+    """
+    Converts a MATSim time of the form HH:MM:SS or HH:MM, hours possibly
+    beyond 24, to seconds.
+    """
+    seconds = 0.0
+    for part in text.split(":"):
+        seconds = seconds * 60 + float(part)
+    if text.count(":") == 1:
+        seconds *= 60
+    return seconds
+
+
+def _open_xml(path: Path):
+    return gzip.open(path, "rb") if is_gzip_path(path) else open(path, "rb")
+
+
+def parse_plans(plans_xml_path: Path) -> PlanArrays:
+    """
+    Parses the selected plan of every person of a MATSim plans file, gzipped
+    or not, in a single streaming pass. Activities without a link keep an
+    empty link ID and are located by their coordinates. Times that are not
+    given are NaN, an activity with a max_dur and no end_time ends max_dur
+    after it starts.
+
+    Args:
+        plans_xml_path (Path): Path to the MATSim plans XML file.
+
+    Returns:
+        PlanArrays: The parsed plans.
+    """
+    person_ids = []
+    act_person = []
+    act_x = []
+    act_y = []
+    act_link = []
+    act_start = []
+    act_end = []
+    container = None
+    with _open_xml(plans_xml_path) as f:
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            if event == "start":
+                if elem.tag == "plans" or elem.tag == "population":
+                    container = elem
+                continue
+            if elem.tag != "person":
+                continue
+
+            plans = elem.findall("plan")
+            plan = next(
+                (plan for plan in plans if plan.get("selected") == "yes"),
+                plans[0] if plans else None,
+            )
+            if plan is not None:
+                person = len(person_ids)
+                person_ids.append(elem.get("id"))
+                for act in plan.iter("act"):
+                    start = act.get("start_time")
+                    end = act.get("end_time")
+                    start = parse_time(start) if start is not None else np.nan
+                    if end is not None:
+                        end = parse_time(end)
+                    elif act.get("max_dur") is not None:
+                        end = start + parse_time(act.get("max_dur"))
+                    else:
+                        end = np.nan
+                    act_person.append(person)
+                    act_x.append(float(act.get("x", "nan")))
+                    act_y.append(float(act.get("y", "nan")))
+                    act_link.append(act.get("link", ""))
+                    act_start.append(start)
+                    act_end.append(end)
+            if container is not None:
+                container.clear()
+
+    return PlanArrays(
+        person_ids=np.array(person_ids, dtype=str),
+        act_person=np.array(act_person, dtype=np.int64),
+        act_x=np.array(act_x, dtype=np.float64),
+        act_y=np.array(act_y, dtype=np.float64),
+        act_link=np.array(act_link, dtype=str),
+        act_start=np.array(act_start, dtype=np.float64),
+        act_end=np.array(act_end, dtype=np.float64),
+    )
+
+
+def parse_vehicles(vehicles_xml_path: Path) -> dict[str, tuple[float, float]]:
+    """
+    Reads the battery capacity and initial state of charge of every electric
+    vehicle of a MATSim vehicles file, gzipped or not.
+
+    Args:
+        vehicles_xml_path (Path): Path to the MATSim vehicles XML file.
+
+    Returns:
+        dict[str, tuple[float, float]]: Vehicle ID mapped to its capacity in
+            kWh and its initial state of charge between 0 and 1.
+    """
+
+    def attributes(elem):
+        return {
+            attribute.get("name"): attribute.text.strip()
+            for attribute in elem.iter()
+            if attribute.tag.rpartition("}")[2] == "attribute"
+        }
+
+    capacities = {}
+    vehicles = {}
+    with _open_xml(vehicles_xml_path) as f:
+        for _, elem in ET.iterparse(f):
+            tag = elem.tag.rpartition("}")[2]
+            if tag == "vehicleType":
+                capacity = attributes(elem).get("energyCapacityInKWhOrLiters")
+                if capacity is not None:
+                    capacities[elem.get("id")] = float(capacity)
+            elif tag == "vehicle":
+                capacity = capacities.get(elem.get("type"))
+                if capacity is not None:
+                    soc = float(attributes(elem).get("initialSoc", 1.0))
+                    vehicles[elem.get("id")] = (capacity, soc)
+                elem.clear()
+    return vehicles
@@ -0,0 +1,392 @@
+"""
+Stand-in for OCPRewardServer that speaks the same HTTP protocol without
+running MATSim. Reward requests are answered with deterministic synthetic
+rewards computed from the uploaded chargers file and with an output zip laid
+out like the one of the real server, so envs, the reward client and
+benchmarks can be exercised without Java or Maven. The time a simulation
+takes, the number of simulations the server runs at once and the size of
+the output can be configured to mimic a real deployment.
+
+Usage:
+    python -m rlev.scripts.reward_stub_server --port 8000 --latency 2 \
+        --workers 8 --output_size 50000000
+"""
+
+import argparse
+import contextlib
+import email.parser
+import email.policy
+import gzip
+import hashlib
+import io
+import json
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+from rlev.classes.chargers import DynamicCharger
+
+
+SCENARIO_HASH = re.compile(r"[0-9a-f]{16,128}")
+
+
+def parse_multipart(content_type: str, body: bytes) -> dict[str, bytes]:
+    """
+    Parses a multipart/form-data body.
+
+    Args:
+        content_type (str): Content-Type header of the request.
+        body (bytes): Request body.
+
+    Returns:
+        dict[str, bytes]: File name mapped to the contents of every file.
+    """
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body
+    )
+    files = {}
+    for part in message.iter_parts():
+        file_name = part.get_filename()
+        if file_name is not None:
+            files[Path(file_name).name] = part.get_payload(decode=True)
+    return files
+
+
+def parse_chargers(chargers_xml: bytes) -> list[dict[str, str]]:
+    """
+    Reads the attributes of every charger of a chargers XML file, gzipped or
+    not.
+    """
+    if chargers_xml[:2] == b"\x1f\x8b":
+        chargers_xml = gzip.decompress(chargers_xml)
+    return [charger.attrib for charger in ET.fromstring(chargers_xml).iter("charger")]
+
+
+def link_weight(link_id: str) -> float:
+    """
+    Pseudo-random weight in [0, 1) of a link, derived from its ID so that it
+    is the same in every process.
+    """
+    digest = hashlib.blake2b(link_id.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") / 2**64
+
+
+def synthetic_rewards(chargers: list[dict[str, str]]) -> dict[str, str]:
+    """
+    Derives rewards from a charger placement. Every charger contributes the
+    weight of its link, twice for dynamic chargers, so the rewards depend on
+    where chargers are placed and not only on how many there are. Charging
+    improves with diminishing returns and travel time drops slightly as the
+    contributions grow. The values are formatted like the reward server
+    formats them.
+
+    Args:
+        chargers (list[dict[str, str]]): Attributes of every charger, see
+            parse_chargers.
+
+    Returns:
+        dict[str, str]: Charge reward and time reward.
+    """
+    supply = sum(
+        link_weight(charger["link"])
+        * (2.0 if charger.get("type") == DynamicCharger.type else 1.0)
+        for charger in chargers
+    )
+    charge_reward = supply / (supply + 50.0)
+    time_reward = 0.1 / (1.0 + supply / 500.0)
+    return dict(charge_reward=str(charge_reward), time_reward=str(time_reward))
+
+
+def output_zip(message: dict, payload: bytes = b"") -> bytes:
+    """
+    Builds an output zip laid out like the one of the reward server, holding
+    small stand-ins of the files the envs read and an optional payload that
+    pads it to the size of a real simulation output.
+
+    Args:
+        message (dict): Response message, also stored as rewards.json.
+        payload (bytes): Contents of output/payload.bin, stored
+            uncompressed. Default is empty, which leaves it out.
+
+    Returns:
+        bytes: The zip file.
+    """
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w") as zip_file:
+        zip_file.writestr("output/rewards.json", json.dumps(message))
+        zip_file.writestr(
+            "output/scorestats.csv",
+            "ITERATION;avg_executed;avg_worst;avg_average;avg_best\n"
+            f"0;{message['charge_reward']};0.0;0.0;0.0\n",
+        )
+        zip_file.writestr(
+            "output/ITERS/it.0/0.legdurations.txt",
+            f"average leg duration: {float(message['time_reward']) * 86400} seconds\n",
+        )
+        if payload:
+            zip_file.writestr("output/payload.bin", payload)
+    return output.getvalue()
+
+
+class StubRewardHandler(BaseHTTPRequestHandler):
+    """
+    Handles /getReward and /uploadScenario like OCPRewardServer.
+    """
+
+    # Keep connections open across requests like the reward client expects
+    protocol_version = "HTTP/1.1"
+    server: "StubRewardServer"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            # Clients drop kept-alive connections after closing a response
+            # without reading its body
+            pass
+
+    def _send(self, status: int, message: dict, body: bytes = b""):
+        self.send_response(status)
+        self.send_header("X-Response-Message", json.dumps(message))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # Clients close responses whose output they do not need
+            pass
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        content_type = self.headers.get("Content-Type", "")
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if "multipart/form-data" not in content_type:
+            self._send(400, dict(error="bad_request"))
+            return
+
+        files = parse_multipart(content_type, body)
+        self.server.count(url.path, len(body))
+        if url.path == "/uploadScenario":
+            self._upload_scenario(params.get("scenario_hash"), files)
+        elif url.path == "/getReward":
+            self._get_reward(params.get("scenario_hash"), files)
+        else:
+            self._send(404, dict(error="not_found"))
+
+    def _upload_scenario(self, scenario_hash: str, files: dict[str, bytes]):
+        scenario_path = self.server.scenario_path(scenario_hash)
+        if scenario_path is None:
+            self._send(400, dict(error="bad_request"))
+            return
+
+        tmp_path = Path(tempfile.mkdtemp(dir=self.server.storage_dir))
+        try:
+            for file_name, content in files.items():
+                Path(tmp_path, file_name).write_bytes(content)
+            tmp_path.rename(scenario_path)
+        except OSError:
+            # Another upload of the same scenario was moved into place first
+            if not scenario_path.is_dir():
+                raise
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        self._send(200, dict(scenario_hash=scenario_hash))
+
+    def _get_reward(self, scenario_hash: str, files: dict[str, bytes]):
+        if scenario_hash is not None:
+            scenario_path = self.server.scenario_path(scenario_hash)
+            if scenario_path is None or not scenario_path.is_dir():
+                self._send(404, dict(error="unknown_scenario"))
+                return
+
+        chargers = [name for name in files if "charger" in name]
+        if not chargers or not any("config" in name for name in files):
+            self._send(400, dict(error="missing_files"))
+            return
+
+        message = dict(
+            synthetic_rewards(parse_chargers(files[chargers[0]])), filetype="output"
+        )
+        with self.server.workers:
+            time.sleep(self.server.simulation_time())
+        if self.server.take_initial_response():
+            message["filetype"] = "initialoutput"
+
+        self._send(200, message, output_zip(message, self.server.payload))
+
+
+class StubRewardServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server holding uploaded scenarios in a directory and
+    counting the requests and bytes it receives per endpoint. Every reward
+    request waits for one of a fixed number of workers and holds it for the
+    simulated time, like simulations queue on the reward server.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        address=("localhost", 0),
+        storage_dir=None,
+        verbose=False,
+        latency=0.0,
+        jitter=0.0,
+        workers=None,
+        output_size=0,
+        seed=0,
+    ):
+        """
+        Initializes the StubRewardServer.
+
+        Args:
+            address (tuple[str, int]): Host and port to listen on, port 0
+                picks a free one. Default is localhost on a free port.
+            storage_dir (Path): Directory holding uploaded scenarios.
+                Default is None, which uses a temporary directory removed by
+                server_close.
+            verbose (bool): Whether to log every request.
+            latency (float): Seconds a simulation takes. Default is 0.
+            jitter (float): Seconds the simulation time varies by, drawn
+                uniformly from latency +- jitter. Default is 0.
+            workers (int): Number of simulations run at once, further
+                requests wait. Default is None, which runs every request
+                right away.
+            output_size (int): Bytes of incompressible payload added to every
+                output zip. Default is 0.
+            seed (int): Seed of the simulation times.
+        """
+        super().__init__(address, StubRewardHandler)
+        self._tmp_dir = None
+        if storage_dir is None:
+            self._tmp_dir = tempfile.mkdtemp(prefix="rlev-stub-")
+            storage_dir = self._tmp_dir
+        self.storage_dir = Path(storage_dir)
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        self.verbose = verbose
+        self.requests = Counter()
+        self.bytes_received = Counter()
+        self._lock = threading.Lock()
+        self._initial_response = True
+        self.latency = latency
+        self.jitter = jitter
+        self.workers = (
+            threading.BoundedSemaphore(workers) if workers else contextlib.nullcontext()
+        )
+        self.payload = random.Random(seed).randbytes(output_size)
+        self._random = random.Random(seed)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def scenario_path(self, scenario_hash: str) -> Path:
+        if scenario_hash is None or not SCENARIO_HASH.fullmatch(scenario_hash):
+            return None
+        return Path(self.storage_dir, scenario_hash)
+
+    def count(self, endpoint: str, num_bytes: int):
+        with self._lock:
+            self.requests[endpoint] += 1
+            self.bytes_received[endpoint] += num_bytes
+
+    def simulation_time(self) -> float:
+        with self._lock:
+            offset = self._random.uniform(-self.jitter, self.jitter)
+        return max(0.0, self.latency + offset)
+
+    def take_initial_response(self) -> bool:
+        with self._lock:
+            initial, self._initial_response = self._initial_response, False
+        return initial
+
+    def start(self) -> threading.Thread:
+        """
+        Serves requests from a daemon thread.
+
+        Returns:
+            threading.Thread: The serving thread.
+        """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def server_close(self):
+        super().server_close()
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+
+def main(args):
+    server = StubRewardServer(
+        (args.host, args.port),
+        args.storage_dir,
+        verbose=True,
+        latency=args.latency,
+        jitter=args.jitter,
+        workers=args.workers,
+        output_size=args.output_size,
+        seed=args.seed,
+    )
+    print(f"Stub reward server is running on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run a stand-in reward server returning synthetic rewards.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--host", type=str, default="localhost")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--storage_dir",
+        type=str,
+        default=None,
+        help="Directory holding uploaded scenarios, a temporary one if not given.",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds a simulation takes."
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        help="Seconds the simulation time varies by, uniformly.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of simulations run at once, unlimited if not given.",
+    )
+    parser.add_argument(
+        "--output_size",
+        type=int,
+        default=0,
+        help="Bytes of incompressible payload added to every output zip.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    main(args)
@@ -3,12 +3,18 @@ import numpy as np
 import os
 import argparse
 import shutil
-from contribs.ev.evsim.scripts.util import setup_config, load_Q, save_csv_and_plot, get_link_ids, e_greedy
-from rlev.scripts.create_population_ev import (
-    create_population_and_plans_xml_counts,
-    get_node_coords,
+from rlev.classes.reward_cache import RewardCache, charger_placement_hash
+from rlev.scripts.util import (
+    setup_config,
+    load_Q,
+    save_csv_and_plot,
+    get_link_ids,
+    e_greedy,
+    hash_config,
+    hash_file,
 )
-from rlev.scripts.create_chargers import create_chargers_xml
+from rlev.scripts.create_population_ev import create_population_and_plans_xml_counts
+from rlev.scripts.create_chargers import create_chargers_xml, read_charger_placements
 from pathlib import Path
 from datetime import datetime
 
@@ -27,12 +33,14 @@ def main(args):
         plans_file_name,
         vehicles_file_name,
         chargers_file_name,
+        counts_file_name,
     ) = setup_config(args.config_path, output_path, args.num_matsim_iters - 1)
 
     network_path = os.path.join(scenario_path, network_file_name)
     plans_path = os.path.join(scenario_path, plans_file_name)
     vehicles_path = os.path.join(scenario_path, vehicles_file_name)
     chargers_path = os.path.join(scenario_path, chargers_file_name)
+    counts_path = os.path.join(scenario_path, counts_file_name)
 
     os.makedirs(results_path, exist_ok=False)
 
@@ -43,16 +51,27 @@ def main(args):
     q_path = os.path.join(results_path, "Q.csv")
     best_output_path = os.path.join(results_path / "best_output")
 
-    node_coords = get_node_coords(network_path)
-    create_population_and_plans_xml_counts(
-        node_coords,
-        plans_path,
-        vehicles_path,
-        args.num_agents,
-        counts_path=args.counts_path,
-        population_multiplier=args.pop_multiplier,
-        initial_soc=args.initial_soc,
-    )
+    if args.num_agents:
+        create_population_and_plans_xml_counts(
+            network_path,
+            plans_path,
+            vehicles_path,
+            args.num_agents,
+            counts_path=args.counts_path,
+            population_multiplier=args.pop_multiplier,
+            initial_soc=args.initial_soc,
+        )
+
+    # Scores of charger placements simulated before, in this run or an
+    # earlier one on the same scenario
+    reward_cache = None
+    if not args.no_reward_cache:
+        reward_cache = RewardCache()
+        scenario_hash = "".join(
+            hash_file(path)
+            for path in (network_path, plans_path, vehicles_path, counts_path)
+        )
+        config_hash = hash_config(args.config_path)
 
     algorithm_results = pd.DataFrame(
         columns=["iteration", "avg_score", "selected_links"]
@@ -83,10 +102,28 @@ def main(args):
 
         create_chargers_xml(chosen_links, chargers_path, args.percent_dynamic)
 
-        os.system(f'mvn -e exec:java -Dexec.args="{args.config_path}"')
-        scores = pd.read_csv(os.path.join(output_path, "scorestats.csv"), sep=";")
-
-        average_score = scores["avg_executed"].iloc[-1]
+        cached = None
+        if reward_cache is not None:
+            cache_key = reward_cache.key(
+                scenario_hash,
+                charger_placement_hash(read_charger_placements(chargers_path)),
+                config=config_hash,
+                score="avg_executed",
+            )
+            cached = reward_cache.get(cache_key)
+
+        if cached is not None:
+            average_score = cached["average_score"]
+            print(f"Reusing cached score {average_score} {reward_cache.stats()}")
+        else:
+            os.system(f'mvn -e exec:java -Dexec.args="{args.config_path}"')
+            scores = pd.read_csv(
+                os.path.join(output_path, "scorestats.csv"), sep=";"
+            )
+
+            average_score = scores["avg_executed"].iloc[-1]
+            if reward_cache is not None:
+                reward_cache.put(cache_key, dict(average_score=float(average_score)))
 
         algorithm_results, Q = save_csv_and_plot(
             chosen_links,
@@ -101,7 +138,9 @@ def main(args):
 
         if average_score > max_score:
             max_score = average_score
-            shutil.copytree(output_path, best_output_path, dirs_exist_ok=True)
+            # A cached score has no output of this run to keep
+            if cached is None:
+                shutil.copytree(output_path, best_output_path, dirs_exist_ok=True)
 
 
 def print_run_info(current_run, total_runs):
@@ -195,6 +234,13 @@ if __name__ == "__main__":
         "--max_ram", type=int, help="Maximum memory in gigs used by the program"
     )
 
+    argparser.add_argument(
+        "--no_reward_cache",
+        action="store_true",
+        help="Simulate every charger placement instead of reusing the score \
+            of placements simulated before",
+    )
+
     args = argparser.parse_args()
 
     main(args)
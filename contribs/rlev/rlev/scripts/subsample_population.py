@@ -0,0 +1,159 @@
+import argparse
+import re
+from pathlib import Path
+from typing import Callable
+import numpy as np
+from rlev.scripts.population_parser import _open_xml
+from rlev.scripts.xml_writer import open_xml_output
+
+_ID = re.compile(rb'\bid="([^"]*)"')
+_WHITESPACE = re.compile(rb"\s*")
+
+
+def filter_elements(
+    xml_path: Path,
+    output_path: Path,
+    tag: str,
+    keep: Callable[[bytes], bool],
+    chunk_size: int = 1 << 20,
+) -> Path:
+    """
+    Copies an XML file, gzipped or not, leaving out the elements with a
+    given name that are rejected by a predicate. The file is processed as
+    bytes in chunks, so everything else, including the DOCTYPE and the
+    formatting, is kept as is. Elements with the name must not be nested in
+    each other, and their start tags must not contain a ">" in an attribute
+    value.
+
+    Args:
+        xml_path (Path): Path of the XML file.
+        output_path (Path): Path to write to, gzipped if it ends with .gz.
+        tag (str): Name of the elements to filter.
+        keep (Callable[[bytes], bool]): Called with the start tag of every
+            element with the name, in document order, returns whether to
+            keep the element.
+        chunk_size (int): Number of bytes read at once.
+
+    Returns:
+        Path: The output path.
+    """
+    start_pattern = re.compile(rb"<%s[\s/>]" % tag.encode())
+    end_tag = b"</%s>" % tag.encode()
+    buffer = b""
+    with _open_xml(xml_path) as f, open_xml_output(output_path) as out:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            buffer += chunk
+            position = 0
+            while True:
+                match = start_pattern.search(buffer, position)
+                if match is None:
+                    # The end of the buffer may hold the start of a tag
+                    flushed = max(position, len(buffer) - len(tag) - 2)
+                    out.write(buffer[position:flushed])
+                    position = flushed
+                    break
+                out.write(buffer[position : match.start()])
+                position = match.start()
+                start_end = buffer.find(b">", position)
+                if start_end < 0:
+                    break
+                if buffer[start_end - 1 : start_end] == b"/":
+                    end = start_end + 1
+                else:
+                    end = buffer.find(end_tag, start_end)
+                    if end < 0:
+                        break
+                    end += len(end_tag)
+                if keep(buffer[position : start_end + 1]):
+                    out.write(buffer[position:end])
+                else:
+                    # Also leave out the indentation of the next element
+                    end = _WHITESPACE.match(buffer, end).end()
+                position = end
+            buffer = buffer[position:]
+        out.write(buffer)
+    return Path(output_path)
+
+
+def subsample_population(
+    plans_xml_path: Path,
+    vehicles_xml_path: Path,
+    plans_output: Path,
+    vehicles_output: Path,
+    fraction: float,
+    seed: int = 0,
+) -> tuple[Path, Path]:
+    """
+    Writes a random sample of the persons of a MATSim population and of
+    their vehicles, for simulating the scenario at a fraction of its cost.
+    Every person is kept with the given probability. Vehicles are matched to
+    persons by ID, as MATSim does with usePersonIdForMissingVehicleId, and
+    vehicles of persons left out are left out as well.
+
+    Args:
+        plans_xml_path (Path): Path to the MATSim plans XML file.
+        vehicles_xml_path (Path): Path to the MATSim vehicles XML file.
+        plans_output (Path): Path to write the sampled plans to, gzipped if
+            it ends with .gz.
+        vehicles_output (Path): Path to write the sampled vehicles to.
+        fraction (float): Probability of keeping every person.
+        seed (int): Seed of the sample. Default is 0.
+
+    Returns:
+        tuple[Path, Path]: Paths of the written plans and vehicles files.
+    """
+    if not 0 < fraction <= 1:
+        raise ValueError(f"Sample fraction must be in (0, 1], got {fraction}")
+    rng = np.random.default_rng(seed)
+    kept_ids = set()
+
+    def keep_person(start_tag):
+        if rng.random() >= fraction:
+            return False
+        kept_ids.add(_ID.search(start_tag).group(1))
+        return True
+
+    def keep_vehicle(start_tag):
+        return _ID.search(start_tag).group(1) in kept_ids
+
+    plans_output = filter_elements(plans_xml_path, plans_output, "person", keep_person)
+    vehicles_output = filter_elements(
+        vehicles_xml_path, vehicles_output, "vehicle", keep_vehicle
+    )
+    return plans_output, vehicles_output
+
+
+def main(args):
+    """
+    Writes a random sample of a MATSim population and its vehicles.
+
+    Args:
+        args (argparse.Namespace): Parsed command-line arguments.
+    """
+    plans_output, vehicles_output = subsample_population(
+        Path(args.plans),
+        Path(args.vehicles),
+        Path(args.plans_output),
+        Path(args.vehicles_output),
+        args.fraction,
+        args.seed,
+    )
+    print(f"Wrote {plans_output} and {vehicles_output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Sample a fraction of the persons of a MATSim population.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("plans", type=str, help="Path to the plans XML file.")
+    parser.add_argument("vehicles", type=str, help="Path to the vehicles XML file.")
+    parser.add_argument("plans_output", type=str)
+    parser.add_argument("vehicles_output", type=str)
+    parser.add_argument(
+        "--fraction", type=float, default=0.1, help="Share of persons to keep."
+    )
+    parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    main(args)
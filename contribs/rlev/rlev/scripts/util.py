@@ -3,6 +3,7 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import os
+import hashlib
 
 
 def get_link_ids(network_file):
@@ -65,6 +66,79 @@ def setup_config(config_xml_path, output_dir, num_iterations=0):
     return network_file, plans_file, vehicles_file, chargers_file, counts_file
 
 
+def set_config_params(config_xml_path, params):
+    """
+    Sets parameters of a MATSim config XML file, wherever they appear.
+
+    Args:
+        config_xml_path (str): Path to the config XML file.
+        params (dict[str, str]): Parameter name mapped to its new value.
+    """
+    tree = ET.parse(config_xml_path)
+    root = tree.getroot()
+
+    for param in root.iter("param"):
+        if param.get("name") in params:
+            param.set("value", str(params[param.get("name")]))
+
+    with open(config_xml_path, "wb") as f:
+        f.write(b'<?xml version="1.0" ?>\n')
+        f.write(
+            b'<!DOCTYPE config SYSTEM "http://www.matsim.org/files/dtd/config_v2.dtd">\n'
+        )
+        tree.write(f)
+
+
+def get_config_params(config_xml_path):
+    """
+    Reads the parameters of a MATSim config XML file.
+
+    Args:
+        config_xml_path (str): Path to the config XML file.
+
+    Returns:
+        dict[str, str]: Parameter name mapped to its value. Parameters of
+            parameter sets are left out.
+    """
+    root = ET.parse(config_xml_path).getroot()
+    return {
+        param.get("name"): param.get("value")
+        for module in root.findall("module")
+        for param in module.findall("param")
+    }
+
+
+def set_module_params(config_xml_path, module_name, params):
+    """
+    Sets parameters of a module of a MATSim config XML file, adding the ones
+    that are missing and the module itself if needed.
+
+    Args:
+        config_xml_path (str): Path to the config XML file.
+        module_name (str): Name of the module.
+        params (dict[str, str]): Parameter name mapped to its new value.
+    """
+    tree = ET.parse(config_xml_path)
+    root = tree.getroot()
+
+    module = root.find(f"module[@name='{module_name}']")
+    if module is None:
+        module = ET.SubElement(root, "module", name=module_name)
+    existing = {param.get("name"): param for param in module.findall("param")}
+    for name, value in params.items():
+        if name in existing:
+            existing[name].set("value", str(value))
+        else:
+            ET.SubElement(module, "param", name=name, value=str(value))
+
+    with open(config_xml_path, "wb") as f:
+        f.write(b'<?xml version="1.0" ?>\n')
+        f.write(
+            b'<!DOCTYPE config SYSTEM "http://www.matsim.org/files/dtd/config_v2.dtd">\n'
+        )
+        tree.write(f)
+
+
 def get_str(num):
     """
     Converts a number to a string, removing commas and ".0".
@@ -281,3 +355,48 @@ def extract_paths_from_config(config_xml_path):
         chargers_file,
         q_values_file,
     )
+
+
+def hash_file(file_path, hasher=None, chunk_size=1 << 20):
+    """
+    Computes a content hash of a file without reading it into memory at once.
+
+    Args:
+        file_path (str): Path to the file.
+        hasher (hashlib._Hash): Hash object to update, a new sha256 hash is
+            used if none is given.
+        chunk_size (int): Number of bytes read per chunk.
+
+    Returns:
+        str: Hex digest of the file contents.
+    """
+    hasher = hasher or hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def hash_config(config_xml_path, ignore=("outputDirectory",)):
+    """
+    Computes a hash of the parameters of a MATSim config XML file, so that
+    configs differing only in formatting or in the ignored parameters hash
+    the same.
+
+    Args:
+        config_xml_path (str): Path to the config XML file.
+        ignore (tuple[str]): Names of parameters left out of the hash, by
+            default the output directory, which differs between workspaces.
+
+    Returns:
+        str: Hex digest of the parameters.
+    """
+    root = ET.parse(config_xml_path).getroot()
+    params = []
+    for module in root.iter("module"):
+        for param in module.iter("param"):
+            if param.get("name") not in ignore:
+                params.append(
+                    (module.get("name"), param.get("name"), param.get("value"))
+                )
+    return hashlib.sha256(repr(params).encode()).hexdigest()
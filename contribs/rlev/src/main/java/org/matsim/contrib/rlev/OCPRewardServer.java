@@ -15,9 +15,13 @@ import java.io.OutputStream;
 import java.io.Reader;
 import java.net.InetSocketAddress;
 import java.net.URL;
+import java.net.URLDecoder;
 import java.nio.charset.StandardCharsets;
 import java.nio.file.Path;
+import java.nio.file.StandardCopyOption;
 import java.util.ArrayList;
+import java.util.HashMap;
+import java.util.Map;
 import java.util.concurrent.BlockingQueue;
 import java.util.concurrent.ExecutorService;
 import java.util.concurrent.Executors;
@@ -39,6 +43,7 @@ import com.sun.net.httpserver.HttpExchange;
 import com.sun.net.httpserver.HttpHandler;
 import com.sun.net.httpserver.HttpServer;
 import java.util.concurrent.atomic.AtomicBoolean;
+import java.util.zip.GZIPInputStream;
 import java.util.zip.ZipEntry;
 import java.util.zip.ZipOutputStream;
 
@@ -62,6 +67,10 @@ public class OCPRewardServer {
     private final String className = "org.matsim.contrib.rlev.example.RunEvExampleWithEvScoringWithLTHConsumption";
     private AtomicDouble bestReward = new AtomicDouble(Double.NEGATIVE_INFINITY);
     private AtomicBoolean initialResponse = new AtomicBoolean(true);
+    // Static scenario files uploaded once through /uploadScenario, one
+    // directory per scenario hash
+    private final Path scenarioStore = new File("/tmp/rlev-scenarios").toPath();
+    private static final Pattern SCENARIO_HASH = Pattern.compile("[0-9a-f]{16,128}");
 
     public OCPRewardServer(int threadPoolSize){
         this.threadPoolSize = threadPoolSize;
@@ -76,6 +85,7 @@ public class OCPRewardServer {
         HttpServer server = HttpServer.create(new InetSocketAddress(port), 0);
         System.setProperty("matsim.preferLocalDtds", "true");
         server.createContext("/getReward", rewardServer.new RewardHandler());
+        server.createContext("/uploadScenario", rewardServer.new UploadScenarioHandler());
         server.setExecutor(null); // creates a default executor
         System.out.println("Starting reward server...");
         server.start();
@@ -302,10 +312,14 @@ public class OCPRewardServer {
 
     public static double getAverageEnergyCapacity(String filePath) {
         try {
-            File xmlFile = new File(filePath);
             DocumentBuilderFactory factory = DocumentBuilderFactory.newInstance();
             DocumentBuilder builder = factory.newDocumentBuilder();
-            Document document = builder.parse(xmlFile);
+            Document document;
+            try (InputStream is = filePath.endsWith(".gz")
+                    ? new GZIPInputStream(new FileInputStream(filePath))
+                    : new FileInputStream(filePath)) {
+                document = builder.parse(is);
+            }
             document.getDocumentElement().normalize();
 
             NodeList vehicleTypes = document.getElementsByTagName("vehicleType");
@@ -345,37 +359,36 @@ public class OCPRewardServer {
                 return;
             }
 
-            String boundary = contentType.split("boundary=")[1];
-
-            // Read the request body
-            InputStream inputStream = exchange.getRequestBody();
-            ByteArrayOutputStream bodyOutput = new ByteArrayOutputStream();
-            byte[] buffer = new byte[1024];
-            int bytesRead;
-            while ((bytesRead = inputStream.read(buffer)) != -1) {
-                bodyOutput.write(buffer, 0, bytesRead);
-            }
-            byte[] body = bodyOutput.toByteArray();
-
-            // Split the body by the boundary
-            String bodyString = new String(body, StandardCharsets.UTF_8);
-            String[] parts = bodyString.split(boundary);
-
             String folderString = Long.toString(System.nanoTime()); 
             Path folderPath = new File("/tmp/" + folderString).toPath();
 
             folderPath.toFile().mkdirs();
+            List<String> fileNames = saveMultipartFiles(exchange, contentType, folderPath);
             Path configPath = null;
-            for (String part : parts) {
-                if (part.contains("Content-Disposition")) {
-                    String[] lines = part.split("\r\n");
-                    String fileName = extractFileName(lines);
-                    if (fileName != null) {
-                        if (fileName.contains("config")) {
-                            configPath = new File(folderPath + "/" + fileName).toPath();
-                        }
-                        byte[] fileContent = extractFileContent(part);
-                        saveFile(folderPath, fileName, fileContent);
+            for (String fileName : fileNames) {
+                if (fileName.contains("config")) {
+                    configPath = new File(folderPath + "/" + fileName).toPath();
+                }
+            }
+
+            // Requests with a scenario hash only carry the files that change
+            // between steps, the static ones are linked from the scenario store
+            String scenarioHash = parseQuery(exchange.getRequestURI().getRawQuery()).get("scenario_hash");
+            if (scenarioHash != null) {
+                Path scenarioPath = scenarioPath(scenarioHash);
+                if (scenarioPath == null || !scenarioPath.toFile().isDirectory()) {
+                    FileUtils.deleteDirectory(folderPath.toFile());
+                    JSONObject response = new JSONObject();
+                    response.put("error", "unknown_scenario");
+                    exchange.getResponseHeaders().set("X-Response-Message", response.toString());
+                    exchange.sendResponseHeaders(404, -1);
+                    exchange.close();
+                    return;
+                }
+                for (File scenarioFile : scenarioPath.toFile().listFiles()) {
+                    Path link = folderPath.resolve(scenarioFile.getName());
+                    if (!link.toFile().exists()) {
+                        Files.createSymbolicLink(link, scenarioFile.toPath().toAbsolutePath());
                     }
                 }
             }
@@ -395,6 +408,99 @@ public class OCPRewardServer {
         }
     }
 
+    public class UploadScenarioHandler implements HttpHandler {
+        @Override
+        public void handle(HttpExchange exchange) throws IOException {
+            String contentType = exchange.getRequestHeaders().getFirst("Content-Type");
+            Path scenarioPath = scenarioPath(
+                parseQuery(exchange.getRequestURI().getRawQuery()).get("scenario_hash"));
+            if (contentType == null || !contentType.contains("multipart/form-data")
+                    || scenarioPath == null) {
+                exchange.sendResponseHeaders(400, -1); // Bad request
+                return;
+            }
+
+            // Files are stored in a temporary directory and moved into place,
+            // so reward requests never see a partially uploaded scenario
+            Path tmpPath = scenarioStore.resolve("." + scenarioPath.getFileName() + "." + System.nanoTime());
+            tmpPath.toFile().mkdirs();
+            try {
+                saveMultipartFiles(exchange, contentType, tmpPath);
+                if (!scenarioPath.toFile().exists()) {
+                    Files.move(tmpPath, scenarioPath, StandardCopyOption.ATOMIC_MOVE);
+                    System.out.println("Stored scenario " + scenarioPath.getFileName());
+                }
+            } catch (IOException e) {
+                // Another upload of the same scenario was moved into place first
+                if (!scenarioPath.toFile().isDirectory()) {
+                    throw e;
+                }
+            } finally {
+                FileUtils.deleteDirectory(tmpPath.toFile());
+            }
+
+            JSONObject response = new JSONObject();
+            response.put("scenario_hash", scenarioPath.getFileName().toString());
+            exchange.getResponseHeaders().set("X-Response-Message", response.toString());
+            exchange.sendResponseHeaders(200, -1);
+            exchange.close();
+        }
+    }
+
+    private Path scenarioPath(String scenarioHash) {
+        if (scenarioHash == null || !SCENARIO_HASH.matcher(scenarioHash).matches()) {
+            return null;
+        }
+        return scenarioStore.resolve(scenarioHash);
+    }
+
+    private static Map<String, String> parseQuery(String query) {
+        Map<String, String> params = new HashMap<>();
+        if (query == null) {
+            return params;
+        }
+        for (String pair : query.split("&")) {
+            String[] keyValue = pair.split("=", 2);
+            params.put(
+                URLDecoder.decode(keyValue[0], StandardCharsets.UTF_8),
+                keyValue.length > 1 ? URLDecoder.decode(keyValue[1], StandardCharsets.UTF_8) : "");
+        }
+        return params;
+    }
+
+    private List<String> saveMultipartFiles(HttpExchange exchange, String contentType, Path folderPath) throws IOException {
+        String boundary = contentType.split("boundary=")[1];
+
+        // Read the request body
+        InputStream inputStream = exchange.getRequestBody();
+        ByteArrayOutputStream bodyOutput = new ByteArrayOutputStream();
+        byte[] buffer = new byte[1024];
+        int bytesRead;
+        while ((bytesRead = inputStream.read(buffer)) != -1) {
+            bodyOutput.write(buffer, 0, bytesRead);
+        }
+        byte[] body = bodyOutput.toByteArray();
+
+        // Split the body by the boundary. ISO-8859-1 maps every byte to one
+        // char, so binary parts such as .xml.gz files survive the round trip.
+        String bodyString = new String(body, StandardCharsets.ISO_8859_1);
+        String[] parts = bodyString.split(boundary);
+
+        List<String> fileNames = new ArrayList<>();
+        for (String part : parts) {
+            if (part.contains("Content-Disposition")) {
+                String[] lines = part.split("\r\n");
+                String fileName = extractFileName(lines);
+                if (fileName != null) {
+                    byte[] fileContent = extractFileContent(part);
+                    saveFile(folderPath, fileName, fileContent);
+                    fileNames.add(fileName);
+                }
+            }
+        }
+        return fileNames;
+    }
+
     private void saveFile(Path folderPath, String fileName, byte[] fileContent) throws IOException {
         try (FileOutputStream fileOutput = new FileOutputStream(folderPath + "/" + fileName)) {
             fileOutput.write(fileContent);
@@ -413,7 +519,7 @@ public class OCPRewardServer {
     private byte[] extractFileContent(String part) {
         int startIndex = part.indexOf("\r\n\r\n") + 4;
         int endIndex = part.lastIndexOf("\r\n--");
-        return part.substring(startIndex, endIndex).getBytes(StandardCharsets.UTF_8);
+        return part.substring(startIndex, endIndex).getBytes(StandardCharsets.ISO_8859_1);
     }
 
     private static class RequestData {
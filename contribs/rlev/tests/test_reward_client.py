@@ -0,0 +1,215 @@
+import asyncio
+import io
+import json
+import shutil
+import zipfile
+from pathlib import Path
+from types import SimpleNamespace
+import numpy as np
+import pytest
+import requests
+from rlev.classes.async_reward_client import AsyncRewardClient
+from rlev.classes.chargers import DynamicCharger, NoneCharger, StaticCharger
+from rlev.classes.reward_cache import RewardCache
+from rlev.classes.reward_client import (
+    RewardClient,
+    UnknownScenarioError,
+    parse_rewards,
+)
+from rlev.scripts.reward_stub_server import (
+    StubRewardHandler,
+    StubRewardServer,
+    parse_chargers,
+    synthetic_rewards,
+)
+
+CHARGERS_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<chargers>
+<charger id="0" link="10" plug_power="100.0" plug_count="1" type="default" />
+<charger id="1" link="11" plug_power="100.0" plug_count="1" type="dynamic" />
+</chargers>
+"""
+
+
+@pytest.fixture
+def server():
+    server = StubRewardServer()
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def scenario(tmp_path):
+    files = dict(
+        network=Path(tmp_path, "network.xml"),
+        plans=Path(tmp_path, "plans.xml"),
+    )
+    files["network"].write_bytes(b"<network>\xc3\xa9\xff</network>")
+    files["plans"].write_bytes(b"<plans>" + bytes(range(256)) + b"</plans>")
+    config = Path(tmp_path, "config.xml")
+    config.write_bytes(b"<config />")
+    chargers = Path(tmp_path, "chargers.xml")
+    chargers.write_bytes(CHARGERS_XML)
+    return files, dict(config=config, chargers=chargers)
+
+
+def expected_rewards():
+    return parse_rewards(synthetic_rewards(parse_chargers(CHARGERS_XML)))
+
+
+def test_upload_scenario_stores_files(server, scenario):
+    static_files, _ = scenario
+    with RewardClient(server.url) as client:
+        scenario_hash = client.register_scenario(static_files)
+        client.upload_scenario(scenario_hash)
+
+    stored = server.scenario_path(scenario_hash)
+    assert server.requests["/uploadScenario"] == 1
+    for path in static_files.values():
+        # Binary contents survive the multipart upload unchanged
+        assert Path(stored, path.name).read_bytes() == path.read_bytes()
+
+
+def test_register_scenario_hashes_contents(scenario):
+    static_files, _ = scenario
+    client = RewardClient("http://localhost:1")
+    scenario_hash = client.register_scenario(static_files)
+    assert client.register_scenario(dict(static_files)) == scenario_hash
+
+    static_files["plans"].write_bytes(b"<plans />")
+    assert client.register_scenario(static_files) != scenario_hash
+
+
+def test_get_reward_round_trip(server, scenario):
+    _, step_files = scenario
+    with RewardClient(server.url) as client:
+        response = client.get_reward(step_files)
+        message = json.loads(response.headers["X-Response-Message"])
+        again = client.get_reward(step_files)
+
+    assert parse_rewards(message) == expected_rewards()
+    assert message["filetype"] == "initialoutput"
+    assert json.loads(again.headers["X-Response-Message"])["filetype"] == "output"
+    with zipfile.ZipFile(io.BytesIO(response.content)) as output:
+        assert json.loads(output.read("output/rewards.json")) == message
+
+
+def test_get_reward_uploads_unknown_scenario_and_retries(server, scenario):
+    static_files, step_files = scenario
+    with RewardClient(server.url) as client:
+        scenario_hash = client.register_scenario(static_files)
+        response = client.get_reward(step_files, scenario_hash=scenario_hash)
+        assert server.requests["/getReward"] == 2
+        assert server.requests["/uploadScenario"] == 1
+
+        # The scenario is only sent again once the server lost it
+        client.get_reward(step_files, scenario_hash=scenario_hash)
+        assert server.requests["/uploadScenario"] == 1
+        shutil.rmtree(server.scenario_path(scenario_hash))
+        again = client.get_reward(step_files, scenario_hash=scenario_hash)
+
+    assert server.requests["/getReward"] == 5
+    assert server.requests["/uploadScenario"] == 2
+    for reward_response in (response, again):
+        message = json.loads(reward_response.headers["X-Response-Message"])
+        assert parse_rewards(message) == expected_rewards()
+
+
+def test_get_reward_raises_when_upload_does_not_stick(server, scenario, monkeypatch):
+    static_files, step_files = scenario
+
+    def forget(handler, scenario_hash, files):
+        handler._send(200, dict(scenario_hash=scenario_hash))
+
+    monkeypatch.setattr(StubRewardHandler, "_upload_scenario", forget)
+    with RewardClient(server.url) as client:
+        scenario_hash = client.register_scenario(static_files)
+        with pytest.raises(UnknownScenarioError):
+            client.get_reward(step_files, scenario_hash=scenario_hash)
+    assert server.requests["/uploadScenario"] == 1
+
+
+def test_async_get_reward_uploads_unknown_scenario_and_retries(server, scenario):
+    static_files, step_files = scenario
+
+    async def request_rewards():
+        async with AsyncRewardClient(server.url) as client:
+            scenario_hash = client.register_scenario(static_files)
+            responses = await asyncio.gather(
+                *[
+                    client.get_reward(step_files, scenario_hash=scenario_hash)
+                    for _ in range(4)
+                ]
+            )
+            messages = [
+                json.loads(response.headers["X-Response-Message"])
+                for response in responses
+            ]
+            bodies = [await response.read() for response in responses]
+            return messages, bodies
+
+    messages, bodies = asyncio.run(request_rewards())
+    # Concurrent requests that find the scenario missing share one upload
+    assert server.requests["/uploadScenario"] == 1
+    for message, body in zip(messages, bodies):
+        assert parse_rewards(message) == expected_rewards()
+        with zipfile.ZipFile(io.BytesIO(body)) as output:
+            assert json.loads(output.read("output/rewards.json")) == message
+
+
+class BatchDataset:
+    """
+    Stands in for the parts of MatsimXMLDataset that evaluate_batch uses.
+    """
+
+    def __init__(self, static_files, step_files):
+        self.static_files = static_files
+        self.config_path = step_files["config"]
+        self.charger_xml_path = step_files["chargers"]
+        self.charger_list = [NoneCharger, DynamicCharger, StaticCharger]
+        self.edge_mapping = SimpleNamespace(inverse=np.array(["10", "11", "12"]))
+
+    def scenario_files(self):
+        return self.static_files
+
+    def link_actions(self, actions):
+        return np.asarray(actions)
+
+    def compute_charger_cost(self, actions):
+        return float(np.count_nonzero(actions))
+
+
+def test_evaluate_batch_caches_successes_before_raising(
+    server, scenario, tmp_path, monkeypatch
+):
+    dataset = BatchDataset(*scenario)
+    placements = [[1, 0, 0], [0, 2, 0], [0, 0, 1], [1, 0, 0]]
+    original = StubRewardHandler._get_reward
+
+    def reject_link_12(handler, scenario_hash, files):
+        chargers = next(
+            content for name, content in files.items() if "charger" in name
+        )
+        if any(charger["link"] == "12" for charger in parse_chargers(chargers)):
+            handler._send(400, dict(error="bad_request"))
+            return
+        original(handler, scenario_hash, files)
+
+    reward_cache = RewardCache(Path(tmp_path, "rewards.sqlite"))
+    with RewardClient(server.url) as client:
+        monkeypatch.setattr(StubRewardHandler, "_get_reward", reject_link_12)
+        with pytest.raises(requests.HTTPError):
+            client.evaluate_batch(placements, dataset, reward_cache, retries=0)
+        assert len(reward_cache) == 2
+
+        monkeypatch.setattr(StubRewardHandler, "_get_reward", original)
+        num_requests = server.requests["/getReward"]
+        results = client.evaluate_batch(placements, dataset, reward_cache)
+    reward_cache.close()
+
+    # Only the placement that failed is simulated again
+    assert server.requests["/getReward"] == num_requests + 1
+    assert results[0] == results[3]
+    assert [result["charger_cost"] for result in results] == [1.0, 1.0, 1.0, 1.0]